@@ -0,0 +1,4 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""benchmarks for lapis on generated pelican sites, see benchmarks/README.md"""
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""times lapis on generated sites and writes the results as json.
+
+    python -m benchmarks.run --sizes 1000 10000 --output results.json
+    python -m benchmarks.run --sizes 1000 --compare results.json
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_VERSION = 1
+
+# the searches timed on every site, by scenario name
+FIND_SCENARIOS = (
+    ("find_all", {}),
+    ("find_page", {"limit": 20}),
+    ("find_title", {"title": "lorem ipsum"}),
+    ("find_title_short", {"title": "el"}),
+    ("find_tag", {"tags": ["tag1"]}),
+    ("find_tags_all", {"tags": ["tag1", "tag2"]}),
+    ("find_tags_any", {"any_tags": ["tag1", "tag2", "tag3"]}),
+    ("find_category", {"category": "category1"}),
+    ("find_author", {"author": "Author 1"}),
+    ("find_status", {"status": "draft"}),
+    ("find_dates", {"dates": (datetime(2008, 1, 1), datetime(2008, 12, 31))}),
+    ("find_combined", {"content_type": "article", "status": "published", "category": "category1", "tags": ["tag1"]}),
+    ("find_text", {"text": "heron marsh"}),
+)
+
+
+def timed(func, repeat=3, setup=None):
+    """calls func repeat times, returns the seconds each call took
+
+    :param setup callable: called before each call, not timed
+    """
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_cli(*argv):
+    code = "import sys; sys.argv = ['lapis'] + {!r}; from lapis.command import main; main()".format(list(argv))
+    subprocess.check_call([sys.executable, "-c", code], cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def benchmark_site(pelican_config, repeat=3, jobs=1):
+    """times every scenario on the site, yields (scenario, seconds)"""
+    from pelican.settings import read_settings
+    from lapis.store import Store
+    from lapis.models import Tag
+
+    settings = read_settings(pelican_config, override={"SITEURL": os.path.dirname(pelican_config)})
+    db_path = os.path.join(settings['PATH'], ".lapisdb")
+    state = {}
+
+    def remove_db():
+        state.pop("store", None)
+        for path in (db_path, db_path + ".postings"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def cold_sync():
+        state["store"] = Store(db_path)
+        state["store"].sync(settings, jobs=jobs)
+    yield "cold_sync", timed(cold_sync, repeat, setup=remove_db)
+
+    store = state["store"]
+    yield "noop_sync", timed(lambda: store.sync(settings, jobs=jobs), repeat)
+    yield "store_open", timed(lambda: Store(db_path), repeat)
+
+    source_path = next(store.search(content_type="article", limit=1, projection=True)).source_path
+    with open(source_path, "r", encoding="utf-8") as f:
+        original = f.read()
+
+    def touch():
+        with open(source_path, "a", encoding="utf-8") as f:
+            f.write("\nmore\n")
+    yield "sync_file", timed(lambda: store.sync_file(settings, source_path, "article"), repeat, setup=touch)
+    yield "incremental_sync", timed(lambda: store.sync(settings, jobs=jobs), repeat, setup=touch)
+
+    def write():
+        touch()
+        store.sync_file(settings, source_path, "article")
+
+    # the first search after a write rebuilds the posting lists
+    yield "find_tag_after_write", timed(lambda: list(store.search(tags=["tag1"], projection=True)), repeat, setup=write)
+
+    # keeps the site as generated for the next run
+    with open(source_path, "w", encoding="utf-8") as f:
+        f.write(original)
+    store.sync_file(settings, source_path, "article")
+    for scenario, kwargs in FIND_SCENARIOS:
+        if "text" in kwargs and not store.full_text:
+            continue
+        yield scenario, timed(lambda: list(store.search(projection=True, **kwargs)), repeat)
+    yield "tags_counts", timed(lambda: list(store.counts("", order_by="content", cls=Tag)), repeat)
+
+    lapis_config = os.path.join(os.path.dirname(pelican_config), "lapis.yml")
+    yield "cli_version", timed(lambda: run_cli("--version"), repeat)
+    yield "cli_find", timed(lambda: run_cli("--pelican_config", pelican_config, "--lapis_config", lapis_config, "--no-daemon", "find", "article", "-n", "20"), repeat)
+    yield "cli_tags", timed(lambda: run_cli("--pelican_config", pelican_config, "--lapis_config", lapis_config, "--no-daemon", "tags", "-c"), repeat)
+
+
+def summarize(seconds):
+    return {"seconds": seconds, "min": min(seconds), "median": statistics.median(seconds)}
+
+
+def compare(results, baseline, stream=sys.stderr):
+    """prints the median of each scenario next to the one in the baseline results"""
+    medians = {(r["articles"], r["scenario"]): r["median"] for r in baseline["results"]}
+    print("{:>8} {:<22} {:>10} {:>10} {:>7}".format("articles", "scenario", "baseline", "current", "ratio"), file=stream)
+    for result in results["results"]:
+        old = medians.get((result["articles"], result["scenario"]), None)
+        ratio = "{:.2f}".format(result["median"] / old) if old else "-"
+        old = "{:.4f}".format(old) if old is not None else "-"
+        print("{:>8} {:<22} {:>10} {:>10.4f} {:>7}".format(result["articles"], result["scenario"], old, result["median"], ratio), file=stream)
+
+
+def main():
+    parser = ArgumentParser(description="times lapis on generated pelican sites")
+    parser.add_argument("--sizes", default=[1000], type=int, nargs="+", help="numbers of articles of the generated sites (default: %(default)s)")
+    parser.add_argument("--repeat", default=3, type=int, help="times each scenario is run (default: %(default)s)")
+    parser.add_argument("--jobs", default=1, type=int, help="processes used to read content during a sync (default: %(default)s)")
+    parser.add_argument("--tags", default=None, type=int, help="number of distinct tags (default: a fifth of the articles)")
+    parser.add_argument("--categories", default=20, type=int, help="number of distinct categories (default: %(default)s)")
+    parser.add_argument("--body-words", default=200, type=int, help="number of words in each article (default: %(default)s)")
+    parser.add_argument("--sites", default=None, help="directory where generated sites are kept between runs (default: a temporary directory)")
+    parser.add_argument("-o", "--output", default=None, help="file the json results are written to (default: stdout)")
+    parser.add_argument("--compare", default=None, help="json results of a previous run to compare with")
+    args = parser.parse_args()
+
+    from benchmarks.sitegen import generate_site
+    from lapis.version import version
+
+    sites = args.sites or tempfile.mkdtemp(prefix="lapis-bench-")
+    results = {"version": RESULTS_VERSION,
+               "lapis_version": version,
+               "commit": git_commit(),
+               "python": platform.python_version(),
+               "platform": platform.platform(),
+               "date": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+               "parameters": {"repeat": args.repeat, "jobs": args.jobs, "tags": args.tags, "categories": args.categories, "body_words": args.body_words},
+               "results": []}
+    try:
+        for size in args.sizes:
+            tags = args.tags or max(10, size // 5)
+            site_path = os.path.join(sites, "site-{}-{}-{}-{}".format(size, tags, args.categories, args.body_words))
+            pelican_config = os.path.join(site_path, "pelicanconf.py")
+            if not os.path.exists(pelican_config):
+                sys.stderr.write("generating a site with {} articles in {}\n".format(size, site_path))
+                pelican_config = generate_site(site_path, articles=size, tags=tags, categories=args.categories, body_words=args.body_words)
+            for scenario, seconds in benchmark_site(pelican_config, repeat=args.repeat, jobs=args.jobs):
+                result = dict(articles=size, scenario=scenario, **summarize(seconds))
+                sys.stderr.write("{:>8} {:<22} {:.4f}s\n".format(size, scenario, result["median"]))
+                results["results"].append(result)
+    finally:
+        if args.sites is None:
+            shutil.rmtree(sites)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""generates reproducible pelican sites of any size for the benchmarks.
+
+the same arguments always generate the same files, so results measured on
+different commits or machines are comparable.
+"""
+
+from argparse import ArgumentParser
+import os
+import random
+from datetime import datetime, timedelta
+
+
+PELICANCONF = '''#!/usr/bin/env python
+# -*- coding: utf-8 -*- #
+"""pelican settings of a site generated by benchmarks.sitegen"""
+
+AUTHOR = 'Author 0'
+SITENAME = 'Benchmark Site'
+SITEURL = ''
+PATH = 'content/'
+TIMEZONE = 'UTC'
+DEFAULT_LANG = 'en'
+FEED_ALL_ATOM = None
+CATEGORY_FEED_ATOM = None
+TRANSLATION_FEED_ATOM = None
+STATIC_PATHS = []
+'''
+
+# words the titles and bodies are made of, including some non-ascii ones
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do",
+         "eiusmod", "tempor", "incididunt", "labore", "dolore", "magna", "aliqua", "enim", "minim",
+         "veniam", "quis", "nostrud", "exercitation", "ullamco", "laboris", "nisi", "aliquip", "commodo",
+         "consequat", "duis", "aute", "irure", "reprehenderit", "voluptate", "velit", "esse", "cillum",
+         "fugiat", "nulla", "pariatur", "excepteur", "sint", "occaecat", "cupidatat", "proident", "sunt",
+         "culpa", "officia", "deserunt", "mollit", "anim", "laborum", "crane", "heron", "marsh", "shore",
+         "café", "straße", "élan", "naïve", "façade", "über")
+
+STATUSES = ("published", "published", "published", "published", "draft", "hidden")
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def generate_site(path, articles=1000, pages=None, tags=200, categories=20, authors=10, tags_per_article=3, body_words=200, seed=0):
+    """writes a pelican site with markdown articles and pages to path
+
+    :param path str: directory of the site, created if it does not exist
+    :param articles int: number of articles
+    :param pages int: number of pages, by default one for every hundred articles
+    :param tags int: number of distinct tags
+    :param categories int: number of distinct categories
+    :param authors int: number of distinct authors
+    :param tags_per_article int: number of tags of each article
+    :param body_words int: number of words in the body of each article
+    :param seed int: seed of the random generator
+    :rtype str: path to the pelicanconf.py of the site
+    """
+    rng = random.Random(seed)
+    if pages is None:
+        pages = max(1, articles // 100)
+    content_path = os.path.join(path, "content")
+    os.makedirs(os.path.join(content_path, "pages"), exist_ok=True)
+    pelican_config = os.path.join(path, "pelicanconf.py")
+    with open(pelican_config, "w", encoding="utf-8") as f:
+        f.write(PELICANCONF)
+
+    start = datetime(2005, 1, 1)
+    for i in range(articles):
+        date = start + timedelta(minutes=rng.randrange(0, 60 * 24 * 365 * 10))
+        directory = os.path.join(content_path, "posts", str(date.year), "{:02d}".format(date.month))
+        os.makedirs(directory, exist_ok=True)
+        article_tags = sorted(set("tag{}".format(rng.randrange(tags)) for _ in range(tags_per_article)))
+        header = ["Title: {} {}".format(sentence(rng, rng.randint(2, 6))[:-1], i),
+                  "Date: {}".format(date.strftime("%Y-%m-%d %H:%M")),
+                  "Tags: {}".format(", ".join(article_tags)),
+                  "Category: category{}".format(rng.randrange(categories)),
+                  "Author: Author {}".format(rng.randrange(authors)),
+                  "Slug: article-{}".format(i),
+                  "Status: {}".format(rng.choice(STATUSES)),
+                  "Summary: {}".format(sentence(rng, 12))]
+        body = []
+        remaining = body_words
+        while remaining > 0:
+            words = min(remaining, rng.randint(40, 120))
+            body.append(" ".join(sentence(rng, 10) for _ in range(max(1, words // 10))))
+            remaining -= words
+        with open(os.path.join(directory, "article-{}.md".format(i)), "w", encoding="utf-8") as f:
+            f.write("\n".join(header) + "\n\n" + "\n\n".join(body) + "\n")
+
+    for i in range(pages):
+        with open(os.path.join(content_path, "pages", "page-{}.md".format(i)), "w", encoding="utf-8") as f:
+            f.write("Title: Page {}\nDate: 2010-01-01 10:00\nSlug: page-{}\n\n{}\n".format(i, i, sentence(rng, body_words)))
+    return pelican_config
+
+
+def main():
+    parser = ArgumentParser(description="generates a pelican site for benchmarking lapis")
+    parser.add_argument("path", help="directory of the generated site")
+    parser.add_argument("-n", "--articles", default=1000, type=int, help="number of articles (default: %(default)s)")
+    parser.add_argument("--tags", default=200, type=int, help="number of distinct tags (default: %(default)s)")
+    parser.add_argument("--categories", default=20, type=int, help="number of distinct categories (default: %(default)s)")
+    parser.add_argument("--authors", default=10, type=int, help="number of distinct authors (default: %(default)s)")
+    parser.add_argument("--tags-per-article", default=3, type=int, help="number of tags of each article (default: %(default)s)")
+    parser.add_argument("--body-words", default=200, type=int, help="number of words in each article (default: %(default)s)")
+    parser.add_argument("--seed", default=0, type=int, help="seed of the random generator (default: %(default)s)")
+    args = parser.parse_args()
+    generate_site(args.path, articles=args.articles, tags=args.tags, categories=args.categories, authors=args.authors,
+                  tags_per_article=args.tags_per_article, body_words=args.body_words, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
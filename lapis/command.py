@@ -1,23 +1,32 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-"""Entry point for the command line interface to Lapis"""
+"""Entry point for the command line interface to Lapis
+
+this module is imported every time lapis runs, so pelican, sqlalchemy and the
+modules built on them are only imported by the commands that need them.
+"""
 
 from argparse import ArgumentParser
 from datetime import datetime
-from lapis.config import Config
-from lapis.store import Store
 from lapis.version import version
 import logging
 import os
 import sys
+import time
 
 
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT = "%(levelname)s %(asctime)s: %(message)s"
+
 
 class Command(object):
     """Base class used for grouping commands and their function"""
+    # whether a running lapis daemon may run the command for the client
+    __daemon__ = False
+    # whether the command needs the pelican site and the lapis store
+    __site__ = True
 
     def __init__(self, *args, **kwargs):
         """not intended to be implemented by child classes"""
@@ -33,9 +42,14 @@ class Command(object):
         cls.args(parser)
 
         # sets the default function to invoke
-        parser.set_defaults(func=cls.run)
+        parser.set_defaults(func=cls.run, command_cls=cls)
         cls._parser = parser
 
+    @classmethod
+    def can_forward(cls, args):
+        """returns true if a lapis daemon may run the command with the parsed args"""
+        return cls.__daemon__
+
     @staticmethod
     def args(parser):
         """adds the arguments to the parser that should be invoked when the command is created, overrides should be staticmethods"""
@@ -50,6 +64,7 @@ class Command(object):
 class NewConfigCommand(Command):
     __command__ = "newconfig"
     __help__ = "generates a new configuration file for the user"
+    __site__ = False
 
     @staticmethod
     def args(parser):
@@ -58,15 +73,57 @@ class NewConfigCommand(Command):
     @staticmethod
     def run(*args, **kwargs):
         import shutil
-        config = kwargs["config"]
+        from lapis.config import EXAMPLE_LAPIS_CONFIGURATION_FILE
         dst = kwargs.get("location", None)
-        shutil.copyfile(config.example_lapis_configuration_file, dst, follow_symlinks=True)
+        shutil.copyfile(EXAMPLE_LAPIS_CONFIGURATION_FILE, dst, follow_symlinks=True)
         print("Your new lapis configuration file can be found at: {}".format(dst))
 
 
+def sync_options(config, kwargs):
+    """returns the jobs and git arguments of Store.sync for the --jobs and
+    --git arguments, which default to the sync options of the lapis config"""
+    jobs = kwargs.get("jobs", None)
+    git = kwargs.get("git", None)
+    return dict(jobs=config.sync_jobs if jobs is None else jobs,
+                git=config.sync_git if git is None else git)
+
+
+def parse_dates(kwargs):
+    """returns the dates filter of Store.search for the --after, --before and
+    --on arguments, exits when they are invalid"""
+    try:
+        fmt = "%Y-%m-%d"
+
+        def parsed_date(s):
+            if s in kwargs and kwargs[s]:
+                return datetime.strptime(kwargs[s], fmt)
+            return None
+        after_date = parsed_date("after")
+        before_date = parsed_date("before")
+        on_date = parsed_date("on")
+    except ValueError:
+        logger.error("invalid date format, must specify {}".format(fmt))
+        sys.exit(1)
+    else:
+        if on_date and (after_date or before_date):
+            logger.error("must specify either --on or (--before, --after) but not both.")
+            sys.exit(1)
+        elif after_date and before_date and after_date > before_date:
+            logger.error("value specified for --after should come prior to value in --before")
+            sys.exit(1)
+
+    return (after_date, before_date) if not on_date else (on_date,)
+
+
 class FindCommand(Command):
     __command__ = "find"
     __help__ = "finds articles, posts or other content"
+    __daemon__ = True
+
+    @classmethod
+    def can_forward(cls, args):
+        # editing and deleting interact with the terminal of the client
+        return getattr(args, "edit", None) is None and getattr(args, "delete", None) is None
 
     @staticmethod
     def args(parser):
@@ -74,11 +131,18 @@ class FindCommand(Command):
         parser.add_argument("title", nargs="?", default=None, type=str, help="case-insensitive search by the title")
         parser.add_argument("-s", "--status", default=None, choices=("published", "hidden", "draft"), help="The status that the content must have.")
         parser.add_argument("-t", "--tags", default=[], action="append", help="List of tags which the content must contain.")
+        parser.add_argument("-T", "--any-tags", dest="any_tags", default=[], action="append", help="List of tags of which the content must contain at least one.")
         parser.add_argument("-c", "--category", default=None, type=str, help="The category that the content must have")
         parser.add_argument("-w", "--author", default=None, type=str, help="The author that the content must have")
         parser.add_argument("-b", "--before", default=None, type=str, help="created before the the given date (format: YYYY-MM-DD)")
         parser.add_argument("-a", "--after", default=None, type=str, help="created after the the given date (format: YYYY-MM-DD)")
         parser.add_argument("-d", "--on", default=None, type=str, help="created on the the given date (format: YYYY-MM-DD)")
+        parser.add_argument("-x", "--text", default=None, type=str, help="words that must appear in the title, summary or body, ordered by relevance")
+        parser.add_argument("--sort", default=None, choices=("date", "modified", "title"), help="Orders by date created, date modified or title (default: date, or relevance with --text)")
+        parser.add_argument("-n", "--limit", default=None, type=int, help="Lists at most this many results.")
+        parser.add_argument("--offset", default=0, type=int, help="Skips this many results.")
+        parser.add_argument("--cursor", default=None, type=str, help="Lists the results following a previous page, as printed when a page is full.")
+        parser.add_argument("--explain", default=False, action="store_true", help="Prints the sql of the search, the plan sqlite uses for it and how long it takes instead of the results.")
         parser.add_argument("-e", "--edit", default=None, type=int, help="Edits the Nth (1-len(content)) found content.")
         parser.add_argument("-p", "--path", default=None, type=int, help="Prints the source path of the Nth (1-len(content)) found content.")
         parser.add_argument("--delete", default=None, type=int, help="Deletes the content located at the given source path.")
@@ -89,37 +153,45 @@ class FindCommand(Command):
         author = kwargs.get("author", None)
         category = kwargs.get("category", None)
         tags = kwargs.get("tags", [])
+        any_tags = kwargs.get("any_tags", [])
         title = kwargs.get("title", "")
         status = kwargs.get("status", None)
         edit_num = kwargs.get("edit", None)
         path_num = kwargs.get("path", None)
         delete_num = kwargs.get("delete", None)
-
-        try:
-            fmt = "%Y-%m-%d"
-
-            def parsed_date(s):
-                if s in kwargs and kwargs[s]:
-                    return datetime.strptime(kwargs[s], fmt)
-                return None
-            after_date = parsed_date("after")
-            before_date = parsed_date("before")
-            on_date = parsed_date("on")
-        except ValueError:
-            logger.error("invalid date format, must specify {}".format(fmt))
-            sys.exit(1)
-        else:
-            if on_date and (after_date or before_date):
-                logger.error("must specify either --on or (--before, --after) but not both.")
-                sys.exit(1)
-            elif after_date and before_date and after_date > before_date:
-                logger.error("value specified for --after should come prior to value in --before")
-                sys.exit(1)
-
-        dates = (after_date, before_date) if not on_date else (on_date,)
+        text = kwargs.get("text", None)
+        dates = parse_dates(kwargs)
         logger.info("finding content that matches the criteria")
         content_type = kwargs["content_type"]
-        content_list = list(config.store.search(author=author, status=status, title=title, category=category, tags=tags, content_type=content_type, dates=dates))
+        sort = kwargs.get("sort", None)
+        limit = kwargs.get("limit", None)
+        offset = kwargs.get("offset", None) or 0
+        cursor = kwargs.get("cursor", None)
+        show_snippets = bool(text)
+
+        def search(**page):
+            """returns the matching content, read lazily as it is consumed"""
+            results = config.store.search(author=author, status=status, title=title, category=category, tags=tags, any_tags=any_tags, content_type=content_type,
+                                          dates=dates, text=text, sort=sort, cursor=cursor, projection=True, **page)
+            try:
+                first = next(results, None)
+            except (RuntimeError, ValueError) as e:
+                logger.error(e)
+                sys.exit(1)
+            if first is not None:
+                yield first
+                for content in results:
+                    yield content
+
+        if kwargs.get("explain", False):
+            try:
+                plan = config.store.explain(author=author, status=status, title=title, category=category, tags=tags, any_tags=any_tags, content_type=content_type,
+                                            dates=dates, text=text, sort=sort, cursor=cursor, projection=True, offset=offset, limit=limit)
+            except (RuntimeError, ValueError) as e:
+                logger.error(e)
+                sys.exit(1)
+            config.printer.print_query_plan(plan)
+            return
 
         def edit_action(content):
             config.editor.open(content.source_path)
@@ -134,7 +206,7 @@ class FindCommand(Command):
                 choice = sys.stdin.readline().strip()
                 if choice == "y":
                     os.remove(content.source_path)
-                    config.store.purge()
+                    config.store.remove([content.source_path])
                     config.printer.print_delete_acknowledgement(content)
                     break
                 elif choice == "n":
@@ -153,24 +225,73 @@ class FindCommand(Command):
             content_num = delete_num
 
         if priority_action:
-            valid_range = list(range(len(content_list)))
-            if content_num-1 in valid_range:
-                content = content_list[content_num-1]
+            # only the Nth content is read, the others only when N is out of range
+            content = None
+            if content_num >= 1 and (limit is None or content_num <= limit):
+                content = next(search(offset=offset + content_num - 1, limit=1), None)
+            if content is not None:
                 if os.path.exists(content.source_path):
                     priority_action(content)
                 else:
                     sys.stderr.write("It appears as though you manually removed the file at {}.\nRun 'lapis sync' to purge it and search again.\n".format(content.source_path))
                     sys.exit(1)
             else:
-                if len(valid_range) == 1:
+                content_list = list(search(offset=offset, limit=limit))
+                if not content_list:
+                    sys.stderr.write("No content was found.\n")
+                    sys.exit(1)
+                if len(content_list) == 1:
                     range_str = "1"
                 else:
-                    range_str = "1-{}".format(valid_range[-1] + 1)
-                config.printer.print_content(content_list)
+                    range_str = "1-{}".format(len(content_list))
+                config.printer.print_content(content_list, snippets=show_snippets, start=offset + 1)
                 sys.stderr.write("{} is not in the range of available items found. Re-run with {}\n".format(content_num, range_str))
                 sys.exit(1)
         else:
-            config.printer.print_content(content_list)
+            last = []
+
+            def remember(results):
+                for content in results:
+                    last[:] = [content]
+                    yield content
+            count = config.printer.print_content(remember(search(offset=offset, limit=limit)), snippets=show_snippets, start=offset + 1)
+            if limit is not None and count == limit:
+                if text and sort is None:
+                    sys.stderr.write("There may be more results. Re-run with --offset {}\n".format(offset + count))
+                else:
+                    from lapis.store import cursor_for
+                    sys.stderr.write("There may be more results. Re-run with --cursor {}\n".format(cursor_for(last[0], sort or "date")))
+
+
+class ArchiveCommand(Command):
+    __command__ = "archive"
+    __help__ = "counts the content created in each month or year"
+    __daemon__ = True
+
+    @staticmethod
+    def args(parser):
+        parser.add_argument("content_type", nargs="?", default=None, choices=("page", "article", ), type=str, help="the content type that should be counted (default: both)")
+        parser.add_argument("-s", "--status", default=None, choices=("published", "hidden", "draft"), help="The status that the content must have.")
+        parser.add_argument("-t", "--tags", default=[], action="append", help="List of tags which the content must contain.")
+        parser.add_argument("-T", "--any-tags", dest="any_tags", default=[], action="append", help="List of tags of which the content must contain at least one.")
+        parser.add_argument("-c", "--category", default=None, type=str, help="The category that the content must have")
+        parser.add_argument("-w", "--author", default=None, type=str, help="The author that the content must have")
+        parser.add_argument("-b", "--before", default=None, type=str, help="created before the the given date (format: YYYY-MM-DD)")
+        parser.add_argument("-a", "--after", default=None, type=str, help="created after the the given date (format: YYYY-MM-DD)")
+        parser.add_argument("-y", "--years", default=False, action="store_true", help="Counts by year instead of by month.")
+
+    @staticmethod
+    def run(*args, **kwargs):
+        config = kwargs["config"]
+        counts = config.store.archive(by="year" if kwargs.get("years", False) else "month",
+                                      content_type=kwargs.get("content_type", None),
+                                      status=kwargs.get("status", None),
+                                      tags=kwargs.get("tags", []),
+                                      any_tags=kwargs.get("any_tags", []),
+                                      category=kwargs.get("category", None),
+                                      author=kwargs.get("author", None),
+                                      dates=parse_dates(kwargs))
+        config.printer.print_archive(counts)
 
 
 class SyncCommand(Command):
@@ -179,19 +300,123 @@ class SyncCommand(Command):
 
     @staticmethod
     def args(parser):
-        pass
+        parser.add_argument("paths", nargs="*", default=[], help="Files, directories or globs to sync, only these files are read again instead of scanning the content directory.")
+        parser.add_argument("--stdin", default=False, action="store_true", help="Reads the files to sync from stdin, separated by NUL characters or newlines (e.g. git diff --name-only -z).")
+        parser.add_argument("--checksum", default=False, action="store_true", help="Compares file hashes before re-reading files whose modification time changed but whose size did not.")
+        parser.add_argument("-j", "--jobs", default=None, type=int, help="Number of processes used to read content, 0 uses every cpu (default: sync > jobs in the lapis config)")
+        parser.add_argument("--git", default=None, action="store_true", help="Asks git which files changed since the last sync instead of scanning the content directory (default: sync > git in the lapis config)")
+        parser.add_argument("--no-git", dest="git", action="store_false", help="Scans the content directory even when sync > git is enabled.")
+
+    @staticmethod
+    def paths(patterns, stdin=None):
+        """expands the globs in patterns and appends the paths read from stdin
+
+        a pattern without glob characters is kept as is, so files which were
+        deleted are removed from the store.
+
+        :param patterns list: paths or globs
+        :param stdin file: file the paths are read from, separated by NUL characters or newlines
+        :rtype list: the paths
+        """
+        import glob
+        paths = []
+        for pattern in patterns:
+            if not glob.has_magic(pattern):
+                paths.append(pattern)
+                continue
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                logger.warning("no file matches {}".format(pattern))
+            paths.extend(matches)
+        if stdin is not None:
+            data = stdin.read()
+            separator = "\0" if "\0" in data else "\n"
+            paths.extend(path for path in data.split(separator) if path.strip())
+        return paths
 
     @staticmethod
     def run(*args, **kwargs):
         config = kwargs["config"]
-        logger.info("syncing with local content directory")
-        updated = config.store.sync(config.settings)
+        checksum = kwargs.get("checksum", False)
+        options = sync_options(config, kwargs)
+        patterns = kwargs.get("paths", None) or []
+        if patterns or kwargs.get("stdin", False):
+            paths = SyncCommand.paths(patterns, sys.stdin if kwargs.get("stdin", False) else None)
+            logger.info("syncing {} files".format(len(paths)))
+            updated = config.store.sync_files(config.settings, paths, jobs=options["jobs"])
+        else:
+            logger.info("syncing with local content directory")
+            updated = config.store.sync(config.settings, checksum=checksum, **options)
         if updated:
             logger.info("updated metadata for files")
         else:
             logger.info("no change in content -- metadata was not updated")
 
 
+class WatchCommand(Command):
+    __command__ = "watch"
+    __help__ = "keeps the local lapis store in sync as files in the content directory change"
+
+    @staticmethod
+    def args(parser):
+        parser.add_argument("--poll", default=False, action="store_true", help="Polls the content directory instead of using inotify.")
+        parser.add_argument("--interval", default=1.0, type=float, help="Seconds between each scan when polling (default: %(default)s)")
+        parser.add_argument("--debounce", default=0.5, type=float, help="Seconds without changes before changes are applied (default: %(default)s)")
+
+    @staticmethod
+    def run(*args, **kwargs):
+        from lapis.watcher import IndexWatcher, PollingWatcher
+        from lapis.scanner import ContentScanner
+        config = kwargs["config"]
+        interval = kwargs.get("interval", 1.0)
+        watcher = PollingWatcher(ContentScanner(config.settings), interval=interval) if kwargs.get("poll", False) else None
+
+        options = sync_options(config, kwargs)
+        logger.info("syncing with local content directory")
+        config.store.sync(config.settings, **options)
+        index_watcher = IndexWatcher(config.store, config.settings, watcher=watcher, debounce=kwargs.get("debounce", 0.5), interval=interval, **options)
+        logger.info("watching {} for changes".format(config.content_path))
+        try:
+            index_watcher.run()
+        except KeyboardInterrupt:
+            pass
+
+
+class DaemonCommand(Command):
+    __command__ = "daemon"
+    __help__ = "keeps the site loaded and answers find, tags, authors and categories for other lapis commands"
+
+    @staticmethod
+    def args(parser):
+        parser.add_argument("--watch", default=False, action="store_true", help="Keeps the store in sync with the content directory while running.")
+        parser.add_argument("--poll", default=False, action="store_true", help="Polls the content directory instead of using inotify when watching.")
+        parser.add_argument("--interval", default=1.0, type=float, help="Seconds between each scan when polling (default: %(default)s)")
+        parser.add_argument("--debounce", default=0.5, type=float, help="Seconds without changes before changes are applied (default: %(default)s)")
+
+    @staticmethod
+    def run(*args, **kwargs):
+        import signal
+        from lapis.daemon import Daemon, socket_path
+        config = kwargs["config"]
+        index_watcher = None
+        if kwargs.get("watch", False):
+            from lapis.watcher import IndexWatcher, PollingWatcher
+            from lapis.scanner import ContentScanner
+            interval = kwargs.get("interval", 1.0)
+            watcher = PollingWatcher(ContentScanner(config.settings), interval=interval) if kwargs.get("poll", False) else None
+            options = sync_options(config, kwargs)
+            logger.info("syncing with local content directory")
+            config.store.sync(config.settings, **options)
+            index_watcher = IndexWatcher(config.store, config.settings, watcher=watcher, debounce=kwargs.get("debounce", 0.5), interval=interval, **options)
+
+        daemon = Daemon(config, socket_path(kwargs["pelican_config"]), index_watcher=index_watcher)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            daemon.serve()
+        except KeyboardInterrupt:
+            pass
+
+
 class CreateCommand(Command):
     __command__ = "create"
     __help__ = "creates a piece of content."
@@ -234,6 +459,8 @@ class CreateCommand(Command):
 
 
 class ListCommand(Command):
+    __daemon__ = True
+
     @staticmethod
     def args(parser):
         parser.add_argument("pattern", nargs="?", default="", type=str, help="regex pattern to match againt the name")
@@ -250,15 +477,7 @@ class ListCommand(Command):
         reverse = kwargs.get("reverse", False)
         show_zero = kwargs.get("show_zero", False)
         order_by = "content" if order_by_count else "name"
-        items = list(config.store.list(pattern, order_by=order_by, cls=model))
-
-        # filters out zero elements
-        if not show_zero:
-            items = [item for item in items if len(item.content)]
-
-        if reverse:
-            items.reverse()
-
+        items = config.store.counts(pattern, order_by=order_by, cls=model, show_zero=show_zero, reverse=reverse)
         config.printer.print_content_attributes(items)
 
 
@@ -293,42 +512,57 @@ class ListCategoriesCommand(ListCommand):
 
 
 sub_command_classes = (FindCommand,
+                       ArchiveCommand,
                        CreateCommand,
                        ListAuthorsCommand,
                        ListCategoriesCommand,
                        ListTagsCommand,
                        SyncCommand,
+                       WatchCommand,
+                       DaemonCommand,
                        NewConfigCommand,
                        )
 
 
-def _parse_args():
-    """parses the command arguments"""
+def _build_parser():
+    """builds the parser for the command arguments"""
     parser = ArgumentParser(prog="lapis", description="Utility for performing common pelican tasks.")
     parser.add_argument("--version", default=False, action="store_true", help="print the current version of lapis")
     parser.add_argument("-v", "--verbose", default=0, action="count", help="logging verbosity (more gives additional details)")
     parser.add_argument("--lapis_config", default=os.path.join(os.path.expanduser("~"), ".lapis.yml"), help="path to the users lapis config file (default: %(default)s)")
     parser.add_argument("--pelican_config", default=os.path.join(os.curdir, "pelicanconf.py"), help="path to the pelican configuration file used by blog (default: %(default)s)")
+    parser.add_argument("--no-daemon", dest="no_daemon", default=False, action="store_true", help="runs the command in this process even if a lapis daemon is running")
+    parser.add_argument("--profile", default=None, metavar="FILE", help="profiles the command and writes the pstats output to the file, runs the command in this process")
+    parser.add_argument("--timings", default=False, action="store_true", help="prints how long each phase of the command took to stderr, runs the command in this process")
+    parser.add_argument("--slowest", default=10, type=int, metavar="N", help="number of the slowest files printed with --timings (default: %(default)s)")
 
     # sub-commands
     subparsers = parser.add_subparsers()
     for command_cls in sub_command_classes:
         command_cls.setup(subparsers)
 
+    return parser
+
+
+def log_level(verbose):
+    """returns the logging level for the number of -v flags"""
+    if verbose == 1:
+        return logging.INFO
+    elif verbose >= 2:
+        return logging.DEBUG
+    return logging.WARNING
+
+
+def _parse_args():
+    """parses the command arguments"""
+    parser = _build_parser()
     args = parser.parse_args()
 
     if args.version:
         print(version)
         sys.exit(0)
 
-    if args.verbose == 1:
-        level = logging.INFO
-    elif args.verbose >= 2:
-        level = logging.DEBUG
-    else:
-        level = logging.WARNING
-
-    logging.basicConfig(format="%(levelname)s %(asctime)s: %(message)s", level=level)
+    logging.basicConfig(format=LOG_FORMAT, level=log_level(args.verbose))
 
     # catch-all for unset function
     args._parser = parser
@@ -342,31 +576,116 @@ def invalid_command(args):
     args._parser.error("Must select a valid lapis command.")
 
 
+def print_timings(collector, total, slowest=10, stream=None):
+    """prints the timings collected while a command ran
+
+    :param collector TimingCollector: the timings of the phases of the command
+    :param total float: seconds the whole command took
+    :param slowest int: number of the slowest files to print
+    """
+    stream = stream or sys.stderr
+    stream.write("{:<12} {:>7} {:>10}\n".format("phase", "calls", "seconds"))
+    for timing in collector.phases():
+        stream.write("{:<12} {:>7} {:>10.4f}\n".format(timing.phase, timing.calls, timing.seconds))
+    stream.write("{:<12} {:>7} {:>10.4f}\n".format("total", "", total))
+    files = collector.slowest(slowest)
+    if files:
+        stream.write("slowest files:\n")
+        for seconds, phase, source_path in files:
+            stream.write("{:>10.4f} {:<7} {}\n".format(seconds, phase, source_path))
+
+
 def main(args=None):
+    argv = None
     if args is None:
+        argv = sys.argv[1:]
         args = _parse_args()
 
+    profile = getattr(args, "profile", None)
+    timings = getattr(args, "timings", False)
+    if not profile and not timings:
+        _run(args, argv)
+        return
+
+    # instrumented commands are never forwarded, their time is spent in this process
+    start = time.perf_counter()
+    collector = None
+    if timings:
+        from lapis.store import TimingCollector
+        collector = TimingCollector().install()
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        _run(args, None)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            logger.info("wrote the profile to {}, read it with python -m pstats {}".format(profile, profile))
+        if collector is not None:
+            collector.uninstall()
+            print_timings(collector, time.perf_counter() - start, slowest=getattr(args, "slowest", 10))
+
+
+def _run(args, argv=None):
+    """runs the command of the parsed arguments
+
+    :param argv list: the command line, when given the command may be forwarded to a running daemon
+    """
+    # commands like newconfig run without loading the site
+    command_cls = getattr(args, "command_cls", None)
+    if command_cls is not None and not command_cls.__site__:
+        args.func(**args.__dict__)
+        return
+
     if not os.path.isfile(args.pelican_config):
         logger.error("Expected pelican configuration file at '{}', setup config or override with -c, --pelican_config".format(args.pelican_config))
         sys.exit(1)
 
+    # lets a running daemon answer the command without loading the site
+    if argv is not None and command_cls is not None and command_cls.can_forward(args) and not args.no_daemon:
+        from lapis.daemon import forward, socket_path
+        status = forward(socket_path(args.pelican_config), argv)
+        if status is not None:
+            sys.exit(status)
+
+    start = time.perf_counter()
+    from lapis.config import Config
+    from lapis.store import Store, record_timing, timed
+    record_timing("import", time.perf_counter() - start)
     if not hasattr(args, "config"):
-        args.config = Config(args.pelican_config, conf=args.lapis_config)
+        with timed("config"):
+            args.config = Config(args.pelican_config, conf=args.lapis_config)
     try:
         args.config.store = Store(args.config.lapis_db_path)
     except:
         args.config.store = None
 
+    # stores from older versions are migrated when they are opened, only a
+    # store that cannot be read or was written by a newer lapis is rebuilt
     if not args.config.store or args.config.store.schema_changed:
-        logger.info("migrating to new database format")
+        logger.info("rebuilding the lapis store")
         del args.config.store
         os.remove(args.config.lapis_db_path)
         args.config.store = Store(args.config.lapis_db_path)
 
+    # a sync that stopped is finished by the next lapis sync, other commands
+    # read what the store has
+    store = args.config.store
+    if args.func != SyncCommand.run and not store.created:
+        if store.interrupted:
+            logger.warning("the last sync of the lapis store was interrupted, run lapis sync to finish it")
+        elif store.syncing:
+            logger.warning("the lapis store is being synced, results may be incomplete until the sync finishes")
+
     # if we just created it, sync it, otherwise call the command
     kwargs = {key: value for key, value in args.__dict__.items()}
-    if args.config.store.created:
-        SyncCommand.run(**kwargs)
+    if store.created:
+        # a new store is filled from the whole content directory
+        SyncCommand.run(**dict(kwargs, paths=[], stdin=False))
         if args.func != SyncCommand.run:
             args.func(**kwargs)
     else:
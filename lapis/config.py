@@ -4,40 +4,131 @@
 
 import logging
 import os
-import yaml
 
 logger = logging.getLogger(__name__)
 
 from datetime import datetime
 from lapis.printer import CommandPrinter
 
+# the configuration file copied by lapis newconfig
+EXAMPLE_LAPIS_CONFIGURATION_FILE = os.path.join(os.path.dirname(__file__), "examples", "lapis.yml")
+
+# the settings read from the pelican and lapis configuration files are cached
+# in this file next to the pelican configuration, so that commands do not run
+# pelicanconf.py again until one of the files changes
+SETTINGS_CACHE_NAME = ".lapissettings"
+SETTINGS_CACHE_VERSION = 1
+
+
+def settings_cache_path(pelican_config_path):
+    """returns the path of the settings cache of the site"""
+    return os.path.join(os.path.dirname(os.path.abspath(pelican_config_path)), SETTINGS_CACHE_NAME)
+
+
+def _file_key(path):
+    """returns a value that changes whenever the file at the path is modified"""
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return (path, None)
+    return (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _settings_key(pelican_config_path, conf_filename):
+    from lapis.version import version
+    return (SETTINGS_CACHE_VERSION, version, _file_key(pelican_config_path), _file_key(conf_filename))
+
+
+def _plain(value):
+    """returns the value with the namedtuples defined by pelican, such as the
+    PaginationRule of PAGINATION_PATTERNS, replaced by plain tuples. unpickling
+    them would import pelican, which the cache is there to avoid, and lapis does
+    not use them.
+    """
+    if isinstance(value, tuple) and hasattr(value, "_fields") and type(value).__module__.split(".")[0] == "pelican":
+        return tuple(_plain(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_plain(item) for item in value) if type(value) in (list, tuple) else value
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    return value
+
+
+def _load_settings(cache_path, key):
+    """returns the (settings, lapis data) cached for the key, or None"""
+    import pickle
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError) as e:
+        logger.debug("could not load the settings cache {}: {}".format(cache_path, e))
+        return None
+    if not isinstance(cached, dict) or cached.get("key", None) != key:
+        return None
+    return cached["settings"], cached["lapis"]
+
+
+def _save_settings(cache_path, key, settings, data):
+    """writes the settings to the cache, settings which cannot be pickled are not cached"""
+    import pickle
+    tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    try:
+        payload = pickle.dumps({"key": key, "settings": _plain(settings), "lapis": data}, protocol=pickle.HIGHEST_PROTOCOL)
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, cache_path)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+        logger.debug("could not cache the settings in {}: {}".format(cache_path, e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 
 class Config(object):
     """config which encapsulates the attributes of a lapis session configuration"""
 
     def __init__(self, pelican_config_path, **kwargs):
-        from pelican.settings import read_settings
-        siteurl_override = os.path.dirname(pelican_config_path)
-        self.__settings = read_settings(pelican_config_path, override={"SITEURL": siteurl_override})
+        """
+        :param pelican_config_path str: path to the pelicanconf.py of the site
+        :param conf str: path to the lapis configuration file
+        :param cache bool: whether the settings are read from and saved to the settings cache
+        """
+        conf_filename = kwargs.get("conf", os.path.join(os.path.expanduser("~"), ".lapis.yml"))
+        cache = kwargs.get("cache", True)
+        cache_path = settings_cache_path(pelican_config_path)
+        key = _settings_key(pelican_config_path, conf_filename)
+        cached = _load_settings(cache_path, key) if cache else None
+        if cached is not None:
+            self.__settings, data = cached
+        else:
+            from pelican.settings import read_settings
+            siteurl_override = os.path.dirname(pelican_config_path)
+            self.__settings = read_settings(pelican_config_path, override={"SITEURL": siteurl_override})
+            data = self.__read_conf_data(conf_filename)
+            if cache:
+                _save_settings(cache_path, key, self.__settings, data)
 
         # parse the configuration
-        conf_filename = kwargs.get("conf", os.path.join(os.path.expanduser("~"), ".lapis.yml"))
-        self.__parse_conf_data(conf_filename)
+        self.__parse_conf_data(data)
 
         # setup printer
         self.__printer = CommandPrinter(color_enabled=self.__tc_enabled)
 
         # examples
-        self.__example_lapis_configuration_file = os.path.join(os.path.dirname(__file__), "examples", "lapis.yml")
+        self.__example_lapis_configuration_file = EXAMPLE_LAPIS_CONFIGURATION_FILE
 
-    def __parse_conf_data(self, conf_fn):
-        """parses the configuration data in the conf file and populates this configs attributes"""
+    @staticmethod
+    def __read_conf_data(conf_fn):
+        """returns the configuration data in the conf file"""
+        import yaml
         try:
             with open(conf_fn, "rt", encoding="utf-8") as f:
-                data = yaml.load(f)
+                return yaml.load(f) or {}
         except IOError:
-            data = {}
+            return {}
 
+    def __parse_conf_data(self, data):
+        """populates this configs attributes from the configuration data"""
         from lapis.editor import interface_for_editor, default_editor
         self.__editor = interface_for_editor(data.get("editor", default_editor))
 
@@ -51,6 +142,15 @@ class Config(object):
         # paths
         self.__preferred_article_path_format_str = data.get("article_path", "")
 
+        # sync
+        syncdata = data.get("sync", {}) or {}
+        try:
+            self.__sync_jobs = int(syncdata.get("jobs", 1))
+        except (TypeError, ValueError):
+            logger.warning("sync > jobs must be a number of processes, not {!r}, using 1".format(syncdata.get("jobs")))
+            self.__sync_jobs = 1
+        self.__sync_git = syncdata.get("git", "no") in ("yes", True, 1)
+
     @property
     def settings(self):
         """the pelican settings dictionary read from the pelicanconf.py"""
@@ -103,3 +203,13 @@ class Config(object):
     @property
     def format(self):
         return self.__format
+
+    @property
+    def sync_jobs(self):
+        """number of processes used to read content during a sync, 0 uses every cpu"""
+        return self.__sync_jobs
+
+    @property
+    def sync_git(self):
+        """whether a sync asks git which files changed instead of scanning the content directory"""
+        return self.__sync_git
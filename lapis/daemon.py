@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""module with the lapis daemon, which keeps a site's config and store loaded
+and runs commands on behalf of lapis clients over a unix socket.
+
+this module is imported before the client knows whether a daemon is running,
+so it must not import pelican, sqlalchemy or any other heavy module.
+"""
+
+import io
+import json
+import logging
+import os
+import select
+import socket
+import sys
+
+
+logger = logging.getLogger(__name__)
+
+SOCKET_NAME = ".lapis.sock"
+
+# seconds a client waits for the daemon to answer before running the command itself
+CLIENT_TIMEOUT = 10.0
+
+# seconds the daemon waits for a client to send its request or read the answer
+REQUEST_TIMEOUT = 5.0
+
+
+def socket_path(pelican_config_path):
+    """returns the path of the socket used by the daemon for the site"""
+    return os.path.join(os.path.dirname(os.path.abspath(pelican_config_path)), SOCKET_NAME)
+
+
+def _receive(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return json.loads(b"".join(chunks).decode("utf-8"))
+
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message).encode("utf-8"))
+    sock.shutdown(socket.SHUT_WR)
+
+
+def forward(path, argv, stdout=None, stderr=None, timeout=CLIENT_TIMEOUT):
+    """asks the daemon listening at path to run the command line.
+
+    :param path str: path to the daemon socket
+    :param argv list: the command line arguments, without the program name
+    :param timeout float: seconds to wait for the daemon to answer
+    :rtype int: the exit status of the command or None when no daemon is
+        running or it did not answer in time
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(path)
+        except socket.timeout:
+            logger.warning("the lapis daemon did not accept the command within {} seconds, running it in this process".format(timeout))
+            return None
+        except OSError:
+            # the daemon exited without removing its socket
+            return None
+        try:
+            _send(sock, {"argv": list(argv)})
+            response = _receive(sock)
+        except socket.timeout:
+            logger.warning("the lapis daemon did not answer within {} seconds, running the command in this process".format(timeout))
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("the lapis daemon failed to answer ({}), running the command in this process".format(e))
+            return None
+    finally:
+        sock.close()
+
+    stdout.write(response["stdout"])
+    stdout.flush()
+    stderr.write(response["stderr"])
+    return response["status"]
+
+
+class DaemonConfig(object):
+    """view of the daemon's config that prints to the output of one request"""
+
+    def __init__(self, config, printer):
+        self.__config = config
+        self.__printer = printer
+
+    @property
+    def printer(self):
+        return self.__printer
+
+    def __getattr__(self, name):
+        return getattr(self.__config, name)
+
+
+class Daemon(object):
+    """serves lapis commands from a config and store that stay loaded.
+
+    :param config Config: the config of the site, with its store opened
+    :param path str: path of the unix socket to listen on
+    :param index_watcher IndexWatcher: keeps the store in sync between requests
+    """
+
+    def __init__(self, config, path, index_watcher=None):
+        from lapis.command import _build_parser
+        self.__config = config
+        self.__path = path
+        self.__index_watcher = index_watcher
+        self.__parser = _build_parser()
+
+    @property
+    def path(self):
+        return self.__path
+
+    def handle(self, request):
+        """runs the command line in the request
+
+        :param request dict: the request sent by a client
+        :rtype dict: the output and the exit status of the command
+        """
+        from contextlib import redirect_stdout, redirect_stderr
+        from lapis.command import LOG_FORMAT, log_level
+        from lapis.printer import CommandPrinter
+
+        out = io.StringIO()
+        err = io.StringIO()
+        status = 0
+        # the log handlers of the daemon write to its own stderr, the records
+        # of the request are also written to the client's
+        handler = logging.StreamHandler(err)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.setLevel(logging.WARNING)
+        logging.getLogger().addHandler(handler)
+        try:
+            with redirect_stdout(out), redirect_stderr(err):
+                args = self.__parser.parse_args(request["argv"])
+                handler.setLevel(log_level(args.verbose))
+                command_cls = getattr(args, "command_cls", None)
+                if command_cls is None or not command_cls.can_forward(args):
+                    err.write("the lapis daemon does not run this command\n")
+                    status = 2
+                else:
+                    printer = CommandPrinter(stream=out, color_enabled=self.__config.printer.color_enabled)
+                    kwargs = {key: value for key, value in args.__dict__.items()}
+                    kwargs["config"] = DaemonConfig(self.__config, printer)
+                    command_cls.run(**kwargs)
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            logger.exception("failed to run {}".format(request.get("argv")))
+            err.write("lapis daemon error: {}\n".format(e))
+            status = 1
+        finally:
+            logging.getLogger().removeHandler(handler)
+            # lets the next request see changes made by other processes
+            self.__config.store.refresh()
+        return {"stdout": out.getvalue(), "stderr": err.getvalue(), "status": status}
+
+    def __bind(self):
+        if os.path.exists(self.__path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.__path)
+            except OSError:
+                os.remove(self.__path)
+            else:
+                raise RuntimeError("a lapis daemon is already listening at {}".format(self.__path))
+            finally:
+                probe.close()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            server.bind(self.__path)
+        finally:
+            os.umask(old_umask)
+        server.listen(16)
+        return server
+
+    def __serve_connection(self, connection):
+        # requests are served one at a time, a client that stops sending or
+        # reading is dropped instead of blocking the others
+        connection.settimeout(REQUEST_TIMEOUT)
+        try:
+            request = _receive(connection)
+            _send(connection, self.handle(request))
+        except (OSError, ValueError) as e:
+            logger.warning("dropped a lapis client: {}".format(e))
+        finally:
+            connection.close()
+
+    def serve(self, stop=None):
+        """serves requests until stop returns true or the process is interrupted
+
+        :param stop callable: checked between requests, returns true to stop serving
+        """
+        server = self.__bind()
+        logger.info("lapis daemon listening at {}".format(self.__path))
+        timeout = 0.25 if self.__index_watcher else 1.0
+        try:
+            while stop is None or not stop():
+                readable, _, _ = select.select([server], [], [], timeout)
+                if readable:
+                    connection, _ = server.accept()
+                    self.__serve_connection(connection)
+                if self.__index_watcher:
+                    self.__index_watcher.step(0)
+        finally:
+            server.close()
+            if os.path.exists(self.__path):
+                os.remove(self.__path)
+            if self.__index_watcher:
+                self.__index_watcher.close()
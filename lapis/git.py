@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""module that asks git which files of the content directory changed, so a
+sync does not need to walk the whole directory.
+
+the state of a directory is the commit checked out and the set of files that
+differ from it. the files which changed between two states are the files
+changed by the commits in between, plus the files that differed from either
+commit.
+"""
+
+import logging
+import os
+import subprocess
+
+
+logger = logging.getLogger(__name__)
+
+
+class GitState(object):
+    """the git state of a directory inside a repository.
+
+    :param path str: directory the state is restricted to
+    :param commit str: hash of the commit checked out, None before the first commit
+    :param dirty set: absolute paths of the files which differ from the commit,
+        including untracked and ignored files, which git cannot tell changed
+    """
+
+    def __init__(self, path, commit, dirty):
+        self.path = path
+        self.commit = commit
+        self.dirty = dirty
+
+    @staticmethod
+    def git(path, *args):
+        """runs git in path, returns its output or None when git failed
+
+        :param path str: directory git runs in
+        :param args list: git arguments
+        :rtype bytes: the standard output of git
+        """
+        try:
+            return subprocess.check_output(("git", ) + args, cwd=path, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.debug("git {} failed in {}: {}".format(" ".join(args), path, e))
+            return None
+
+    def paths(self, output):
+        """returns the absolute paths of a NUL separated list of paths relative to the directory"""
+        return set(os.path.join(self.path, os.fsdecode(name)) for name in output.split(b"\0") if name)
+
+    @classmethod
+    def read(cls, path):
+        """returns the current state of the directory, or None outside a repository
+
+        :param path str: directory the state is restricted to
+        """
+        path = os.path.abspath(path)
+        if cls.git(path, "rev-parse", "--is-inside-work-tree") is None:
+            return None
+        head = cls.git(path, "rev-parse", "--verify", "--quiet", "HEAD")
+        if head is None:
+            return None
+        state = cls(path, head.decode("ascii").strip(), set())
+        tracked = cls.git(path, "diff", "--name-only", "-z", "--relative", "--no-renames", "HEAD", "--", ".")
+        untracked = cls.git(path, "ls-files", "-z", "--others", "--exclude-standard", "--", ".")
+        # ignored files are compared with their fingerprints by every sync
+        ignored = cls.git(path, "ls-files", "-z", "--others", "--ignored", "--exclude-standard", "--", ".")
+        if tracked is None or untracked is None or ignored is None:
+            return None
+        state.dirty = state.paths(tracked) | state.paths(untracked) | state.paths(ignored)
+        return state
+
+    def changed_since(self, commit, dirty):
+        """returns the absolute paths of the files which may have changed since
+        an earlier state, or None when the earlier commit is unknown to git.
+
+        :param commit str: commit of the earlier state
+        :param dirty iterable: dirty paths of the earlier state
+        :rtype set: the paths, some of which may no longer exist
+        """
+        changed = set(self.dirty)
+        changed.update(dirty)
+        if commit != self.commit:
+            committed = self.git(self.path, "diff", "--name-only", "-z", "--relative", "--no-renames", commit, self.commit, "--", ".")
+            if committed is None:
+                return None
+            changed.update(self.paths(committed))
+        return changed
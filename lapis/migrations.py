@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""module with the migrations that bring a store written by an older lapis up
+to date in place.
+
+the site row records the schema version of the store. when a store is opened
+every migration with a newer version is applied in order: it alters the schema
+and backfills the new columns from the rows already in the store. when a
+column holds a value only pelican can parse from the files, the migration
+returns the source paths whose files must be read again. their fingerprints
+are dropped, so the next sync reads those files and only those, while every
+other row and fingerprint is kept.
+"""
+
+import collections
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# a migration, apply is called with the session of the store and returns a
+# query of the source paths that must be read again or None
+Migration = collections.namedtuple("Migration", ["version", "description", "apply"])
+
+# the files of every content in the store
+INDEXED_CONTENT = "SELECT source_path FROM content"
+
+
+def _columns(session, table):
+    return set(row[1] for row in session.execute("PRAGMA table_info({})".format(table)))
+
+
+def _add_column(session, table, column, definition, index=None):
+    """adds the column and its index, returns false if the column existed"""
+    if column in _columns(session, table):
+        return False
+    session.execute("ALTER TABLE {} ADD COLUMN {} {}".format(table, column, definition))
+    if index is not None:
+        session.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(index, table, column))
+    return True
+
+
+def _index_dates_and_tags(session):
+    session.execute("CREATE INDEX IF NOT EXISTS ix_content_date_created ON content (date_created)")
+    session.execute("CREATE INDEX IF NOT EXISTS ix_content_tag_content_id ON content_tag (content_id)")
+
+
+def _fold_titles(session):
+    from lapis.store import fold
+    _add_column(session, "content", "title_folded", "VARCHAR", index="ix_content_title_folded")
+    rows = session.execute("SELECT id, title FROM content WHERE title_folded IS NULL AND title IS NOT NULL").fetchall()
+    if rows:
+        session.execute("UPDATE content SET title_folded = :title_folded WHERE id = :id",
+                        [dict(id=content_id, title_folded=fold(title)) for content_id, title in rows])
+
+
+def _modification_dates(session):
+    if not _add_column(session, "content", "date_modified", "DATETIME", index="ix_content_date_modified"):
+        return None
+    # content sorts by the date it was created until its file is read again
+    session.execute("UPDATE content SET date_modified = date_created")
+    return INDEXED_CONTENT
+
+
+def _index_filters(session):
+    session.execute("CREATE INDEX IF NOT EXISTS ix_content_type_status_date_created ON content (type, status, date_created)")
+    session.execute("CREATE INDEX IF NOT EXISTS ix_content_author_id_date_created ON content (author_id, date_created)")
+    session.execute("CREATE INDEX IF NOT EXISTS ix_content_category_id_date_created ON content (category_id, date_created)")
+    session.execute("CREATE INDEX IF NOT EXISTS ix_content_tag_tag_id_content_id ON content_tag (tag_id, content_id)")
+    for table in ("tag", "author", "category"):
+        session.execute("CREATE INDEX IF NOT EXISTS ix_{0}_name ON {0} (name)".format(table))
+
+
+def _git_state(session):
+    _add_column(session, "site", "git_commit", "VARCHAR(64)")
+    _add_column(session, "site", "git_dirty", "TEXT")
+
+
+def _sync_progress(session):
+    _add_column(session, "site", "sync_done", "INTEGER")
+    _add_column(session, "site", "sync_remaining", "INTEGER")
+
+
+def _index_types(session):
+    session.execute("CREATE INDEX IF NOT EXISTS ix_content_type_date_created ON content (type, date_created)")
+
+
+def _sync_owner(session):
+    _add_column(session, "site", "sync_owner", "VARCHAR(255)")
+
+
+def _settings_digest(session):
+    _add_column(session, "site", "settings_digest", "VARCHAR(40)")
+
+
+MIGRATIONS = (Migration(1, "index content by date and content tags by content", _index_dates_and_tags),
+              Migration(2, "casefold titles", _fold_titles),
+              Migration(3, "add modification dates", _modification_dates),
+              Migration(4, "index the filters of find", _index_filters),
+              Migration(5, "record the git state of the last sync", _git_state),
+              Migration(6, "record the progress of a sync", _sync_progress),
+              Migration(7, "index content by type and date", _index_types),
+              Migration(8, "record the process running a sync", _sync_owner),
+              Migration(9, "record the settings of the fingerprints", _settings_digest))
+
+# the schema version of the stores created by this version of lapis
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def _create_search_tables(session):
+    """creates the search tables which do not exist and that sqlite supports.
+
+    :rtype tuple: (available, reread) the names of the search tables and
+        whether the files must be read again to fill them
+    """
+    from sqlalchemy.exc import OperationalError
+    from lapis.store import SEARCH_TABLES, TRIGRAM_TABLE
+    available = set()
+    reread = False
+    for name, definition in SEARCH_TABLES:
+        exists = session.execute("SELECT 1 FROM sqlite_master WHERE name = :name", {"name": name}).first()
+        if not exists:
+            try:
+                session.execute("CREATE VIRTUAL TABLE {} USING {}".format(name, definition))
+            except OperationalError as e:
+                logger.debug("sqlite does not support {}: {}".format(name, e))
+                continue
+            if name == TRIGRAM_TABLE:
+                session.execute("INSERT INTO {} (rowid, title) SELECT id, title_folded FROM content WHERE title_folded IS NOT NULL".format(name))
+            else:
+                # the full text is only kept in the files
+                reread = True
+        available.add(name)
+    return available, reread
+
+
+def migrate(session):
+    """brings the schema of the store up to date and commits.
+
+    a store without a site row was just created with the latest schema, a
+    store with a newer schema version than this lapis knows is left as is.
+
+    :param session Session: session of the store
+    :rtype set: names of the search tables that sqlite supports
+    """
+    if "schema_version" not in _columns(session, "site"):
+        session.execute("ALTER TABLE site ADD COLUMN schema_version INTEGER")
+    site = session.execute("SELECT schema_version FROM site").first()
+
+    reread = set()
+    if site is not None and (site[0] or 0) < SCHEMA_VERSION:
+        current = site[0] or 0
+        for migration in MIGRATIONS:
+            if migration.version > current:
+                logger.info("migrating the store to version {}: {}".format(migration.version, migration.description))
+                paths = migration.apply(session)
+                if paths is not None:
+                    reread.add(paths)
+        session.execute("UPDATE site SET schema_version = :version", {"version": SCHEMA_VERSION})
+
+    available, reread_search = _create_search_tables(session)
+    if reread_search:
+        reread.add(INDEXED_CONTENT)
+    for paths in reread:
+        session.execute("DELETE FROM fingerprint WHERE source_path IN ({})".format(paths))
+    session.commit()
+    return available
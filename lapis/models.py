@@ -1,10 +1,13 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Table, Enum, DateTime
+from sqlalchemy import Column, ForeignKey, Integer, String, Table, Enum, DateTime, Float, Index, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 # from sqlalchemy import create_engine
 
 PATH_LEN = 500
 VERSION_LEN = 50
+DIGEST_LEN = 40
+COMMIT_LEN = 64
+OWNER_LEN = 255
 STATUS_LEN = 50
 Base = declarative_base()
 
@@ -13,11 +16,39 @@ class Site(Base):
     __tablename__ = 'site'
     id = Column(Integer, primary_key=True)
     version = Column(String(VERSION_LEN), nullable=False)
+    # see lapis.migrations
+    schema_version = Column(Integer, nullable=True)
+    # the git state of the content directory at the last sync, see lapis.git
+    git_commit = Column(String(COMMIT_LEN), nullable=True)
+    # json list of the files which differed from the commit
+    git_dirty = Column(Text, nullable=True)
+    # progress of a sync that has not finished, both are null once it finished
+    sync_done = Column(Integer, nullable=True)
+    sync_remaining = Column(Integer, nullable=True)
+    # host and pid of the process running the sync
+    sync_owner = Column(String(OWNER_LEN), nullable=True)
+    # digest of the settings the fingerprints were recorded with, see lapis.store
+    settings_digest = Column(String(DIGEST_LEN), nullable=True)
+
+
+class Fingerprint(Base):
+    """the on-disk state of a source file the last time it was read during a sync"""
+    __tablename__ = 'fingerprint'
+    id = Column(Integer, primary_key=True)
+    source_path = Column(String(PATH_LEN), nullable=False, unique=True, index=True)
+    mtime = Column(Float, nullable=False)
+    size = Column(Integer, nullable=False)
+    digest = Column(String(DIGEST_LEN), nullable=True)
+
+    def __repr__(self):
+        return "Fingerprint(source_path='{}', mtime='{}', size='{}', digest='{}')".format(self.source_path, self.mtime, self.size, self.digest)
 
 
 content_tag_table = Table('content_tag', Base.metadata,
-                          Column('content_id', Integer, ForeignKey('content.id')),
-                          Column('tag_id', Integer, ForeignKey('tag.id')))
+                          Column('content_id', Integer, ForeignKey('content.id'), index=True),
+                          Column('tag_id', Integer, ForeignKey('tag.id')),
+                          # the content with a tag, without reading the table
+                          Index('ix_content_tag_tag_id_content_id', 'tag_id', 'content_id'))
 
 
 class Content(Base):
@@ -25,7 +56,10 @@ class Content(Base):
     id = Column(Integer, primary_key=True)
     source_path = Column(String(PATH_LEN), nullable=False, unique=True, index=True)
     title = Column(String(), index=True)
-    date_created = Column(DateTime())
+    # the title casefolded, see lapis.store.fold
+    title_folded = Column(String(), index=True)
+    date_created = Column(DateTime(), index=True)
+    date_modified = Column(DateTime(), index=True)
     type = Column(Enum('page', 'article'), nullable=False)
     tags = relationship('Tag', secondary=content_tag_table, backref="content")
     author_id = Column(Integer, ForeignKey('author.id'))
@@ -33,6 +67,14 @@ class Content(Base):
     category_id = Column(Integer, ForeignKey('category.id'))
     category = relationship('Category', backref='content')
     status = Column(String(STATUS_LEN), nullable=True)
+    # the matching text of a full-text search, not stored
+    snippet = None
+
+    # the filters of find, in the order of the newest content
+    __table_args__ = (Index('ix_content_type_date_created', 'type', 'date_created'),
+                      Index('ix_content_type_status_date_created', 'type', 'status', 'date_created'),
+                      Index('ix_content_author_id_date_created', 'author_id', 'date_created'),
+                      Index('ix_content_category_id_date_created', 'category_id', 'date_created'))
 
     def __repr__(self):
         return "Content(title='{}', status='{}', date_created='{}', type='{}', author='{}', category='{}', tags='{}')".format(self.title, self.status, self.date_created, self.type, self.author, self.category, self.tags)
@@ -41,7 +83,7 @@ class Content(Base):
 class Tag(Base):
     __tablename__ = 'tag'
     id = Column(Integer, primary_key=True)
-    name = Column(String())
+    name = Column(String(), index=True)
 
     def __repr__(self):
         return self.name
@@ -50,7 +92,7 @@ class Tag(Base):
 class Category(Base):
     __tablename__ = 'category'
     id = Column(Integer, primary_key=True)
-    name = Column(String())
+    name = Column(String(), index=True)
 
     def __repr__(self):
         return self.name
@@ -59,7 +101,7 @@ class Category(Base):
 class Author(Base):
     __tablename__ = 'author'
     id = Column(Integer, primary_key=True)
-    name = Column(String())
+    name = Column(String(), index=True)
 
     def __repr__(self):
         return self.name
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""pelican plugin that writes the content read by a pelican build to the lapis
+store, so the build leaves a fresh index behind without lapis reading the
+files again.
+
+enable it in the pelicanconf.py of the site:
+
+    PLUGINS = ["lapis.pelican_plugin"]
+"""
+
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+
+class BuildIndexer(object):
+    """collects the content of the article and page generators and writes it
+    to the store of the site once the build is finalized.
+    """
+
+    def __init__(self):
+        self.__records = {}
+        self.__generators = set()
+
+    def __collect(self, contents, content_type):
+        from lapis.readers import content_record
+        for content in contents:
+            record = content_record(content, content_type)
+            self.__records[record.source_path] = record
+
+    def article_generator_finalized(self, generator):
+        self.__collect(generator.articles, "article")
+        self.__collect(generator.translations, "article")
+        self.__collect(getattr(generator, "drafts", []), "article")
+        self.__collect(getattr(generator, "drafts_translations", []), "article")
+        self.__generators.add("article")
+
+    def page_generator_finalized(self, generator):
+        self.__collect(generator.pages, "page")
+        self.__collect(generator.translations, "page")
+        self.__collect(getattr(generator, "hidden_pages", []), "page")
+        self.__collect(getattr(generator, "hidden_translations", []), "page")
+        self.__generators.add("page")
+
+    def finalized(self, pelican):
+        """writes the collected content to the store in the content directory"""
+        from lapis.store import Store
+        records, self.__records = list(self.__records.values()), {}
+        generators, self.__generators = self.__generators, set()
+        if not generators:
+            return
+
+        store = Store(os.path.join(pelican.settings['PATH'], ".lapisdb"))
+        if store.schema_changed:
+            logger.warning("the lapis store was written by a newer version of lapis, it was not updated")
+            return
+        # content the build did not generate is only removed when it saw both kinds
+        store.write_records(records, complete=generators == {"article", "page"}, settings=pelican.settings)
+        logger.info("lapis indexed {} articles and pages".format(len(records)))
+
+
+_indexer = BuildIndexer()
+
+
+def register():
+    """connects the plugin to the pelican signals"""
+    from pelican import signals
+    signals.article_generator_finalized.connect(_indexer.article_generator_finalized)
+    signals.page_generator_finalized.connect(_indexer.page_generator_finalized)
+    signals.finalized.connect(_indexer.finalized)
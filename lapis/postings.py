@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""module with the posting lists used to filter content by its metadata.
+
+a posting list is a bitmap, kept as a python int, in which bit n is set when
+the content with id n has the value. filters on tags, categories, authors,
+statuses and types are combined with bitwise operations before any content
+row is fetched. the bitmaps are built from the store and persisted, compressed,
+in a file next to it, stamped with the state of the database file they were
+built from so that any write to the store makes them stale.
+"""
+
+import logging
+import os
+import pickle
+import struct
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+# the metadata which has posting lists
+FIELDS = ("type", "status", "author", "category", "tag")
+
+# the sqlite file change counter is a big-endian integer at this offset of the
+# header, it is incremented by every transaction that modifies the database
+CHANGE_COUNTER_OFFSET = 24
+CHANGE_COUNTER = struct.Struct(">I")
+
+FORMAT_VERSION = 1
+
+
+def database_stamp(db_path):
+    """returns a value that changes whenever the database at the path is written
+
+    :param db_path str: path to the sqlite database
+    :rtype tuple: the inode, size, modification time and change counter of the database
+    """
+    try:
+        with open(db_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            f.seek(CHANGE_COUNTER_OFFSET)
+            header = f.read(CHANGE_COUNTER.size)
+    except OSError:
+        return None
+    counter = CHANGE_COUNTER.unpack(header)[0] if len(header) == CHANGE_COUNTER.size else None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns, counter)
+
+
+def ids(bitmap):
+    """returns the sorted content ids set in the bitmap"""
+    bits = bin(bitmap)[:1:-1]
+    result = []
+    i = bits.find("1")
+    while i >= 0:
+        result.append(i)
+        i = bits.find("1", i + 1)
+    return result
+
+
+class PostingIndex(object):
+    """maps each value of the metadata fields to the bitmap of its content.
+
+    :param postings dict: field to dictionary of value to bitmap
+    :param universe int: bitmap of every content
+    :param stamp tuple: the database stamp the postings were built from
+    """
+
+    def __init__(self, postings, universe, stamp=None):
+        self.__postings = postings
+        self.__universe = universe
+        self.__stamp = stamp
+
+    @property
+    def stamp(self):
+        return self.__stamp
+
+    @property
+    def universe(self):
+        """bitmap of every content in the store"""
+        return self.__universe
+
+    def get(self, field, value):
+        """returns the bitmap of the content whose field has the value"""
+        return self.__postings[field].get(value, 0)
+
+    def all_of(self, field, values):
+        """returns the bitmap of the content which has every one of the values"""
+        bitmap = self.__universe
+        for value in values:
+            bitmap &= self.get(field, value)
+        return bitmap
+
+    def any_of(self, field, values):
+        """returns the bitmap of the content which has any of the values"""
+        bitmap = 0
+        for value in values:
+            bitmap |= self.get(field, value)
+        return bitmap
+
+    @classmethod
+    def build(cls, connection, stamp=None):
+        """builds the posting lists from the rows of the store
+
+        :param connection object: sqlalchemy connection or session of the store
+        :param stamp tuple: the database stamp taken before the rows were read
+        """
+        postings = {field: {} for field in FIELDS}
+        universe = 0
+
+        def add(field, value, content_id):
+            if value is not None:
+                postings[field][value] = postings[field].get(value, 0) | (1 << content_id)
+
+        rows = connection.execute("SELECT content.id, content.type, content.status, author.name, category.name FROM content "
+                                  "LEFT OUTER JOIN author ON author.id = content.author_id "
+                                  "LEFT OUTER JOIN category ON category.id = content.category_id")
+        for content_id, content_type, status, author, category in rows:
+            universe |= 1 << content_id
+            add("type", content_type, content_id)
+            add("status", status, content_id)
+            add("author", author, content_id)
+            add("category", category, content_id)
+        rows = connection.execute("SELECT content_tag.content_id, tag.name FROM content_tag JOIN tag ON tag.id = content_tag.tag_id")
+        for content_id, tag in rows:
+            add("tag", tag, content_id)
+        return cls(postings, universe, stamp)
+
+    def save(self, path):
+        """writes the compressed posting lists to the path, replacing it atomically"""
+        def pack(bitmap):
+            return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+
+        data = {"version": FORMAT_VERSION,
+                "stamp": self.__stamp,
+                "universe": pack(self.__universe),
+                "postings": {field: {value: pack(bitmap) for value, bitmap in values.items()} for field, values in self.__postings.items()}}
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug("could not save the posting lists to {}: {}".format(path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def load(cls, path):
+        """reads the posting lists saved at the path, returns None if there are none"""
+        def unpack(data):
+            return int.from_bytes(data, "little")
+
+        try:
+            with open(path, "rb") as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logger.debug("could not load the posting lists from {}: {}".format(path, e))
+            return None
+        if not isinstance(data, dict) or data.get("version", None) != FORMAT_VERSION:
+            return None
+        postings = {field: {value: unpack(bitmap) for value, bitmap in values.items()} for field, values in data["postings"].items()}
+        return cls(postings, unpack(data["universe"]), data["stamp"])
@@ -2,7 +2,10 @@
 # encoding: utf-8
 
 
+import collections
+import itertools
 import os
+import re
 import sys
 import importlib
 
@@ -11,6 +14,9 @@ try:
 except ImportError:
     tc = None
 
+# a month or year of the archive, printed like a content attribute
+Period = collections.namedtuple("Period", ["name", "count"])
+
 
 class ColorFormatter(object):
     def __init__(self, color_enabled):
@@ -35,6 +41,8 @@ class ContentFormatter(ColorFormatter):
         self.status_other_color = kwargs.get("status_published_color", "red")
         self.author_color = kwargs.get("author_color", "yellow")
         self.date_created_color = kwargs.get("date_color", "yellow")
+        self.match_color = kwargs.get("match_color", "red")
+        self.show_snippet = kwargs.get("show_snippet", False)
 
     @property
     def content_type_id(self):
@@ -50,14 +58,27 @@ class ContentFormatter(ColorFormatter):
 
     @property
     def author(self):
-        return self.get_color_text(self.__content.author.name, self.author_color)
+        # the author of a ContentRow is its name
+        author = self.__content.author
+        return self.get_color_text(getattr(author, "name", author), self.author_color)
 
     @property
     def date_created(self):
         return self.get_color_text(self.__content.date_created.strftime("%Y-%m-%d"), self.date_created_color)
 
+    @property
+    def snippet(self):
+        """the text matched by a full-text search, with the matched words highlighted"""
+        from lapis.store import SNIPPET_START, SNIPPET_END
+        snippet = " ".join((self.__content.snippet or "").split())
+        pattern = re.compile("{}(.*?){}".format(re.escape(SNIPPET_START), re.escape(SNIPPET_END)))
+        return pattern.sub(lambda m: self.get_color_text(m.group(1), self.match_color, attrs=["bold"]), snippet)
+
     def __str__(self):
-        return "{}.) | {} | {} | {} | {}".format(self.index, self.content_type_id, self.status, self.date_created, self.title)
+        line = "{}.) | {} | {} | {} | {}".format(self.index, self.content_type_id, self.status, self.date_created, self.title)
+        if self.show_snippet and self.__content.snippet:
+            line += "\n     {}".format(self.snippet)
+        return line
 
 
 class ContentAttributeFormatter(ColorFormatter):
@@ -69,7 +90,11 @@ class ContentAttributeFormatter(ColorFormatter):
 
     @property
     def count(self):
-        return self.get_color_text(len(self.__content_attribute.content), self.count_color)
+        # counts from Store.counts are precomputed, otherwise the content is loaded
+        count = getattr(self.__content_attribute, "count", None)
+        if not isinstance(count, int):
+            count = len(self.__content_attribute.content)
+        return self.get_color_text(count, self.count_color)
 
     @property
     def name(self):
@@ -97,11 +122,19 @@ class CommandPrinter(object):
         print("Deleted content at {}".format(content.source_path), file=self.__stream)
 
     def print_content(self, content_list, **kwargs):
-        """prints content on the provided stream"""
-        i = 0
-        for content in content_list:
-            i += 1
-            print(ContentFormatter(content, i, color_enabled=self.__color_enabled), file=self.__stream)
+        """prints content on the provided stream as it is iterated
+
+        :param snippets bool: prints the text matched by a full-text search under each content
+        :param start int: the number of the first content
+        :rtype int: the number of content printed
+        """
+        show_snippet = kwargs.get("snippets", False)
+        start = kwargs.get("start", 1)
+        count = 0
+        for i, content in enumerate(content_list, start):
+            print(ContentFormatter(content, i, color_enabled=self.__color_enabled, show_snippet=show_snippet), file=self.__stream)
+            count += 1
+        return count
 
     def print_location(self, content):
         print(content.source_path, file=self.__stream)
@@ -110,3 +143,28 @@ class CommandPrinter(object):
         """prints content attributes like tags, author, etc"""
         for content_attr in content_attributes:
             print(ContentAttributeFormatter(content_attr, color_enabled=self.__color_enabled), file=self.__stream)
+
+    def print_archive(self, archive_counts):
+        """prints the ArchiveCounts of Store.archive, the months of each year under its total"""
+        for year, counts in itertools.groupby(archive_counts, key=lambda count: count.year):
+            counts = list(counts)
+            print(ContentAttributeFormatter(Period(str(year), sum(count.count for count in counts)), color_enabled=self.__color_enabled), file=self.__stream)
+            for count in counts:
+                if count.month is not None:
+                    period = Period("{}-{:02d}".format(count.year, count.month), count.count)
+                    print("    {}".format(ContentAttributeFormatter(period, color_enabled=self.__color_enabled)), file=self.__stream)
+
+    def print_query_plan(self, query_plan):
+        """prints the QueryPlan of Store.explain, with the plan indented like the sqlite shell does"""
+        if query_plan.sql is None:
+            print("no query was run, the posting lists show that nothing matches", file=self.__stream)
+        else:
+            print(query_plan.sql, file=self.__stream)
+            print("parameters: {}".format(query_plan.parameters), file=self.__stream)
+            print("QUERY PLAN", file=self.__stream)
+            formatter = ColorFormatter(self.__color_enabled)
+            depths = {0: 0}
+            for node, parent, detail in query_plan.plan:
+                depths[node] = depths.get(parent, 0) + 1
+                print("{}{}".format("  " * depths[node], formatter.get_color_text(detail, "cyan")), file=self.__stream)
+        print("{} results, first run {:.4f}s, second run {:.4f}s".format(query_plan.rows, query_plan.first_seconds, query_plan.seconds), file=self.__stream)
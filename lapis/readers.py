@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""module with readers that only parse the metadata of pelican content.
+
+pelican renders the whole body of a file to html when it reads it, but the
+store only keeps metadata and the plain text that is indexed for full-text
+search. the readers here split the metadata header from the body as written
+and hand any format, plugin or construct they do not understand to the full
+pelican reader.
+"""
+
+import collections
+import html
+import logging
+import os
+import re
+
+
+logger = logging.getLogger(__name__)
+
+# the compact form of a content object that the store keeps
+ContentRecord = collections.namedtuple("ContentRecord", ["source_path", "type", "title", "status", "date_created", "date_modified", "author", "category", "tags", "summary", "text"])
+
+TAG_RE = re.compile(r'<[^>]*>')
+
+
+def strip_html(value):
+    """returns the text of an html fragment without its tags"""
+    if value is None:
+        return None
+    return html.unescape(TAG_RE.sub(" ", value))
+
+
+class MetadataReader(object):
+    """base class for readers that parse only the metadata of a file.
+
+    :param reader object: the pelican reader that would otherwise read the file
+    """
+
+    def __init__(self, reader):
+        self._reader = reader
+
+    def process_metadata(self, name, value):
+        return self._reader.process_metadata(name, value)
+
+    @staticmethod
+    def lines(source_path):
+        """yields the lines of the file lazily, without line endings"""
+        with open(source_path, "rt", encoding="utf-8-sig") as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+    def read(self, source_path):
+        """returns the metadata dictionary and the body text of the file or
+        None if the file must be read by the full pelican reader.
+        """
+        raise NotImplementedError
+
+
+class MarkdownMetadataReader(MetadataReader):
+    """reads the header parsed by the markdown meta extension"""
+
+    META_RE = re.compile(r'^[ ]{0,3}(?P<key>[A-Za-z0-9_-]+):\s*(?P<value>.*)')
+    META_MORE_RE = re.compile(r'^[ ]{4,}(?P<value>.*)')
+    BEGIN_RE = re.compile(r'^-{3}(\s.*)?')
+    END_RE = re.compile(r'^(-{3}|\.{3})(\s.*)?')
+
+    def _parse_header(self, lines):
+        """returns a dictionary of lowercase key to list of values and the
+        index of the first line of the body
+        """
+        meta = {}
+        key = None
+        for i, line in enumerate(lines):
+            line = line.expandtabs(4)
+            if i == 0 and self.BEGIN_RE.match(line):
+                continue
+            if line.strip() == '':
+                return meta, i
+            if self.END_RE.match(line):
+                return meta, i + 1
+            m1 = self.META_RE.match(line)
+            if m1:
+                key = m1.group('key').lower().strip()
+                meta.setdefault(key, []).append(m1.group('value').strip())
+                continue
+            m2 = self.META_MORE_RE.match(line)
+            if m2 and key:
+                meta[key].append(m2.group('value').strip())
+            else:
+                return meta, i
+        return meta, len(lines)
+
+    def read(self, source_path):
+        from pelican.readers import METADATA_PROCESSORS
+        lines = list(self.lines(source_path))
+        header, end = self._parse_header(lines)
+        output = {}
+        for name, value in header.items():
+            if name == "summary":
+                # the summary is kept as written rather than rendered to html
+                output[name] = self.process_metadata(name, "\n".join(value))
+            elif name in METADATA_PROCESSORS:
+                if len(value) > 1:
+                    logger.warning("Duplicate definition of `{}` for {}. Using first one.".format(name, source_path))
+                output[name] = self.process_metadata(name, value[0])
+            elif len(value) > 1:
+                output[name] = self.process_metadata(name, value)
+            else:
+                output[name] = self.process_metadata(name, value[0])
+        return output, "\n".join(lines[end:]).strip()
+
+
+class RstMetadataReader(MetadataReader):
+    """reads the document title and the docinfo field list of restructuredtext.
+
+    only the common layout written by lapis and pelican-quickstart is handled:
+    a title, optionally with an overline, directly followed by a field list.
+    """
+
+    ADORNMENT_RE = re.compile(r'^([!-/:-@\[-`{-~])\1+\s*$')
+    FIELD_RE = re.compile(r'^:(?P<name>[^:`]+):(\s+(?P<value>.*))?$')
+    # characters that docutils would interpret as inline markup
+    MARKUP_RE = re.compile(r'[`*|\\]|_\b')
+    # characters that docutils would also escape in the html title
+    TITLE_MARKUP_RE = re.compile(r'[`*|\\\[\]&<>"@]|_\b')
+
+    def __adornment(self, line):
+        match = self.ADORNMENT_RE.match(line)
+        return match.group(1) if match else None
+
+    def __title(self, lines):
+        """returns (title, style, index of the line following the title)"""
+        i = 0
+        while i < len(lines) and not lines[i].strip():
+            i += 1
+        if i + 1 >= len(lines):
+            return None, None, i
+        overline = self.__adornment(lines[i])
+        if overline and i + 2 < len(lines) and self.__adornment(lines[i + 2]) == overline:
+            return lines[i + 1].strip(), (overline, True), i + 3
+        underline = self.__adornment(lines[i + 1])
+        title = lines[i].strip()
+        long_enough = len(lines[i + 1].strip()) >= min(len(title), 4)
+        if not overline and underline and long_enough and lines[i][:1] not in (" ", "\t"):
+            return title, (underline, False), i + 2
+        return None, None, i
+
+    def __has_section(self, lines, style):
+        """checks if the body has another section with the same style as the title"""
+        char, overlined = style
+        for i in range(1, len(lines)):
+            if self.__adornment(lines[i]) != char or not lines[i - 1].strip():
+                continue
+            if self.__adornment(lines[i - 1]) is not None:
+                continue
+            if not overlined or (i >= 2 and self.__adornment(lines[i - 2]) == char):
+                return True
+        return False
+
+    def __fields(self, lines, start):
+        """returns the list of (name, value) in the field list at start and the
+        index of the line following it, or None
+        """
+        i = start
+        while i < len(lines) and not lines[i].strip():
+            i += 1
+        fields = []
+        while i < len(lines) and lines[i].strip():
+            match = self.FIELD_RE.match(lines[i])
+            if not match:
+                return None
+            value = [(match.group('value') or '').strip()]
+            i += 1
+            while i < len(lines) and lines[i][:1] in (" ", "\t") and lines[i].strip():
+                value.append(lines[i].strip())
+                i += 1
+            fields.append((match.group('name').strip().lower(), "\n".join(value).strip()))
+        return fields, i
+
+    def read(self, source_path):
+        lines = list(self.lines(source_path))
+        title, style, end = self.__title(lines)
+        if not title or self.TITLE_MARKUP_RE.search(title):
+            return None
+        if self.__has_section(lines[end:], style):
+            return None
+        parsed = self.__fields(lines, end)
+        if parsed is None:
+            return None
+        fields, end = parsed
+
+        output = {}
+        for name, value in fields:
+            # the summary is kept as written rather than rendered to html
+            if name != "summary" and self.MARKUP_RE.search(value):
+                return None
+            if name == "authors":
+                # docutils splits author lists on semicolons before commas
+                value = ",".join(author.strip() for author in value.split(";" if ";" in value else ","))
+            output[name] = self.process_metadata(name, value)
+        output.setdefault("title", title)
+        return output, "\n".join(lines[end:]).strip()
+
+
+# metadata readers for each pelican reader class name they can replace
+metadata_reader_classes = {
+    "MarkdownReader": MarkdownMetadataReader,
+    "RstReader": RstMetadataReader,
+}
+
+
+class Readers(object):
+    """reads pelican content objects, parsing only the metadata when possible.
+
+    the content objects returned by the metadata readers have no body, which is
+    all the store requires. a file is read by the full pelican reader when its
+    format has no metadata reader, when a plugin or the READERS setting replaced
+    the stock pelican reader or when the metadata reader cannot parse the file.
+
+    :param settings dict: settings dictionary from the pelican config
+    """
+
+    def __init__(self, settings):
+        from pelican.readers import Readers as PelicanReaders
+        import pelican.settings
+        # read_settings sets this global for the rst directives, it is not set
+        # when the settings come from the lapis settings cache
+        pelican.settings.PYGMENTS_RST_OPTIONS = settings.get('PYGMENTS_RST_OPTIONS', None)
+        self.__settings = settings
+        self.__readers = PelicanReaders(settings)
+        self.__metadata_readers = {}
+
+        # typogrify rewrites the title, so only pelican can produce it faithfully
+        if not settings.get('TYPOGRIFY', False):
+            for fmt, reader in self.__readers.readers.items():
+                cls = metadata_reader_classes.get(type(reader).__name__, None)
+                if cls is not None and type(reader).__module__ == "pelican.readers":
+                    self.__metadata_readers[fmt] = cls(reader)
+
+    @property
+    def extensions(self):
+        return self.__readers.extensions
+
+    def __read(self, base_path, path):
+        """returns the metadata and the body text of a file or None"""
+        from pelican.readers import default_metadata, path_metadata, parse_path_metadata
+
+        path = os.path.abspath(os.path.join(base_path, path))
+        fmt = os.path.splitext(path)[1][1:]
+        metadata_reader = self.__metadata_readers.get(fmt, None)
+        if metadata_reader is None:
+            return None
+
+        result = metadata_reader.read(path)
+        if result is None:
+            logger.debug("falling back to the pelican reader for {}".format(path))
+            return None
+        reader_metadata, text = result
+
+        source_path = os.path.relpath(path, base_path)
+        reader = self.__readers.readers[fmt]
+        metadata = default_metadata(settings=self.__settings, process=reader.process_metadata)
+        metadata.update(path_metadata(full_path=path, source_path=source_path, settings=self.__settings))
+        metadata.update(parse_path_metadata(source_path=source_path, settings=self.__settings, process=reader.process_metadata))
+        metadata['reader'] = type(reader).__name__.replace('Reader', '').lower()
+        metadata.update(reader_metadata)
+        return metadata, text
+
+    def read_metadata(self, base_path, path):
+        """returns the metadata of a file the way pelican would produce it or
+        None if the file needs the full pelican reader.
+        """
+        result = self.__read(base_path, path)
+        return result[0] if result is not None else None
+
+    def read_file(self, base_path, path, content_class, context=None):
+        """returns a content object for the file, see pelican.readers.Readers.read_file.
+
+        content objects read from the metadata alone have no html body, instead
+        the body as written is kept in their lapis_text attribute.
+        """
+        result = self.__read(base_path, path)
+        if result is None:
+            return self.__readers.read_file(base_path=base_path, path=path, content_class=content_class, context=context)
+
+        metadata, text = result
+        content = content_class(content=None, metadata=metadata, settings=self.__settings,
+                                source_path=os.path.abspath(os.path.join(base_path, path)), context=context)
+        content.lapis_text = text
+        return content
+
+
+def content_record(content, content_type):
+    """returns the record the store keeps for a pelican content object
+
+    :param content object: pelican content object
+    :param content_type str: either article or page
+    """
+    author = getattr(content, "author", None)
+    category = getattr(content, "category", None)
+    summary = content.metadata.get("summary", None)
+    text = getattr(content, "lapis_text", None)
+    if text is None:
+        # read by pelican, so the body is html
+        text = strip_html(getattr(content, "_content", None))
+        summary = strip_html(summary)
+    return ContentRecord(source_path=content.source_path,
+                         type=content_type,
+                         title=content.title,
+                         status=content.status,
+                         date_created=getattr(content, "date", None),
+                         date_modified=getattr(content, "modified", None) or getattr(content, "date", None),
+                         author=author.name if author is not None else None,
+                         category=category.name if category is not None else None,
+                         tags=tuple(tag.name for tag in getattr(content, "tags", [])),
+                         summary=summary,
+                         text=text)
+
+
+def read_record(readers, context, source_path, content_type):
+    """reads a single file, returns None if pelican would skip the file
+
+    :param readers Readers: readers used to read the file
+    :param context dict: the pelican context for the content object
+    :param source_path str: absolute path to the file
+    :param content_type str: either article or page
+    """
+    from pelican.contents import Article, Page, is_valid_content
+    content_class = Article if content_type == "article" else Page
+    try:
+        content = readers.read_file(base_path=context['PATH'], path=source_path, content_class=content_class, context=context)
+    except Exception as e:
+        logger.error("could not process {}: {}".format(source_path, e))
+        return None
+    if not is_valid_content(content, source_path):
+        return None
+    return content_record(content, content_type)
+
+
+# state of a worker process in the pool used by read_records
+_worker_context = None
+_worker_readers = None
+
+
+def _init_worker(context=None):
+    global _worker_context, _worker_readers
+    if context is not None:
+        _worker_context = context
+    _worker_readers = Readers(_worker_context)
+
+
+def _read_worker(items):
+    """reads a chunk of (source_path, content_type), returns (source_path, record, seconds) for each"""
+    import time
+    results = []
+    for source_path, content_type in items:
+        start = time.perf_counter()
+        record = read_record(_worker_readers, _worker_context, source_path, content_type)
+        results.append((source_path, record, time.perf_counter() - start))
+    return results
+
+
+def read_records(context, files, jobs=1, readers=None):
+    """reads each file, yielding (source_path, record) in the order of files.
+
+    with more than one job the files are parsed across a pool of processes,
+    which only send the compact records back to the caller. only a few chunks
+    of files are handed to the pool ahead of the caller, so the records held
+    in memory do not grow with the number of files.
+
+    :param context dict: the pelican context used to read the files
+    :param files list: (source_path, content_type) tuples to read
+    :param jobs int: number of processes to read with, 0 uses every cpu
+    :param readers Readers: readers to use when reading in this process
+    """
+    from lapis.store import record_timing, timed
+    files = list(files)
+    if jobs == 0:
+        import multiprocessing
+        jobs = multiprocessing.cpu_count()
+    jobs = min(jobs, len(files))
+
+    if jobs <= 1:
+        if readers is None:
+            readers = Readers(context)
+        for source_path, content_type in files:
+            with timed("parse", source_path):
+                record = read_record(readers, context, source_path, content_type)
+            yield source_path, record
+        return
+
+    import multiprocessing
+    global _worker_context
+    try:
+        # forked workers inherit the context, which may not be picklable
+        mp_context = multiprocessing.get_context("fork")
+        _worker_context = context
+        initargs = ()
+    except ValueError:
+        mp_context = multiprocessing.get_context()
+        initargs = (context, )
+
+    chunksize = max(1, min(64, len(files) // (jobs * 4)))
+    pool = mp_context.Pool(jobs, initializer=_init_worker, initargs=initargs)
+    try:
+        def results():
+            """yields the results of each chunk in order, keeping two chunks per worker in flight"""
+            pending = collections.deque()
+            for i in range(0, len(files), chunksize):
+                pending.append(pool.apply_async(_read_worker, (files[i:i + chunksize], )))
+                if len(pending) >= jobs * 2:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+        # the workers time each file, the events are emitted by this process
+        for chunk in results():
+            for source_path, record, seconds in chunk:
+                record_timing("parse", seconds, source_path)
+                yield source_path, record
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        _worker_context = None
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""module responsible for discovering pelican content on disk"""
+
+import fnmatch
+import os
+
+
+def walk_files(root):
+    """yields the absolute path of every file beneath root
+
+    :param root str: directory to walk, symbolic links are followed
+    """
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir():
+            yield from walk_files(entry.path)
+        else:
+            yield os.path.abspath(entry.path)
+
+
+class ContentScanner(object):
+    """walks the pelican content directory the same way the pelican generators
+    do, classifying every source file as an article or a page without reading it.
+
+    :param settings dict: settings dictionary from the pelican config
+    :param extensions list: file extensions that can be read, defaults to the
+        extensions pelican has a reader for
+    """
+
+    def __init__(self, settings, extensions=None):
+        self.__path = os.path.abspath(settings['PATH'])
+        self.__ignores = settings.get('IGNORE_FILES', [])
+        if extensions is None:
+            extensions = self.__reader_extensions(settings)
+        self.__extensions = tuple(extensions)
+        # pages are discovered first, matching the generator order used by pelican
+        self.__roots = (
+            ("page", settings.get('PAGE_PATHS', []), settings.get('PAGE_EXCLUDES', [])),
+            ("article", settings.get('ARTICLE_PATHS', []), settings.get('ARTICLE_EXCLUDES', [])),
+        )
+
+    @staticmethod
+    def __reader_extensions(settings):
+        """returns the file extensions that pelican has a reader for"""
+        from pelican.readers import Readers
+        return list(Readers(settings).extensions)
+
+    @property
+    def path(self):
+        """the absolute path to the content directory"""
+        return self.__path
+
+    def __include(self, basename):
+        if any(fnmatch.fnmatch(basename, ignore) for ignore in self.__ignores):
+            return False
+        return basename.endswith(self.__extensions)
+
+    def __exclusions(self, exclude):
+        """groups the excluded directory names by their parent directory"""
+        exclusions = {}
+        for e in exclude:
+            parent_path, subdir = os.path.split(os.path.join(self.__path, e))
+            exclusions.setdefault(os.path.normpath(parent_path), set()).add(subdir)
+        return exclusions
+
+    def __walk(self, root, exclusions):
+        """yields (path, stat) for every includable file beneath root"""
+        try:
+            entries = list(os.scandir(root))
+        except OSError:
+            return
+        excluded = exclusions.get(os.path.normpath(root), ())
+        for entry in entries:
+            if entry.is_dir():
+                if entry.name not in excluded:
+                    yield from self.__walk(entry.path, exclusions)
+            elif self.__include(entry.name):
+                try:
+                    yield entry.path, entry.stat()
+                except OSError:
+                    continue
+
+    def scan(self):
+        """yields a (source_path, content_type, stat) tuple for every content file.
+
+        source paths are absolute, which is how pelican reports them.
+        """
+        seen = set()
+        for content_type, paths, exclude in self.__roots:
+            exclusions = self.__exclusions(exclude)
+            for path in paths:
+                root = os.path.join(self.__path, path) if path else self.__path
+                if os.path.isdir(root):
+                    found = self.__walk(root, exclusions)
+                elif os.path.isfile(root) and self.__include(os.path.basename(root)):
+                    found = [(root, os.stat(root))]
+                else:
+                    found = []
+                for source_path, stat in found:
+                    source_path = os.path.abspath(source_path)
+                    if source_path not in seen:
+                        seen.add(source_path)
+                        yield source_path, content_type, stat
+
+    def content_type(self, source_path):
+        """returns the type of content that would be generated for the path, or
+        None when pelican would not consider the file content at all.
+
+        :param source_path str: path to the file being classified
+        """
+        source_path = os.path.abspath(source_path)
+        if not self.__include(os.path.basename(source_path)):
+            return None
+        relpath = os.path.relpath(source_path, self.__path)
+        if relpath.startswith(os.pardir + os.sep):
+            return None
+        parts = relpath.split(os.sep)
+        for content_type, paths, exclude in self.__roots:
+            exclusions = self.__exclusions(exclude)
+            for path in paths:
+                root = os.path.normpath(os.path.join(self.__path, path) if path else self.__path)
+                if source_path == root:
+                    return content_type
+                if not source_path.startswith(root + os.sep):
+                    continue
+                # walks the directories between the content directory and the file
+                dirpath = os.path.normpath(self.__path)
+                excluded = False
+                for part in parts[:-1]:
+                    walked = dirpath == root or dirpath.startswith(root + os.sep)
+                    if walked and part in exclusions.get(dirpath, ()):
+                        excluded = True
+                        break
+                    dirpath = os.path.join(dirpath, part)
+                if not excluded:
+                    return content_type
+        return None
@@ -4,10 +4,14 @@
 
 """defines the lapis store which is used to perform fast searches and lookups"""
 
+import collections
+import contextlib
 import os
 import logging
+import re
+import time
 from lapis.version import version
-from lapis.models import Base, Content, Site, Tag, Author, Category
+from lapis.models import Base, Content, Site, Tag, Author, Category, Fingerprint, content_tag_table
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql.expression import ClauseElement
@@ -15,6 +19,271 @@ from sqlalchemy.sql.expression import ClauseElement
 
 logger = logging.getLogger(__name__)
 
+# keeps the number of bound parameters per statement under the sqlite limit
+MAX_VARIABLES = 500
+
+# number of files a sync reads before writing their records to the store
+SYNC_CHUNK_SIZE = 256
+
+
+# pelican settings which change the records read from unchanged files
+METADATA_SETTINGS = ("AUTHOR", "DEFAULT_CATEGORY", "DEFAULT_DATE", "DEFAULT_DATE_FORMAT", "DEFAULT_LANG",
+                     "DEFAULT_METADATA", "DOCUTILS_SETTINGS", "EXTRA_PATH_METADATA", "FILENAME_METADATA",
+                     "FORMATTED_FIELDS", "MARKDOWN", "MD_EXTENSIONS", "PATH_METADATA", "READERS",
+                     "SLUGIFY_SOURCE", "SLUG_SUBSTITUTIONS", "SUMMARY_MAX_LENGTH", "TIMEZONE", "TYPOGRIFY",
+                     "TYPOGRIFY_IGNORE_TAGS", "USE_FOLDER_AS_CATEGORY")
+
+
+def _settings_digest(settings):
+    """returns a digest of the metadata settings and the version of lapis,
+    the fingerprints of a store are only valid while it does not change.
+    """
+    import hashlib
+    import json
+    values = {name: settings.get(name) for name in METADATA_SETTINGS}
+    values["lapis"] = version
+    text = json.dumps(values, sort_keys=True, default=repr)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# number of syncs running in this process, see _owner_alive
+_running_syncs = 0
+
+
+def _sync_owner():
+    """returns the owner recorded with the progress of a sync by this process"""
+    import socket
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+
+def _owner_alive(owner):
+    """returns true if the process that owns a sync is still running.
+
+    a process on another host cannot be checked, so it is assumed to be running.
+    """
+    import socket
+    if owner is None:
+        return False
+    if owner == _sync_owner():
+        return _running_syncs > 0
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except PermissionError:
+        return True
+    except (ValueError, OSError):
+        return False
+    return True
+
+
+def _chunks(items, size=MAX_VARIABLES):
+    """yields successive lists of at most size items"""
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# the phases of a command are reported as debug events of this logger, each
+# record has the phase, the seconds it took and the file it read, if any
+timings_logger = logging.getLogger("lapis.timings")
+
+
+def record_timing(phase, seconds, source_path=None):
+    """emits a timing event for a phase of a command
+
+    :param phase str: name of the phase, e.g. config, store_open, context, scan, parse, write or purge
+    :param seconds float: how long the phase took
+    :param source_path str: the file the phase read, if any
+    """
+    if timings_logger.isEnabledFor(logging.DEBUG):
+        message = "{} took {:.6f}s".format(phase, seconds) if source_path is None else "{} of {} took {:.6f}s".format(phase, source_path, seconds)
+        timings_logger.debug(message, extra={"phase": phase, "seconds": seconds, "source_path": source_path})
+
+
+@contextlib.contextmanager
+def timed(phase, source_path=None):
+    """times the body of the with statement as a phase, see record_timing"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(phase, time.perf_counter() - start, source_path)
+
+
+PhaseTiming = collections.namedtuple("PhaseTiming", ["phase", "calls", "seconds"])
+
+
+class TimingCollector(logging.Handler):
+    """collects the timing events of the phases while it is installed, so they
+    can be reported once the command is done.
+
+        collector = TimingCollector().install()
+        store.sync(settings)
+        collector.uninstall()
+        collector.phases()
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.DEBUG)
+        self.__phases = collections.OrderedDict()
+        self.__files = []
+        self.__level = None
+        self.__propagate = None
+
+    def install(self):
+        self.__level = timings_logger.level
+        self.__propagate = timings_logger.propagate
+        timings_logger.addHandler(self)
+        timings_logger.setLevel(logging.DEBUG)
+        # the events are only printed with the other debug messages
+        timings_logger.propagate = logging.getLogger().isEnabledFor(logging.DEBUG)
+        return self
+
+    def uninstall(self):
+        timings_logger.removeHandler(self)
+        timings_logger.setLevel(self.__level)
+        timings_logger.propagate = self.__propagate
+
+    def emit(self, record):
+        phase = getattr(record, "phase", None)
+        if phase is None:
+            return
+        calls, seconds = self.__phases.get(phase, (0, 0.0))
+        self.__phases[phase] = (calls + 1, seconds + record.seconds)
+        if record.source_path is not None:
+            self.__files.append((record.seconds, phase, record.source_path))
+
+    def phases(self):
+        """returns the PhaseTiming of each phase, in the order they first ran"""
+        return [PhaseTiming(phase, calls, seconds) for phase, (calls, seconds) in self.__phases.items()]
+
+    def slowest(self, n=10):
+        """returns the n slowest files as (seconds, phase, source_path) tuples"""
+        return sorted(self.__files, key=lambda timing: timing[0], reverse=True)[:n]
+
+
+# full-text index of each content, its rowid is the id of the content
+FTS_TABLE = "content_fts"
+FTS_COLUMNS = ("title", "summary", "body")
+# bm25 weights of the title, summary and body when ranking matches
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+# marks the matched words in a snippet, the printer replaces them for display
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+# trigram index of each casefolded title, its rowid is the id of the content
+TRIGRAM_TABLE = "title_trigram"
+# the virtual tables created when sqlite supports them, with their definition
+SEARCH_TABLES = ((FTS_TABLE, "fts5({})".format(", ".join(FTS_COLUMNS))),
+                 (TRIGRAM_TABLE, "fts5(title, tokenize='trigram')"))
+
+
+# the number of content with a tag, author or category
+AttributeCount = collections.namedtuple("AttributeCount", ["name", "count"])
+
+# the sql of a search with the plan sqlite chose for it, see Store.explain
+QueryPlan = collections.namedtuple("QueryPlan", ["sql", "parameters", "plan", "rows", "first_seconds", "seconds"])
+
+# the number of content created in a month or year, see Store.archive
+ArchiveCount = collections.namedtuple("ArchiveCount", ["year", "month", "count"])
+
+# the columns of a content returned by a projected search, without the session
+# and relationships of the Content model
+ContentRow = collections.namedtuple("ContentRow", ["id", "source_path", "title", "type", "status", "date_created", "date_modified", "author", "category", "tags", "snippet"])
+# separates the tag names aggregated for a ContentRow
+TAG_SEPARATOR = "\x1f"
+# number of rows fetched at a time when streaming search results
+STREAM_BATCH = 500
+# the column each sort orders by, and whether it is descending
+SORT_KEYS = {"date": (Content.date_created, True),
+             "modified": (Content.date_modified, True),
+             "title": (Content.title_folded, False)}
+CURSOR_DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def cursor_for(content, sort="date"):
+    """returns the cursor of a search result, passing it to Store.search returns
+    the results that follow it in the same sort.
+
+    :param content object: a ContentRow or Content model returned by a search
+    :param sort str: the sort of the search which returned the content
+    :rtype str: an opaque cursor
+    """
+    import base64
+    import json
+    if sort == "title":
+        value = fold(content.title)
+    else:
+        value = content.date_modified if sort == "modified" else content.date_created
+        value = value.strftime(CURSOR_DATE_FORMAT) if value is not None else None
+    data = json.dumps([sort, value, content.id]).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def _decode_cursor(cursor, sort):
+    """returns the (sort key value, content id) of a cursor from cursor_for"""
+    import base64
+    import binascii
+    import json
+    from datetime import datetime
+    try:
+        cursor_sort, value, content_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        if value is not None and cursor_sort != "title":
+            value = datetime.strptime(value, CURSOR_DATE_FORMAT)
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("invalid cursor '{}'".format(cursor))
+    if cursor_sort != sort:
+        raise ValueError("the cursor is for results sorted by {}, not {}".format(cursor_sort, sort))
+    return value, int(content_id)
+
+
+def _after(key, descending, value, content_id):
+    """returns the clause selecting the rows after (value, content_id) when
+    ordering by key and then id. sqlite orders nulls first.
+    """
+    from sqlalchemy import and_, or_
+    if descending:
+        if value is None:
+            return and_(key.is_(None), Content.id < content_id)
+        return or_(key < value, and_(key == value, Content.id < content_id), key.is_(None))
+    if value is None:
+        return or_(key.isnot(None), and_(key.is_(None), Content.id > content_id))
+    return or_(key > value, and_(key == value, Content.id > content_id))
+
+
+def _regexp(pattern, value):
+    """implements the sqlite REGEXP operator with python regular expressions"""
+    if value is None:
+        return False
+    return re.search(pattern, value) is not None
+
+
+def _on_connect(dbapi_connection, connection_record):
+    dbapi_connection.create_function("regexp", 2, _regexp)
+
+
+def fold(value):
+    """returns the value normalized for case-insensitive comparisons"""
+    import unicodedata
+    if value is None:
+        return None
+    return unicodedata.normalize("NFKC", value).casefold()
+
+
+def _fts_query(text):
+    """returns an fts5 query matching every word of the text.
+
+    each word is quoted, so punctuation in the text is matched literally
+    rather than parsed as fts5 syntax. a trailing * keeps its prefix meaning.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*") if prefix else word
+        terms.append('"{}"{}'.format(word.replace('"', '""'), "*" if prefix else ""))
+    return " ".join(terms)
+
 
 class Store(object):
     """the store object contains structured data about the metadata of pelican
@@ -24,22 +293,80 @@ class Store(object):
     __version__ = version
 
     def __init__(self, path):
+        start = time.perf_counter()
         self.__created = False
+        self.__path = path
+        self.__postings = None
+        self.__json = None
         conn_str = "sqlite:///" + path
         self.__engine = create_engine(conn_str)
+        from sqlalchemy import event
+        event.listen(self.__engine, "connect", _on_connect)
         Base.metadata.create_all(self.__engine)
         Base.metadata.bind = self.__engine
         self.__session = sessionmaker(self.__engine)()
+        from lapis.migrations import migrate, SCHEMA_VERSION
+        self.__search_tables = migrate(self.__session)
 
         if self.site is None:
             self.__created = True
-            site = Site(version=Store.__version__)
+            site = Site(version=Store.__version__, schema_version=SCHEMA_VERSION)
             self.__session.add(site)
             self.__session.commit()
+        record_timing("store_open", time.perf_counter() - start)
 
     def __del__(self):
         self.__session.close()
 
+    @property
+    def postings_path(self):
+        """path of the file holding the posting lists of the store"""
+        return self.__path + ".postings"
+
+    def postings(self):
+        """returns the posting lists of the content, which are rebuilt when the
+        database was written since they were built.
+
+        :rtype PostingIndex: the posting lists of the store
+        """
+        from lapis.postings import PostingIndex, database_stamp
+        stamp = database_stamp(self.__path)
+        if self.__postings is not None and stamp is not None and self.__postings.stamp == stamp:
+            return self.__postings
+
+        postings = PostingIndex.load(self.postings_path)
+        if postings is None or stamp is None or postings.stamp != stamp:
+            logger.debug("building the posting lists of {}".format(self.__path))
+            postings = PostingIndex.build(self.__session, stamp)
+            if stamp is not None:
+                postings.save(self.postings_path)
+        self.__postings = postings
+        return postings
+
+    def __ids_clause(self, bitmap):
+        """returns a clause restricting content to the ids in the bitmap"""
+        import json
+        from sqlalchemy import select, func, column
+        from lapis.postings import ids
+        return Content.id.in_(select([column("value")]).select_from(func.json_each(json.dumps(ids(bitmap)))))
+
+    @property
+    def __has_json(self):
+        """true if sqlite has the json1 functions used to pass lists of ids"""
+        if self.__json is None:
+            from sqlalchemy.exc import OperationalError
+            try:
+                self.__session.execute("SELECT value FROM json_each('[]')")
+                self.__json = True
+            except OperationalError:
+                self.__json = False
+        return self.__json
+
+    @property
+    def full_text(self):
+        """true if the store has a full-text index of the content"""
+        return FTS_TABLE in self.__search_tables
+
     @property
     def created(self):
         """returns true if the site db was just regenerated"""
@@ -47,12 +374,32 @@ class Store(object):
 
     @property
     def schema_changed(self):
-        return self.site.version != Store.__version__
+        """returns true if the store was written by a newer lapis, whose schema cannot be migrated"""
+        from lapis.migrations import SCHEMA_VERSION
+        return (self.site.schema_version or 0) > SCHEMA_VERSION
+
+    @property
+    def interrupted(self):
+        """returns true if the last sync stopped before it finished and its process is gone"""
+        site = self.site
+        return site.sync_remaining is not None and not _owner_alive(site.sync_owner)
+
+    @property
+    def syncing(self):
+        """returns true if a sync of the store is running, in this or another process"""
+        site = self.site
+        return site.sync_remaining is not None and _owner_alive(site.sync_owner)
 
     @property
     def site(self):
         return self.__session.query(Site).first()
 
+    def refresh(self):
+        """ends the current transaction, so that the next query sees changes
+        committed by other processes since. anything uncommitted is discarded.
+        """
+        self.__session.rollback()
+
     def get_or_create(self, model, defaults=None, **kwargs):
         instance = self.__session.query(model).filter_by(**kwargs).first()
         if instance:
@@ -65,118 +412,596 @@ class Store(object):
             self.__session.commit()
             return instance, True
 
-    def __get_content_type(self, content):
-        """returns the enum representing the type of content parsed"""
-        from pelican.contents import Article
-        cls = type(content)
-        if cls == Article:
-            return "article"
-        return "page"
+    def __name_ids(self, names=None):
+        """returns the name to id lookup for tags, authors and categories.
+
+        :param names iterable: restricts the lookup to these names, otherwise
+            every row is loaded so the lookup can be reused for a whole sync
+        :rtype dict: model to dictionary of name to id
+        """
+        caches = {}
+        for model in (Tag, Author, Category):
+            query = self.__session.query(model.name, model.id)
+            if names is None:
+                caches[model] = dict(query)
+            else:
+                caches[model] = {}
+                for chunk in _chunks(set(names)):
+                    caches[model].update(query.filter(model.name.in_(chunk)))
+        return caches
+
+    def __intern(self, model, cache, names):
+        """adds the names missing from the cache to the model's table
+
+        :param model class: one of Tag, Author or Category
+        :param cache dict: name to id lookup of the model, updated in place
+        :param names iterable: names which must have an id
+        """
+        missing = sorted(set(name for name in names if name is not None and name not in cache))
+        if missing:
+            self.__session.execute(model.__table__.insert(), [{"name": name} for name in missing])
+            for chunk in _chunks(missing):
+                cache.update(self.__session.query(model.name, model.id).filter(model.name.in_(chunk)))
+
+    def __sync_records(self, records, caches=None):
+        """writes content records to the database in bulk, updating the rows
+        that already exist and inserting the others. the caller must commit.
+
+        :param records list: the ContentRecords that should be written
+        :param caches dict: name to id lookups from __name_ids, which are
+            updated with any names that are added
+        :rtype bool: true if any content was written
+        """
+        records = list(records)
+        if not records:
+            return False
+
+        if caches is None:
+            names = set(record.author for record in records)
+            names.update(record.category for record in records)
+            names.update(tag for record in records for tag in record.tags)
+            caches = self.__name_ids(names)
+        self.__intern(Tag, caches[Tag], (tag for record in records for tag in record.tags))
+        self.__intern(Author, caches[Author], (record.author for record in records))
+        self.__intern(Category, caches[Category], (record.category for record in records))
+
+        content_table = Content.__table__
+        existing = {}
+        for chunk in _chunks(record.source_path for record in records):
+            existing.update(self.__session.query(Content.source_path, Content.id).filter(Content.source_path.in_(chunk)))
+
+        inserts = []
+        updates = []
+        for record in records:
+            row = dict(source_path=record.source_path,
+                       title=record.title,
+                       title_folded=fold(record.title),
+                       date_created=record.date_created,
+                       date_modified=record.date_modified,
+                       type=record.type,
+                       status=record.status,
+                       author_id=caches[Author].get(record.author, None),
+                       category_id=caches[Category].get(record.category, None))
+            if record.source_path in existing:
+                row["_id"] = existing[record.source_path]
+                updates.append(row)
+            else:
+                inserts.append(row)
+
+        if updates:
+            from sqlalchemy import bindparam
+            values = {key: bindparam(key) for key in updates[0] if key != "_id"}
+            self.__session.execute(content_table.update().where(content_table.c.id == bindparam("_id")).values(**values), updates)
+        if inserts:
+            self.__session.execute(content_table.insert(), inserts)
+            for chunk in _chunks(row["source_path"] for row in inserts):
+                existing.update(self.__session.query(Content.source_path, Content.id).filter(Content.source_path.in_(chunk)))
+
+        # replaces the tags and the full-text entries of every written content
+        content_ids = [existing[record.source_path] for record in records]
+        for chunk in _chunks(content_ids):
+            self.__session.execute(content_tag_table.delete().where(content_tag_table.c.content_id.in_(chunk)))
+        content_tags = [dict(content_id=existing[record.source_path], tag_id=caches[Tag][tag])
+                        for record in records for tag in set(record.tags)]
+        if content_tags:
+            self.__session.execute(content_tag_table.insert(), content_tags)
+        self.__delete_search_rows(content_ids)
+        if FTS_TABLE in self.__search_tables:
+            self.__session.execute("INSERT INTO {} (rowid, title, summary, body) VALUES (:id, :title, :summary, :body)".format(FTS_TABLE),
+                                   [dict(id=existing[record.source_path], title=record.title, summary=record.summary, body=record.text) for record in records])
+        if TRIGRAM_TABLE in self.__search_tables:
+            self.__session.execute("INSERT INTO {} (rowid, title) VALUES (:id, :title)".format(TRIGRAM_TABLE),
+                                   [dict(id=existing[record.source_path], title=fold(record.title)) for record in records])
+        return True
+
+    def __delete_search_rows(self, content_ids):
+        """removes the content ids from the virtual tables"""
+        for name in self.__search_tables:
+            for chunk in _chunks(content_ids):
+                self.__session.execute("DELETE FROM {} WHERE rowid IN ({})".format(name, ", ".join(str(int(content_id)) for content_id in chunk)))
+
+    @staticmethod
+    def __digest(source_path):
+        """returns the sha1 hex digest of the file at the given path"""
+        import hashlib
+        sha1 = hashlib.sha1()
+        with open(source_path, "rb") as f:
+            for block in iter(lambda: f.read(65536), b""):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    def __stamp(self, source_path, stat=None, checksum=False):
+        """returns the fingerprint values for a file as they are currently on disk"""
+        if stat is None:
+            stat = os.stat(source_path)
+        digest = self.__digest(source_path) if checksum else None
+        return dict(source_path=source_path, mtime=stat.st_mtime, size=stat.st_size, digest=digest)
+
+    def __save_fingerprints(self, stamps):
+        """inserts or updates the fingerprint rows for the given stamps"""
+        if not stamps:
+            return
+        table = Fingerprint.__table__
+        for chunk in _chunks(stamp["source_path"] for stamp in stamps):
+            self.__session.execute(table.delete().where(table.c.source_path.in_(chunk)))
+        self.__session.execute(table.insert(), stamps)
+
+    def __delete_paths(self, source_paths, fingerprints=True):
+        """removes the content recorded for each source path
+
+        :param source_paths iterable: absolute source paths to remove
+        :param fingerprints bool: also forget the fingerprints of the paths
+        """
+        content_table = Content.__table__
+        for chunk in _chunks(source_paths):
+            content_ids = self.__session.query(Content.id).filter(Content.source_path.in_(chunk))
+            self.__delete_search_rows([row[0] for row in content_ids])
+            self.__session.execute(content_tag_table.delete().where(content_tag_table.c.content_id.in_(content_ids.subquery())))
+            self.__session.execute(content_table.delete().where(content_table.c.source_path.in_(chunk)))
+            if fingerprints:
+                self.__session.execute(Fingerprint.__table__.delete().where(Fingerprint.__table__.c.source_path.in_(chunk)))
+
+    def __check_settings(self, settings):
+        """forgets every fingerprint when the metadata settings or the version
+        of lapis changed since they were recorded, so that every file is read
+        again. the git state is forgotten too, so the next sync walks the
+        content directory.
+        """
+        digest = _settings_digest(settings)
+        site = self.site
+        if site.settings_digest == digest:
+            return
+        if site.settings_digest is not None:
+            logger.info("the pelican settings or the version of lapis changed, every file will be read again")
+        self.__session.execute(Fingerprint.__table__.delete())
+        site.git_commit = None
+        site.git_dirty = None
+        site.settings_digest = digest
+        self.__session.commit()
 
-    def __sync_content(self, content):
-        """syncs content with the database by either updating an existing
-        content or adding it to the database if it doesn't exist
+    def __changed_files(self, found, checksum=False, candidates=None):
+        """compares the files found in the content directory with the recorded fingerprints.
 
-        :param content object: content class that should be updated in the database
+        :param found iterable: (source_path, content_type, stat) of the content files on disk
+        :param checksum bool: confirm changes with a content hash when sizes match
+        :param candidates set: when given, the only source paths which may have
+            changed, found must then be the candidates which exist
+        :rtype tuple: (changed, touched, removed) where changed is a list of
+            (source_path, content_type, stamp) tuples that must be re-read, touched
+            is a list of stamps for unchanged files whose mtime moved and removed
+            is the set of source paths which no longer exist
         """
-        updated = False
-        db_content = self.__session.query(Content).filter(Content.source_path == content.source_path).first()
-        if db_content is None:
-            tag_list = getattr(content, "tags", [])
-            tags = [self.get_or_create(Tag, name=tag.name)[0] for tag in tag_list]
-            author = self.get_or_create(Author, name=content.author.name)[0]
-            category = self.get_or_create(Category, name=content.category.name)[0]
-            content_type = self.__get_content_type(content)
-            status = content.status
-            date_created = content.date
-            content = Content(source_path=content.source_path, status=status, date_created=date_created, title=content.title, tags=tags, type=content_type, author=author, category=category)
-            self.__session.add(content)
-            self.__session.commit()  # TODO: This might be sub-optimal, we can maybe commit after all the adds?
-            updated = True
+        fingerprint_query = self.__session.query(Fingerprint.source_path, Fingerprint.mtime, Fingerprint.size, Fingerprint.digest)
+        content_query = self.__session.query(Content.source_path)
+        if candidates is None:
+            fingerprints = {row[0]: row[1:] for row in fingerprint_query}
+            indexed = set(fingerprints)
+            indexed.update(row[0] for row in content_query)
         else:
-            db_content.title = content.title
-            tag_list = getattr(content, "tags", [])
-            db_content.tags = [self.get_or_create(Tag, name=tag.name)[0] for tag in tag_list]
-            db_content.author = self.get_or_create(Author, name=content.author.name)[0]
-            db_content.category = self.get_or_create(Category, name=content.category.name)[0]
-            db_content.date_created = content.date
-            db_content.status = content.status
-            self.__session.commit()
-            updated = True
+            fingerprints = {}
+            indexed = set()
+            for chunk in _chunks(candidates):
+                fingerprints.update((row[0], row[1:]) for row in fingerprint_query.filter(Fingerprint.source_path.in_(chunk)))
+                indexed.update(row[0] for row in content_query.filter(Content.source_path.in_(chunk)))
+            indexed.update(fingerprints)
 
-        return updated
+        changed = []
+        touched = []
+        for source_path, content_type, stat in found:
+            indexed.discard(source_path)
+            recorded = fingerprints.get(source_path, None)
+            if recorded is not None:
+                mtime, size, digest = recorded
+                if mtime == stat.st_mtime and size == stat.st_size:
+                    continue
+                if checksum and digest and size == stat.st_size:
+                    stamp = self.__stamp(source_path, stat, checksum=True)
+                    if stamp["digest"] == digest:
+                        touched.append(stamp)
+                        continue
+                    changed.append((source_path, content_type, stamp))
+                    continue
+            changed.append((source_path, content_type, self.__stamp(source_path, stat, checksum=checksum)))
+        return changed, touched, indexed
 
     def sync_file(self, settings, filename, content_type):
         """syncs a single file to the database."""
-        context = settings.copy()
-        from pelican.readers import Readers
-        from pelican.contents import Article, Page
+        from lapis.readers import Readers, read_record
+        with timed("context"):
+            context = settings.copy()
+            readers = Readers(context)
+        source_path = os.path.abspath(filename)
+        stamp = self.__stamp(source_path)
+        with timed("parse", source_path):
+            record = read_record(readers, context, source_path, content_type)
+        with timed("write"):
+            if record is not None:
+                self.__sync_records([record])
+            else:
+                self.__delete_paths([source_path], fingerprints=False)
+            self.__save_fingerprints([stamp])
+            self.__session.commit()
 
-        readers = Readers(context)
-        content_class = Article if content_type == "article" else Page
-        content = readers.read_file(base_path=settings['PATH'], path=filename, content_class=content_class, context=context)
-        self.__sync_content(content)
+    def remove(self, source_paths):
+        """removes the content stored for each of the source paths
 
-    def purge(self, source_paths=None):
+        :param source_paths list: absolute source paths of the content to remove
+        """
+        self.__delete_paths(source_paths)
+        self.__session.commit()
+
+    def purge(self, source_paths=None, root=None):
         """Will purge the database of any files which do not exist.
 
+        the indexed source paths are compared with a single walk of root, so
+        files are not checked one at a time. indexed files outside of root are
+        checked individually. sync_files purges the directories it is given
+        the same way.
+
         :param source_paths list: hint of source paths to skip when determining if they should be purged
+        :param root str: directory containing the content, usually the pelican PATH
         """
-        if source_paths is None:
-            content_to_check = self.__session.query(Content)
-        else:
-            content_to_check = self.__session.query(Content).filter(~Content.source_path.in_(source_paths))
-        content_to_remove = [content for content in content_to_check if not os.path.exists(content.source_path)]
-        for content in content_to_remove:
-            self.__session.delete(content)
-        self.__session.commit()
+        with timed("purge"):
+            self.__purge(source_paths, root)
+
+    def __purge(self, source_paths, root):
+        from lapis.scanner import walk_files
+        skip = set(source_paths or [])
+        indexed = set(row[0] for row in self.__session.query(Content.source_path)) - skip
+        if not indexed:
+            return
 
-    def sync(self, settings, file=None):
+        missing = set()
+        if root is not None:
+            under_root = self.__beneath(indexed, root)
+            missing.update(under_root - set(walk_files(os.path.abspath(root))))
+            indexed -= under_root
+        missing.update(path for path in indexed if not os.path.exists(path))
+        self.remove(missing)
+
+    @staticmethod
+    def __beneath(paths, root):
+        """returns the paths which are beneath the directory root"""
+        prefix = os.path.join(os.path.abspath(root), "")
+        return set(path for path in paths if path.startswith(prefix))
+
+    def sync(self, settings, file=None, checksum=False, jobs=1, git=False):
         """syncs the stores metadata with actual filesystem metadata.
 
-        this will attempt to search all available content, syncing un-tracked
-        files and updating tracked files that have changed.
+        the content directory is walked and compared against the fingerprint
+        (mtime, size and optionally a content hash) recorded for each file the
+        last time it was read. only files that were added or changed are read
+        by pelican, and files which were removed are dropped from the store.
+        every file is read again when the pelican settings which change the
+        metadata of content, or the version of lapis, changed since the
+        fingerprints were recorded.
+
+        with git, the commit and the files which differed from it are recorded
+        in the site. the next sync only compares the files changed since then
+        according to git instead of walking the content directory. the first
+        sync, and any sync outside a repository, walks the directory.
 
         :param settings: Settings dictionary from the pelican config
-        :param file: Restricts syncing to the file specification
+        :param file: Restricts syncing to the file specification, a path or a
+            list of paths, see sync_files
+        :param checksum bool: when a file's mtime changed but its size did not,
+            compare a hash of the file before deciding to read it again
+        :param jobs int: number of processes used to read files, 0 uses every
+            cpu. the records read are written by this process.
+        :param git bool: find the files which changed with git
+
+        the files read are committed a chunk at a time with the progress of the
+        sync, so a sync that is interrupted resumes where it stopped: the files
+        it committed have their fingerprints and are not read again.
         """
-        from pelican.generators import PagesGenerator, ArticlesGenerator
-        generator_classes = [PagesGenerator, ArticlesGenerator]
-
-        context = settings.copy()
-        context['filenames'] = {}
-        context['localsiteurl'] = settings['SITEURL']
-        generators = [
-            cls(
-                context=context,
-                settings=settings,
-                path=settings['PATH'],
-                theme=settings['THEME'],
-                output_path=settings['OUTPUT_PATH']
-            ) for cls in generator_classes
-        ]
-
-        for g in generators:
-            if hasattr(g, 'generate_context'):
-                g.generate_context()
-
-        updated = False
-
-        source_paths = []
-        for filename, content in context['filenames'].items():
-            source_paths.append(content.source_path)
-            content_updated = self.__sync_content(content)
-            updated = content_updated or updated
-
-        self.purge(source_paths)
-
-        if self.schema_changed:
+        if file is not None:
+            return self.sync_files(settings, [file] if isinstance(file, str) else file, jobs=jobs)
+
+        from lapis.scanner import ContentScanner
+        context, readers = self.__reader_context(settings)
+        self.__check_settings(settings)
+        with timed("scan"):
+            scanner = ContentScanner(settings, extensions=readers.extensions)
+            state, candidates = self.__git_changes(scanner.path) if git else (None, None)
+            found = scanner.scan() if candidates is None else self.__candidate_files(scanner, candidates)
+            changed, touched, removed = self.__changed_files(found, checksum=checksum, candidates=candidates)
+        logger.debug("sync found {} changed and {} removed files".format(len(changed), len(removed)))
+        if self.interrupted:
+            logger.warning("resuming an interrupted sync, {} files were already synced and {} remain".format(self.site.sync_done, len(changed)))
+        elif self.syncing:
+            logger.warning("another lapis process ({}) is syncing the store".format(self.site.sync_owner))
+
+        global _running_syncs
+        _running_syncs += 1
+        try:
+            updated = self.__write(self.__read_chunks(context, readers, changed, jobs=jobs), removed, touched, progress=len(changed))
+        finally:
+            _running_syncs -= 1
+
+        if state is not None:
+            import json
             site = self.site
+            site.git_commit = state.commit
+            site.git_dirty = json.dumps(sorted(path for path in state.dirty if scanner.content_type(path) is not None))
+            self.__session.commit()
+        return updated
+
+    def __git_changes(self, path):
+        """asks git which files changed since the last sync with git.
+
+        the state is read before the files, so files changed during the sync
+        are compared again by the next one.
+
+        :param path str: the content directory
+        :rtype tuple: (state, candidates) the current GitState, None outside a
+            repository, and the source paths which may have changed, None when
+            the content directory must be walked
+        """
+        import json
+        from lapis.git import GitState
+        state = GitState.read(path)
+        if state is None:
+            logger.info("{} is not in a git repository, scanning it instead".format(path))
+            return None, None
+        site = self.site
+        if site.git_commit is None:
+            return state, None
+        candidates = state.changed_since(site.git_commit, json.loads(site.git_dirty or "[]"))
+        if candidates is None:
+            logger.info("git does not know commit {} of the last sync, scanning the content directory instead".format(site.git_commit))
+        return state, candidates
+
+    @staticmethod
+    def __candidate_files(scanner, candidates):
+        """yields (source_path, content_type, stat) for the candidates which are content and exist"""
+        for source_path in sorted(candidates):
+            content_type = scanner.content_type(source_path)
+            if content_type is None:
+                continue
+            try:
+                stat = os.stat(source_path)
+            except OSError:
+                continue
+            yield source_path, content_type, stat
+
+    def sync_files(self, settings, source_paths, jobs=1):
+        """re-indexes exactly the given files in one transaction, without
+        scanning the content directory.
+
+        files which exist are read again whatever their fingerprint, files
+        which no longer exist are removed from the store and files pelican
+        would not consider content are ignored. a directory stands for the
+        content beneath it, which is purged the same way as purge with root.
+
+        :param settings: Settings dictionary from the pelican config
+        :param source_paths iterable: paths of the files or directories,
+            relative to the current directory or absolute
+        :param jobs int: number of processes used to read files, 0 uses every cpu
+        :rtype bool: true if any content was written or removed
+        """
+        from lapis.scanner import ContentScanner, walk_files
+        context, readers = self.__reader_context(settings)
+        self.__check_settings(settings)
+        scanner = ContentScanner(settings, extensions=readers.extensions)
+
+        source_paths = set(os.path.abspath(path) for path in source_paths)
+        # a directory, or a deleted directory with indexed content beneath it,
+        # is replaced by the files found with a single walk of it and the
+        # indexed content beneath it
+        found = set()
+        if any(not os.path.isfile(path) for path in source_paths):
+            indexed = set(row[0] for row in self.__session.query(Content.source_path))
+            for directory in [path for path in source_paths if not os.path.isfile(path)]:
+                beneath = self.__beneath(indexed, directory)
+                if os.path.isdir(directory) or beneath:
+                    source_paths.remove(directory)
+                    files = set(walk_files(directory))
+                    found.update(files)
+                    source_paths.update(beneath - files)
+
+        changed = []
+        removed = []
+        for source_path in sorted(source_paths | found):
+            content_type = scanner.content_type(source_path)
+            if content_type is None:
+                if source_path not in found:
+                    logger.warning("{} is not content of the site, it was not synced".format(source_path))
+                continue
+            try:
+                stat = os.stat(source_path)
+            except OSError:
+                removed.append(source_path)
+                continue
+            changed.append((source_path, content_type, self.__stamp(source_path, stat)))
+        logger.debug("syncing {} files and removing {}".format(len(changed), len(removed)))
+        return self.__write(self.__read_chunks(context, readers, changed, jobs=jobs), removed)
+
+    @staticmethod
+    def __reader_context(settings):
+        """returns the pelican context and the readers used to read content"""
+        from lapis.readers import Readers
+        with timed("context"):
+            context = settings.copy()
+            context['filenames'] = {}
+            context['localsiteurl'] = settings['SITEURL']
+            readers = Readers(context)
+        return context, readers
+
+    @staticmethod
+    def __read_chunks(context, readers, changed, jobs=1, size=None):
+        """reads the changed files and groups their records in chunks, so that
+        only the records of one chunk are held in memory. the files are read
+        by a single call to read_records, which keeps the pool of readers busy
+        across chunks.
+
+        :param changed list: (source_path, content_type, stamp) of the files to read
+        :param size int: number of files in each chunk, SYNC_CHUNK_SIZE by default
+        :rtype generator: yields (records, skipped, stamps) for each chunk, see __write
+        """
+        from lapis.readers import read_records
+        size = size or SYNC_CHUNK_SIZE
+        stamps = {source_path: stamp for source_path, content_type, stamp in changed}
+        files = [(source_path, content_type) for source_path, content_type, stamp in changed]
+        records = []
+        skipped = []
+        chunk_stamps = []
+        for source_path, record in read_records(context, files, jobs=jobs, readers=readers):
+            if record is not None:
+                records.append(record)
+            else:
+                skipped.append(source_path)
+            chunk_stamps.append(stamps.pop(source_path))
+            if len(chunk_stamps) >= size:
+                yield records, skipped, chunk_stamps
+                records = []
+                skipped = []
+                chunk_stamps = []
+        if chunk_stamps:
+            yield records, skipped, chunk_stamps
+
+    def write_records(self, records, complete=False, settings=None):
+        """writes the records of content that was already read, by the pelican
+        plugin during a build, in one transaction. the fingerprints of the
+        files are recorded so that the next sync does not read them again.
+
+        :param records iterable: the ContentRecords to write
+        :param complete bool: the records are all the content of the site, the
+            content of every other file is removed and its file read again by
+            the next sync
+        :param settings: Settings dictionary the records were read with, when
+            they differ from the settings of the fingerprints every other file
+            is read again by the next sync
+        :rtype bool: true if any content was written or removed
+        """
+        records = list(records)
+        if settings is not None:
+            self.__check_settings(settings)
+        removed = set()
+        if complete:
+            removed = set(row[0] for row in self.__session.query(Content.source_path))
+            removed.difference_update(record.source_path for record in records)
+
+        def chunks():
+            for chunk in _chunks(records, SYNC_CHUNK_SIZE):
+                stamps = []
+                for record in chunk:
+                    try:
+                        stamps.append(self.__stamp(record.source_path))
+                    except OSError:
+                        continue
+                yield chunk, [], stamps
+        return self.__write(chunks(), removed)
+
+    def __write(self, chunks, removed, touched=(), progress=None):
+        """writes each chunk as soon as it is produced, then removes the
+        removed paths. the chunks are written in a single transaction, which
+        is committed once they are all written, unless progress is given.
+
+        :param chunks iterable: (records, skipped, stamps) where records are the
+            ContentRecords to write, skipped the source paths pelican did not
+            read as content and stamps the fingerprints of the files
+        :param removed iterable: source paths whose content is removed
+        :param touched list: fingerprints of files which did not change
+        :param progress int: number of files read by the chunks. when given,
+            each chunk is committed as a checkpoint and the files done and
+            remaining are recorded in the site, with the process that owns the
+            sync, until the last one is written.
+        :rtype bool: true if any content was written or removed
+        """
+        # the counters are kept here, another process may change the row
+        owner = _sync_owner()
+        site = self.site
+        done = site.sync_done or 0
+        remaining = progress
+
+        def checkpoint():
+            site.sync_done = done
+            site.sync_remaining = remaining
+            site.sync_owner = owner
+            self.__session.commit()
+
+        if progress:
+            checkpoint()
+
+        updated = bool(removed)
+        caches = None
+        for records, skipped, stamps in chunks:
+            with timed("write"):
+                if records and caches is None:
+                    caches = self.__name_ids()
+                updated = self.__sync_records(records, caches) or updated
+
+                # files pelican can no longer read are kept out of the store, but their
+                # fingerprint is recorded so they are not read again until they change
+                self.__delete_paths(skipped, fingerprints=False)
+                self.__save_fingerprints(stamps)
+                if progress:
+                    done += len(stamps)
+                    remaining = max(0, remaining - len(stamps))
+                    checkpoint()
+        with timed("purge"):
+            self.__delete_paths(removed)
+        with timed("write"):
+            self.__save_fingerprints(list(touched))
+            # the progress of a sync another process is running is kept
+            if progress is not None and (site.sync_owner == owner or not _owner_alive(site.sync_owner)):
+                site.sync_done = None
+                site.sync_remaining = None
+                site.sync_owner = None
+            self.__session.commit()
+
+        # the version of lapis that last synced the store
+        if site.version != Store.__version__:
             site.version = Store.__version__
             self.__session.commit()
 
         return updated
 
+    def __counts_query(self, entity, pattern, order_by="name", cls=Tag, show_zero=True, reverse=False):
+        """returns a query of (entity, count) for the objs matching the pattern,
+        with the content of each obj counted in a single GROUP BY.
+        """
+        from sqlalchemy import func
+        if cls is Tag:
+            count = func.count(content_tag_table.c.content_id)
+            query = self.__session.query(entity, count).select_from(cls).outerjoin(content_tag_table, content_tag_table.c.tag_id == cls.id)
+        else:
+            foreign_key = Content.author_id if cls is Author else Content.category_id
+            count = func.count(Content.id)
+            query = self.__session.query(entity, count).select_from(cls).outerjoin(Content, foreign_key == cls.id)
+        query = query.group_by(cls.id)
+
+        if pattern:
+            query = query.filter(cls.name.op("REGEXP")(pattern))
+        if not show_zero:
+            query = query.having(count > 0)
+
+        if order_by == "content":
+            order = [count.asc(), cls.name.desc()] if reverse else [count.desc(), cls.name.asc()]
+        else:
+            order = [cls.name.desc()] if reverse else [cls.name.asc()]
+        return query.order_by(*order)
+
     def list(self, pattern, order_by="name", cls=Tag):
         """fetches the list of objs which match the given pattern
 
@@ -185,23 +1010,172 @@ class Store(object):
 
         :yields cls: the obj that matches the pattern
         """
-        import re
+        for obj, count in self.__counts_query(cls, pattern, order_by=order_by, cls=cls):
+            yield obj
 
-        pattern = re.compile(pattern)
-        order_by_prop = cls.name
-        objs = self.__session.query(cls)
+    def counts(self, pattern, order_by="name", cls=Tag, show_zero=False, reverse=False):
+        """counts the content of each obj which matches the given pattern,
+        without loading the content.
 
-        # TODO: might be a way to more efficiently query here, by foreign key
-        # length??
+        :param pattern str: regular expression which returns the objs which match the pattern.
+        :param order_by str: choice of ['name', 'content'], content orders by the count descending
+        :param cls class: one of Tag, Author or Category
+        :param show_zero bool: includes the objs which have no content
+        :param reverse bool: reverses the order
 
-        if order_by == "content":
-            objs = sorted(objs, key=lambda x: -len(x.content))
-        else:
-            objs = objs.order_by(order_by_prop)
+        :yields AttributeCount: the name and the count of each obj that matches the pattern
+        """
+        for name, count in self.__counts_query(cls.name, pattern, order_by=order_by, cls=cls, show_zero=show_zero, reverse=reverse):
+            yield AttributeCount(name, count)
+
+    def __filter_metadata(self, articles, **kwargs):
+        """filters the query by the metadata arguments of search, returns None
+        when no content can match.
+
+        :param articles Query: query of content
+        """
+        author = kwargs.get("author", None)
+        status = kwargs.get("status", None)
+        content_type = kwargs.get("content_type", None)
+        if content_type not in ("article", "page"):
+            content_type = None
+        category = kwargs.get("category", None)
+        tags = kwargs.get("tags", None) or []
+        any_tags = kwargs.get("any_tags", None) or []
 
-        for obj in objs:
-            if pattern.search(obj.name):
-                yield obj
+        # the posting lists are only built or loaded for tags, the indexes on
+        # the content columns answer the other filters in the order of the
+        # results, without reading and sorting every id
+        if (tags or any_tags) and self.__has_json:
+            # intersects the posting lists, then fetches only the matching rows
+            postings = self.postings()
+            bitmap = postings.all_of("tag", tags)
+            for field, value in (("author", author), ("status", status), ("type", content_type), ("category", category)):
+                if value:
+                    bitmap &= postings.get(field, value)
+            if any_tags:
+                bitmap &= postings.any_of("tag", any_tags)
+            if not bitmap:
+                return None
+            return articles.filter(self.__ids_clause(bitmap))
+
+        # the names are looked up in subqueries rather than correlated
+        # EXISTS, so that sqlite can use the indexes on the content columns
+        from sqlalchemy import select
+
+        def tagged(names):
+            return Content.id.in_(select([content_tag_table.c.content_id]).where(content_tag_table.c.tag_id.in_(select([Tag.id]).where(Tag.name.in_(names)))))
+
+        # filters by the author of the content
+        if author:
+            articles = articles.filter(Content.author_id.in_(select([Author.id]).where(Author.name == author)))
+
+        if status:
+            articles = articles.filter(Content.status == status)
+
+        # filters by the type of content
+        if content_type:
+            articles = articles.filter(Content.type == content_type)
+
+        # filters by the category
+        if category:
+            articles = articles.filter(Content.category_id.in_(select([Category.id]).where(Category.name == category)))
+
+        # filters by the articles matching all the tags
+        if tags:
+            articles = articles.filter(*[tagged([tag]) for tag in tags])
+
+        # filters by the articles matching any of the tags
+        if any_tags:
+            articles = articles.filter(tagged(any_tags))
+        return articles
+
+    @staticmethod
+    def __filter_dates(articles, dates):
+        """filters the query by the dates argument of search"""
+        from datetime import datetime, timedelta
+
+        def midnight(date):
+            return datetime(date.year, date.month, date.day)
+
+        # compared as datetimes, which sqlalchemy binds in the format the
+        # dates are stored in, so that the date index is used
+        if len(dates) == 1:
+            begin = midnight(dates[0])
+            articles = articles.filter(Content.date_created >= begin, Content.date_created < begin + timedelta(days=1))
+        elif len(dates) == 2:
+            after, before = dates
+            if after:
+                articles = articles.filter(Content.date_created >= midnight(after))
+            if before:
+                articles = articles.filter(Content.date_created < midnight(before) + timedelta(days=1))
+        return articles
+
+    def archive(self, by="month", **kwargs):
+        """counts the content created in each month or year, newest first.
+
+        :param by str: either month or year
+        :param kwargs: the author, status, category, content_type, tags, any_tags and dates filters of search
+        :rtype list: ArchiveCount of each month or year with content, month is None when counting by year
+        """
+        from sqlalchemy import func
+        if by not in ("month", "year"):
+            raise ValueError("unknown archive period '{}', must be month or year".format(by))
+        # dates are stored as YYYY-MM-DD HH:MM:SS text, so the period is a prefix
+        period = func.substr(Content.date_created, 1, 7 if by == "month" else 4)
+        counts = self.__session.query(period, func.count(Content.id)).filter(Content.date_created.isnot(None))
+        counts = self.__filter_metadata(counts, **kwargs)
+        if counts is None:
+            return []
+        dates = kwargs.get("dates", None)
+        if dates:
+            counts = self.__filter_dates(counts, dates)
+        counts = counts.group_by(period).order_by(period.desc())
+
+        def archive_count(period, count):
+            year, _, month = period.partition("-")
+            return ArchiveCount(int(year), int(month) if month else None, count)
+        return [archive_count(period, count) for period, count in counts]
+
+    def explain(self, **kwargs):
+        """runs a search twice and returns the plan sqlite used for its query.
+
+        the first run includes the work done before the query, such as
+        rebuilding the posting lists, and the second run is the one whose
+        statement is captured and explained.
+
+        :param kwargs: the arguments of search
+        :rtype QueryPlan: the sql and parameters sent to sqlite, the plan as
+            (id, parent, detail) rows, the number of results and the seconds each run took
+        """
+        from sqlalchemy import event
+        start = time.perf_counter()
+        for _ in self.search(**kwargs):
+            pass
+        first_seconds = time.perf_counter() - start
+
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+        event.listen(self.__engine, "before_cursor_execute", capture)
+        try:
+            start = time.perf_counter()
+            rows = sum(1 for _ in self.search(**kwargs))
+            seconds = time.perf_counter() - start
+        finally:
+            event.remove(self.__engine, "before_cursor_execute", capture)
+
+        if not statements:
+            # the posting lists showed that nothing matches, no query ran
+            return QueryPlan(None, None, [], rows, first_seconds, seconds)
+        sql, parameters = statements[-1]
+        cursor = self.__session.connection().connection.cursor()
+        try:
+            plan = [tuple(row[:2]) + (row[-1], ) for row in cursor.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+        finally:
+            cursor.close()
+        return QueryPlan(sql, parameters, plan, rows, first_seconds, seconds)
 
     def search(self, **kwargs):
         """searches available metadata and files for the given search criteria
@@ -214,65 +1188,108 @@ class Store(object):
         :param category str: the category that the content must match.
         :param content_type enum: either article, page or None to filter by content type.
         :param tags list: returns content that is the logical conjuction of these tags.
-        :param title str: title to search content by, produces a filter by case-insensitive match.
+        :param any_tags list: returns content that has at least one of these tags.
+        :param title str: text the title must contain, compared case-insensitively.
         :param dates tuple: a tuple of containing either the date range or a single date. If a single
             date is provided, it must match that date. If two dates are provided, must full in between
             those dates. If None is provided, that bound is ignored.
+        :param text str: words that must appear in the title, summary or body. matches are ordered
+            by relevance and each content has a snippet of the matching text.
+        :param projection bool: yields ContentRows read by a single query, with the author and
+            category names and the tags aggregated in sql, instead of Content models.
+        :param sort str: one of date (newest first, the default), modified (most recently
+            modified first) or title. results of a text search are ordered by relevance unless sorted.
+        :param cursor str: yields the results which follow the result the cursor was made
+            from, see cursor_for
+        :param offset int: number of results to skip
+        :param limit int: maximum number of results
 
         :yields object: The type of content object constrained by search parameters.
         """
         # TODO: Any way to determine if file system has changed so we can
-        # resync?
-
-        articles = self.__session.query(Content)
-
-        # filters by the author of the content
-        author = kwargs.get("author", None)
-        if author:
-            articles = articles.filter(Content.author.has(Author.name == author))
-
-        status = kwargs.get("status", None)
-        if status:
-            articles = articles.filter(Content.status == status)
+        # resync? until then, results are as fresh as the last sync, or live
+        # while 'lapis watch' is running.
 
-        # filters by the type of content
-        content_type = kwargs.get("content_type", None)
-        if content_type in ("article", "page"):
-            articles = articles.filter(Content.type == content_type)
+        projection = kwargs.get("projection", False)
+        if projection:
+            from sqlalchemy import func, select
+            tag_names = select([func.group_concat(Tag.name, TAG_SEPARATOR)]).select_from(content_tag_table.join(Tag, Tag.id == content_tag_table.c.tag_id))
+            tag_names = tag_names.where(content_tag_table.c.content_id == Content.id).as_scalar()
+            articles = self.__session.query(Content.id, Content.source_path, Content.title, Content.type, Content.status, Content.date_created,
+                                            Content.date_modified, Author.name, Category.name, tag_names)
+            articles = articles.select_from(Content).outerjoin(Author, Author.id == Content.author_id).outerjoin(Category, Category.id == Content.category_id)
+        else:
+            articles = self.__session.query(Content)
 
-        # filters by the category
-        category = kwargs.get("category", None)
-        if category:
-            articles = articles.filter(Content.category.has(Category.name == category))
+        def result(row, snippet=None):
+            if not projection:
+                row.snippet = snippet
+                return row
+            tags = tuple(sorted(row[9].split(TAG_SEPARATOR))) if row[9] else ()
+            return ContentRow(*row[:9], tags=tags, snippet=snippet)
 
-        # filters by the articles matching all the tags
-        tags = kwargs.get("tags", [])
-        if tags:
-            articles = articles.filter(*[Content.tags.any(Tag.name == tag) for tag in tags])
+        articles = self.__filter_metadata(articles, **kwargs)
+        if articles is None:
+            return
 
-        # filters by the title, case-insensitive
+        # filters by a substring of the title, case-insensitive. the trigram
+        # index answers substrings of at least three characters
         title = kwargs.get("title", None)
         if title:
-            lc_title = title.lower()
-            articles = articles.filter(Content.title.like("%{}%".format(lc_title)))
+            folded = fold(title)
+            if TRIGRAM_TABLE in self.__search_tables and len(folded) >= 3:
+                from sqlalchemy import select, literal_column, table, column
+                trigram = table(TRIGRAM_TABLE, column("rowid"))
+                phrase = '"{}"'.format(folded.replace('"', '""'))
+                articles = articles.filter(Content.id.in_(select([trigram.c.rowid]).where(literal_column(TRIGRAM_TABLE).op("MATCH")(phrase))))
+            else:
+                escaped = folded.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                articles = articles.filter(Content.title_folded.like("%{}%".format(escaped), escape="\\"))
 
         # filters by the date created, depending on what was passed
         dates = kwargs.get("dates", None)
         if dates:
-            from datetime import timedelta
-            fmt = "%Y-%m-%d"
-            if len(dates) == 1:
-                begin = dates[0]
-                end = begin + timedelta(days=1)
-                articles = articles.filter(Content.date_created.between(begin.strftime(fmt), end.strftime(fmt)))
-            elif len(dates) == 2:
-                after, before = dates
-                if after:
-                    articles = articles.filter(Content.date_created >= after.strftime(fmt))
-                if before:
-                    before += timedelta(days=1)
-                    articles = articles.filter(Content.date_created < before.strftime(fmt))
-
-        articles = articles.order_by(Content.date_created.desc())
-        for content in articles:
-            yield content
+            articles = self.__filter_dates(articles, dates)
+
+        # filters by the full-text index, ordered by relevance unless sorted
+        sort = kwargs.get("sort", None)
+        text = kwargs.get("text", None)
+        if text:
+            if not self.full_text:
+                raise RuntimeError("full-text search requires sqlite with fts5")
+            from sqlalchemy import func, literal_column, table, column
+            fts = table(FTS_TABLE, column("rowid"))
+            match = literal_column(FTS_TABLE)
+            articles = articles.join(fts, fts.c.rowid == Content.id)
+            articles = articles.filter(match.op("MATCH")(_fts_query(text)))
+            articles = articles.add_columns(func.snippet(match, -1, SNIPPET_START, SNIPPET_END, "...", 16))
+            if sort is None:
+                articles = articles.order_by(func.bm25(match, *FTS_WEIGHTS), Content.id)
+
+        # orders by the sort key, with the id breaking ties so that the order is
+        # total and a cursor identifies a position in it
+        cursor = kwargs.get("cursor", None)
+        if sort is not None or not text:
+            sort = sort or "date"
+            if sort not in SORT_KEYS:
+                raise ValueError("unknown sort '{}', must be one of {}".format(sort, ", ".join(sorted(SORT_KEYS))))
+            key, descending = SORT_KEYS[sort]
+            if cursor:
+                articles = articles.filter(_after(key, descending, *_decode_cursor(cursor, sort)))
+            articles = articles.order_by(key.desc(), Content.id.desc()) if descending else articles.order_by(key.asc(), Content.id.asc())
+        elif cursor:
+            raise ValueError("a cursor requires a sort, results ordered by relevance can only be paged with an offset")
+
+        offset = kwargs.get("offset", None)
+        if offset:
+            articles = articles.offset(offset)
+        limit = kwargs.get("limit", None)
+        if limit is not None:
+            articles = articles.limit(limit)
+
+        # fetches the rows in batches, so the first results are available immediately
+        for row in articles.yield_per(STREAM_BATCH):
+            if text:
+                yield result(row[:-1] if projection else row[0], row[-1])
+            else:
+                yield result(row)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""module responsible for keeping the store in sync as content changes on disk"""
+
+import logging
+import os
+import select
+import struct
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0x00080000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _libc():
+    """returns libc if it provides inotify, otherwise None"""
+    import ctypes
+    import ctypes.util
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+class InotifyWatcher(object):
+    """reports changes beneath a directory using linux inotify.
+
+    :param root str: directory to watch recursively
+    """
+
+    def __init__(self, root):
+        import ctypes
+        self.__libc = _libc()
+        if self.__libc is None:
+            raise OSError("inotify is not available on this platform")
+        self.__root = os.path.abspath(root)
+        self.__fd = self.__libc.inotify_init1(IN_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.__directories = {}
+        self.__add_tree(self.__root)
+
+    def __add(self, path):
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.__directories[wd] = path
+
+    def __add_tree(self, root):
+        self.__add(root)
+        for dirpath, dirs, files in os.walk(root, followlinks=True):
+            for d in dirs:
+                self.__add(os.path.join(dirpath, d))
+
+    def read(self, timeout):
+        """waits up to timeout seconds for changes.
+
+        :rtype list: (path, is_dir) tuples for every changed path
+        """
+        readable, _, _ = select.select([self.__fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.__fd, 64 * 1024)
+        changes = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, everything must be checked again
+                changes.append((self.__root, True))
+                continue
+            if mask & IN_IGNORED:
+                self.__directories.pop(wd, None)
+                continue
+            directory = self.__directories.get(wd, None)
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            is_dir = bool(mask & IN_ISDIR) or not name
+            if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+                self.__add_tree(path)
+            changes.append((path, is_dir))
+        return changes
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+    def __del__(self):
+        self.close()
+
+
+class PollingWatcher(object):
+    """reports changes to content files by periodically stating them.
+
+    :param scanner ContentScanner: scanner for the content directory
+    :param interval float: seconds between each scan of the content directory
+    """
+
+    def __init__(self, scanner, interval=1.0):
+        self.__scanner = scanner
+        self.__interval = interval
+        self.__snapshot = self.__take_snapshot()
+        self.__next_scan = time.time() + interval
+
+    def __take_snapshot(self):
+        return {source_path: (stat.st_mtime, stat.st_size) for source_path, content_type, stat in self.__scanner.scan()}
+
+    def read(self, timeout):
+        """waits up to timeout seconds for changes, see InotifyWatcher.read"""
+        wait = self.__next_scan - time.time()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self.__next_scan = time.time() + self.__interval
+
+        snapshot = self.__take_snapshot()
+        changed = set(self.__snapshot) ^ set(snapshot)
+        changed.update(path for path, stamp in snapshot.items() if self.__snapshot.get(path, stamp) != stamp)
+        self.__snapshot = snapshot
+        return [(path, False) for path in sorted(changed)]
+
+    def close(self):
+        pass
+
+
+class IndexWatcher(object):
+    """applies the changes reported by a watcher to the store, waiting for bursts
+    of changes to settle before touching the store.
+
+    :param store Store: the store that is kept in sync
+    :param settings dict: settings dictionary from the pelican config
+    :param watcher object: an InotifyWatcher or PollingWatcher, by default
+        inotify is used when it is available
+    :param debounce float: seconds without changes before they are applied
+    :param interval float: seconds between scans when polling
+    :param jobs int: number of processes used to read files when the content directory is synced
+    :param git bool: whether the content directory is synced with git, see Store.sync
+    """
+
+    def __init__(self, store, settings, watcher=None, debounce=0.5, interval=1.0, jobs=1, git=False):
+        from lapis.scanner import ContentScanner
+        self.__store = store
+        self.__settings = settings
+        self.__jobs = jobs
+        self.__git = git
+        self.__scanner = ContentScanner(settings)
+        self.__debounce = debounce
+        if watcher is None:
+            try:
+                watcher = InotifyWatcher(self.__scanner.path)
+            except OSError as e:
+                logger.info("inotify unavailable ({}), polling for changes instead".format(e))
+                watcher = PollingWatcher(self.__scanner, interval=interval)
+        self.__watcher = watcher
+        self.__pending = {}
+        self.__first_change = None
+        self.__last_change = None
+
+    @property
+    def watcher(self):
+        return self.__watcher
+
+    def apply(self, changes):
+        """re-indexes the changed files and removes deleted files from the store.
+
+        a change to a directory means that any number of files could have moved,
+        which the fingerprints let a regular sync resolve cheaply.
+
+        :param changes dict: changed path to a boolean which is true for directories
+        """
+        if any(changes.values()):
+            logger.info("directories changed, syncing the content directory")
+            self.__store.sync(self.__settings, jobs=self.__jobs, git=self.__git)
+            return
+
+        removed = []
+        for path in sorted(changes):
+            content_type = self.__scanner.content_type(path)
+            if content_type is None:
+                continue
+            if os.path.isfile(path):
+                logger.info("re-indexing {}".format(path))
+                self.__store.sync_file(self.__settings, path, content_type)
+            else:
+                removed.append(os.path.abspath(path))
+        if removed:
+            logger.info("removing {} deleted files".format(len(removed)))
+            self.__store.remove(removed)
+
+    def flush(self):
+        """applies the pending changes immediately"""
+        if self.__pending:
+            pending, self.__pending = self.__pending, {}
+            self.apply(pending)
+
+    def step(self, timeout=None):
+        """reads the changes reported by the watcher once, then applies the
+        pending changes if none arrived for the debounce period. a long burst
+        of changes is applied after ten debounce periods.
+
+        :param timeout float: seconds to wait for changes, by default the
+            debounce period while changes are pending and a second otherwise
+        """
+        if timeout is None:
+            timeout = self.__debounce if self.__pending else 1.0
+        changes = self.__watcher.read(timeout)
+        now = time.time()
+        if changes:
+            if not self.__pending:
+                self.__first_change = now
+            self.__last_change = now
+            for path, is_dir in changes:
+                self.__pending[path] = self.__pending.get(path, False) or is_dir
+        if self.__pending:
+            settled = now - self.__last_change >= self.__debounce
+            if settled or now - self.__first_change >= self.__debounce * 10:
+                self.flush()
+
+    def run(self, stop=None):
+        """applies changes until stop returns true or the process is interrupted
+
+        :param stop callable: checked between reads, returns true to stop watching
+        """
+        try:
+            while stop is None or not stop():
+                self.step()
+            self.flush()
+        finally:
+            self.close()
+
+    def close(self):
+        self.__watcher.close()
@@ -27,7 +27,7 @@ setup(
     license='CC0 1.0 Universal',
     platforms='any',
     test_suite="tests.test_suite.test_all",
-    packages=find_packages(exclude=["tests"]),
+    packages=find_packages(exclude=["tests", "benchmarks"]),
     package_data={'': ['LICENSE'], 'lapis': ["templates/*", "examples/*"]},
     include_package_data=True,
     install_requires=requires,
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import filecmp
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestSiteGenerator(unittest.TestCase):
+    """tests the sites generated for the benchmarks"""
+
+    def setUp(self):
+        self.__tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir)
+
+    def generate(self, name, **kwargs):
+        from benchmarks.sitegen import generate_site
+        return generate_site(os.path.join(self.__tmp_dir, name), **kwargs)
+
+    def test_reproducible(self):
+        self.generate("first", articles=20, body_words=50)
+        self.generate("second", articles=20, body_words=50)
+        comparison = filecmp.dircmp(os.path.join(self.__tmp_dir, "first"), os.path.join(self.__tmp_dir, "second"))
+        self.assertEqual([], comparison.diff_files)
+        self.assertEqual([], comparison.left_only + comparison.right_only)
+
+    def test_sync(self):
+        from pelican.settings import read_settings
+        from lapis.store import Store
+        from lapis.models import Tag, Category
+        pelican_config = self.generate("site", articles=30, pages=2, tags=5, categories=3, body_words=50)
+        settings = read_settings(pelican_config, override={"SITEURL": os.path.dirname(pelican_config)})
+        store = Store(os.path.join(self.__tmp_dir, "lapisdb"))
+        store.sync(settings)
+        self.assertEqual(30, len(list(store.search(content_type="article"))))
+        self.assertEqual(2, len(list(store.search(content_type="page"))))
+        self.assertLessEqual(set(c.name for c in store.counts("", cls=Tag)), set("tag{}".format(i) for i in range(5)))
+        categories = set(c.name for c in store.counts("", cls=Category))
+        self.assertLessEqual(categories - {"pages"}, set("category{}".format(i) for i in range(3)))
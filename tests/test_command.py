@@ -36,12 +36,14 @@ class TestCommand(unittest.TestCase):
 
         # bogus mock config obj
         self.config = type("Config", (object,), {})()
-        self.config.example_lapis_configuration_file = Config(self.__pelican_config).example_lapis_configuration_file
+        self.config.example_lapis_configuration_file = Config(self.__pelican_config, cache=False).example_lapis_configuration_file
         self.config.settings = settings
         self.config.store = self.__store
         self.str_io = io.StringIO()
         self.config.printer = CommandPrinter(stream=self.str_io)
         self.config.editor = TrivialEditor("echo")
+        self.config.sync_jobs = 1
+        self.config.sync_git = False
         self.__tmp_dir = tempfile.mkdtemp()
         self.config.content_path = self.__tmp_dir
         self.config.article_path = self.__tmp_dir
@@ -50,6 +52,8 @@ class TestCommand(unittest.TestCase):
 
     def tearDown(self):
         self.__sqlite_file.close()
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
         shutil.rmtree(self.__tmp_dir)
 
     def test_command_init(self):
@@ -83,11 +87,54 @@ class TestCommand(unittest.TestCase):
     def test_exercise_sync(self):
         from lapis.command import SyncCommand
         SyncCommand.run(config=self.config)
+        SyncCommand.run(config=self.config, checksum=True, jobs=2)
+
+    def test_sync_paths(self):
+        from unittest import mock
+        from lapis.command import SyncCommand
+        posts = os.path.join(self.config.settings['PATH'], "posts")
+        foo = os.path.join(posts, "2014", "03", "foo.md")
+        self.assertEqual([os.path.join(posts, "2014", "09", "bar.md"), "/deleted.md"],
+                         SyncCommand.paths([os.path.join(posts, "**", "b*.md"), "/deleted.md", os.path.join(posts, "*.rst")]))
+        self.assertEqual(["a.md", "b c.md"], SyncCommand.paths([], io.StringIO("a.md\0b c.md\0")))
+        self.assertEqual(["a.md", "b.md"], SyncCommand.paths([], io.StringIO("a.md\nb.md\n")))
+
+        with mock.patch.object(self.__store, "sync_files", wraps=self.__store.sync_files) as sync_files:
+            SyncCommand.run(config=self.config, paths=[foo])
+            with mock.patch("sys.stdin", io.StringIO(foo + "\0")):
+                SyncCommand.run(config=self.config, paths=[], stdin=True)
+        self.assertEqual([[foo], [foo]], [call[0][1] for call in sync_files.call_args_list])
+
+    def test_sync_options(self):
+        from lapis.command import sync_options
+        self.config.sync_jobs = 4
+        self.config.sync_git = True
+        self.assertEqual(dict(jobs=4, git=True), sync_options(self.config, {}))
+        self.assertEqual(dict(jobs=1, git=False), sync_options(self.config, dict(jobs=1, git=False)))
 
     def test_exercise_find(self):
         from lapis.command import FindCommand
         FindCommand.run(config=self.config, content_type="page")
         FindCommand.run(config=self.config, content_type="article")
+        FindCommand.run(config=self.config, content_type="article", text="foo")
+
+    def test_find_pages(self):
+        from lapis.command import FindCommand
+        FindCommand.run(config=self.config, content_type="article", limit=1, sort="title")
+        FindCommand.run(config=self.config, content_type="article", limit=1, offset=1, sort="title")
+        self.assertEqual(["1.) | Article | Published | 2014-09-06 | Bar", "2.) | Article | Published | 2014-03-09 | Foo"], self.str_io.getvalue().splitlines())
+
+    def test_find_path(self):
+        from lapis.command import FindCommand
+        FindCommand.run(config=self.config, content_type="article", sort="title", path=2)
+        FindCommand.run(config=self.config, content_type="article", sort="title", offset=1, path=1)
+        paths = self.str_io.getvalue().splitlines()
+        self.assertEqual(2, len(paths))
+        self.assertEqual(paths[0], paths[1])
+        self.assertTrue(paths[0].endswith("foo.md"))
+
+        with self.assertRaises(SystemExit):
+            FindCommand.run(config=self.config, content_type="article", limit=1, path=2)
 
         with self.assertRaises(SystemExit):
             FindCommand.run(config=self.config, content_type="article", after="23123")
@@ -122,6 +169,43 @@ class TestCommand(unittest.TestCase):
         except AttributeError:
             pass
 
+    def test_main_timings(self):
+        from lapis.command import main, _build_parser
+        import pstats
+        profile = os.path.join(self.__tmp_dir, "lapis.prof")
+        args = _build_parser().parse_args(["--pelican_config", self.__pelican_config, "--timings", "--profile", profile, "tags"])
+        args.config = self.config
+        args.config.lapis_db_path = self.__sqlite_file.name
+        stderr = io.StringIO()
+        from unittest import mock
+        with mock.patch("sys.stderr", stderr):
+            main(args)
+        phases = [line.split()[0] for line in stderr.getvalue().splitlines()]
+        self.assertEqual(["phase", "import", "store_open", "total"], phases)
+        # the imports are timed once, by the command
+        self.assertEqual(["import", "1"], stderr.getvalue().splitlines()[1].split()[:2])
+        self.assertTrue(pstats.Stats(profile).total_calls > 0)
+
+    def test_main_interrupted_store(self):
+        from lapis.command import main, _build_parser
+        from unittest import mock
+        import socket
+        import subprocess
+        # the sync was owned by a process that is gone
+        process = subprocess.Popen(["true"])
+        process.wait()
+        site = self.__store.site
+        site.sync_done, site.sync_remaining, site.sync_owner = 2, 3, "{}:{}".format(socket.gethostname(), process.pid)
+        self.__store._Store__session.commit()
+        args = _build_parser().parse_args(["--pelican_config", self.__pelican_config, "tags"])
+        args.config = self.config
+        args.config.lapis_db_path = self.__sqlite_file.name
+        # a read-only command leaves the sync to lapis sync
+        with mock.patch("lapis.command.SyncCommand.run") as sync, self.assertLogs("lapis.command", level="WARNING") as logs:
+            main(args)
+        self.assertFalse(sync.called)
+        self.assertIn("run lapis sync", logs.output[0])
+
     def test_parse_args(self):
         from lapis.command import _parse_args
         try:
@@ -158,3 +242,56 @@ class TestCommand(unittest.TestCase):
 [2] water
 """
         self.assertEqual(expected, self.str_io.getvalue())
+
+
+    def test_find_explain(self):
+        from lapis.command import FindCommand
+        FindCommand.run(config=self.config, content_type="article", category="Photography", explain=True)
+        output = self.str_io.getvalue()
+        self.assertIn("QUERY PLAN", output)
+        self.assertIn("2 results", output)
+
+    def test_archive_command(self):
+        from lapis.command import ArchiveCommand
+        ArchiveCommand.run(config=self.config, content_type="article")
+        self.assertEqual("[3] 2014\n    [1] 2014-09\n    [1] 2014-03\n    [1] 2014-01\n", self.str_io.getvalue())
+
+
+class TestStartup(unittest.TestCase):
+    """tests that commands which do not need the site start without importing it"""
+
+    # modules that take most of the startup time of lapis
+    HEAVY_MODULES = ("sqlalchemy", "pelican", "markdown", "docutils", "jinja2", "yaml")
+
+    def imported_heavy_modules(self, *argv):
+        """runs lapis with the arguments in a new interpreter, returns the heavy modules it imported"""
+        import json
+        import subprocess
+        import sys
+        code = ("import json, sys\n"
+                "sys.argv = ['lapis'] + {argv!r}\n"
+                "from lapis.command import main\n"
+                "try:\n"
+                "    main()\n"
+                "except SystemExit:\n"
+                "    pass\n"
+                "sys.stdout.write('\\n' + json.dumps(sorted(m for m in sys.modules if m.split('.')[0] in {heavy!r})))\n").format(argv=list(argv), heavy=self.HEAVY_MODULES)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=root, stderr=subprocess.DEVNULL)
+        return json.loads(output.decode("utf-8").splitlines()[-1])
+
+    def test_version(self):
+        self.assertEqual([], self.imported_heavy_modules("--version"))
+
+    def test_help(self):
+        self.assertEqual([], self.imported_heavy_modules("--help"))
+        self.assertEqual([], self.imported_heavy_modules("find", "--help"))
+
+    def test_newconfig(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            location = os.path.join(tmp_dir, "lapis.yml")
+            self.assertEqual([], self.imported_heavy_modules("newconfig", "-l", location))
+            self.assertTrue(os.path.isfile(location))
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -13,7 +13,7 @@ class TestConfig(unittest.TestCase):
         lapis_conf = os.path.join(os.path.dirname(__file__), "data", "configs", ".lapis.yml")
         pelican_conf = os.path.join(os.path.dirname(__file__), "samplesite", "pelicanconf.py")
         self.content_path = os.path.join(os.path.dirname(__file__), "samplesite")
-        self.config = Config(pelican_conf, conf=lapis_conf)
+        self.config = Config(pelican_conf, conf=lapis_conf, cache=False)
 
     def tearDown(self):
         pass
@@ -59,3 +59,75 @@ class TestConfig(unittest.TestCase):
 
     def test_color_enabled(self):
         self.assertTrue(self.config.printer.color_enabled)
+
+    def test_sync_jobs(self):
+        self.assertEqual(2, self.config.sync_jobs)
+
+    def test_sync_git(self):
+        self.assertTrue(self.config.sync_git)
+
+
+class TestSettingsCache(unittest.TestCase):
+    """tests that the settings are read from the cache until the configuration files change"""
+
+    def setUp(self):
+        import tempfile
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.pelican_conf = os.path.join(self.__tmp_dir, "pelicanconf.py")
+        self.lapis_conf = os.path.join(self.__tmp_dir, "lapis.yml")
+        os.mkdir(os.path.join(self.__tmp_dir, "content"))
+        self.__writes = 0
+        self.write(self.pelican_conf, "AUTHOR = 'First'\nPATH = 'content'\n")
+        self.write(self.lapis_conf, "sync:\n    jobs: 3\n")
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.__tmp_dir)
+
+    def write(self, path, text):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        # the cache is keyed on the modification time, which may not move between quick writes
+        self.__writes += 1
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + self.__writes * 10 ** 9))
+
+    def cached_config(self):
+        """returns the config, failing if the pelican settings are read again"""
+        from unittest import mock
+        with mock.patch("pelican.settings.read_settings", side_effect=AssertionError("settings were not cached")):
+            return Config(self.pelican_conf, conf=self.lapis_conf)
+
+    def test_cached(self):
+        from lapis.config import settings_cache_path
+        config = Config(self.pelican_conf, conf=self.lapis_conf)
+        self.assertTrue(os.path.isfile(settings_cache_path(self.pelican_conf)))
+        cached = self.cached_config()
+        self.assertEqual(config.settings['PATH'], cached.settings['PATH'])
+        self.assertEqual("First", cached.author_name)
+        self.assertEqual(3, cached.sync_jobs)
+        self.assertEqual([tuple(rule) for rule in config.settings['PAGINATION_PATTERNS']], cached.settings['PAGINATION_PATTERNS'])
+
+    def test_pelican_config_changed(self):
+        Config(self.pelican_conf, conf=self.lapis_conf)
+        self.write(self.pelican_conf, "AUTHOR = 'Second'\nPATH = 'content'\n")
+        self.assertEqual("Second", Config(self.pelican_conf, conf=self.lapis_conf).author_name)
+        self.assertEqual("Second", self.cached_config().author_name)
+
+    def test_lapis_config_changed(self):
+        Config(self.pelican_conf, conf=self.lapis_conf)
+        self.write(self.lapis_conf, "sync:\n    jobs: 4\n")
+        self.assertEqual(4, Config(self.pelican_conf, conf=self.lapis_conf).sync_jobs)
+        os.remove(self.lapis_conf)
+        self.assertEqual(1, Config(self.pelican_conf, conf=self.lapis_conf).sync_jobs)
+
+    def test_invalid_jobs(self):
+        self.write(self.lapis_conf, "sync:\n    jobs: many\n")
+        with self.assertLogs("lapis.config", level="WARNING") as logs:
+            self.assertEqual(1, Config(self.pelican_conf, conf=self.lapis_conf, cache=False).sync_jobs)
+        self.assertIn("'many'", logs.output[0])
+
+    def test_disabled(self):
+        from lapis.config import settings_cache_path
+        Config(self.pelican_conf, conf=self.lapis_conf, cache=False)
+        self.assertFalse(os.path.exists(settings_cache_path(self.pelican_conf)))
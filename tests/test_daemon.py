@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from lapis.store import Store
+from lapis.printer import CommandPrinter
+
+
+class TestDaemon(unittest.TestCase):
+    """tests that the daemon runs forwarded commands against its loaded store"""
+
+    def setUp(self):
+        from pelican.settings import read_settings
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.__sqlite_file = tempfile.NamedTemporaryFile()
+        self.store = Store(self.__sqlite_file.name)
+        pelican_config = os.path.join(os.path.dirname(__file__), "samplesite", "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": os.path.abspath(os.curdir)})
+        self.store.sync(self.settings)
+
+        self.config = type("Config", (object,), {})()
+        self.config.settings = self.settings
+        self.config.store = self.store
+        self.config.printer = CommandPrinter(stream=io.StringIO())
+        self.socket_path = os.path.join(self.__tmp_dir, ".lapis.sock")
+
+    def tearDown(self):
+        self.__sqlite_file.close()
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
+        shutil.rmtree(self.__tmp_dir)
+
+    def test_socket_path(self):
+        from lapis.daemon import socket_path
+        self.assertEqual(os.path.join(self.__tmp_dir, ".lapis.sock"), socket_path(os.path.join(self.__tmp_dir, "pelicanconf.py")))
+
+    def test_handle(self):
+        from lapis.daemon import Daemon
+        daemon = Daemon(self.config, self.socket_path)
+        response = daemon.handle({"argv": ["tags"]})
+        self.assertEqual(0, response["status"])
+        self.assertIn("[2] photography", response["stdout"])
+
+        response = daemon.handle({"argv": ["find", "article", "-t", "ocean"]})
+        self.assertEqual(0, response["status"])
+        self.assertEqual(1, len(response["stdout"].splitlines()))
+
+    def test_handle_refuses(self):
+        from lapis.daemon import Daemon
+        daemon = Daemon(self.config, self.socket_path)
+        for argv in (["find", "article", "-e", "1"], ["sync"], ["create", "article", "foo"]):
+            response = daemon.handle({"argv": argv})
+            self.assertNotEqual(0, response["status"])
+        self.assertEqual(2, daemon.handle({"argv": ["--bogus"]})["status"])
+
+    def test_forward_without_daemon(self):
+        from lapis.daemon import forward
+        self.assertIsNone(forward(self.socket_path, ["tags"]))
+
+    def test_serve(self):
+        from lapis.daemon import Daemon, forward
+        # the store may only be used from this thread, so the client runs in another
+        stopped = threading.Event()
+        out = io.StringIO()
+        results = []
+
+        def client():
+            try:
+                for _ in range(500):
+                    if os.path.exists(self.socket_path):
+                        break
+                    stopped.wait(0.01)
+                results.append(forward(self.socket_path, ["categories"], stdout=out, stderr=io.StringIO()))
+            finally:
+                stopped.set()
+
+        thread = threading.Thread(target=client)
+        thread.start()
+        Daemon(self.config, self.socket_path).serve(stop=stopped.is_set)
+        thread.join()
+        self.assertEqual([0], results)
+        self.assertIn("[2] Photography", out.getvalue())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_forward_timeout(self):
+        import socket
+        from lapis.daemon import forward
+        # a daemon that accepts the command but never answers
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen(1)
+        try:
+            with self.assertLogs("lapis.daemon", level="WARNING") as logs:
+                self.assertIsNone(forward(self.socket_path, ["tags"], timeout=0.1))
+            self.assertIn("running the command in this process", logs.output[0])
+        finally:
+            server.close()
+
+    def test_handle_logs_to_client(self):
+        import logging
+        from unittest import mock
+        from lapis.command import ListTagsCommand
+        from lapis.daemon import Daemon
+        daemon = Daemon(self.config, self.socket_path)
+        handlers = list(logging.getLogger().handlers)
+
+        def run(**kwargs):
+            logging.getLogger("lapis.command").warning("the store is stale")
+            logging.getLogger("lapis.command").info("details")
+
+        with mock.patch.object(ListTagsCommand, "run", side_effect=run):
+            response = daemon.handle({"argv": ["tags"]})
+        self.assertIn("WARNING", response["stderr"])
+        self.assertIn("the store is stale", response["stderr"])
+        self.assertNotIn("details", response["stderr"])
+        self.assertEqual(handlers, logging.getLogger().handlers)
+
+    def test_serve_drops_idle_client(self):
+        import socket
+        from unittest import mock
+        from lapis.daemon import Daemon, forward
+        stopped = threading.Event()
+        results = []
+
+        def client():
+            idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                for _ in range(500):
+                    if os.path.exists(self.socket_path):
+                        break
+                    stopped.wait(0.01)
+                # connects without sending a request
+                idle.connect(self.socket_path)
+                results.append(forward(self.socket_path, ["categories"], stdout=io.StringIO(), stderr=io.StringIO()))
+            finally:
+                idle.close()
+                stopped.set()
+
+        thread = threading.Thread(target=client)
+        thread.start()
+        with mock.patch("lapis.daemon.REQUEST_TIMEOUT", 0.1), self.assertLogs("lapis.daemon", level="WARNING"):
+            Daemon(self.config, self.socket_path).serve(stop=stopped.is_set)
+        thread.join()
+        self.assertEqual([0], results)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from lapis.store import Store
+
+
+# the schema of the stores written by lapis 0.2.1
+BASELINE_SCHEMA = """
+CREATE TABLE site (id INTEGER NOT NULL PRIMARY KEY, version VARCHAR(50) NOT NULL);
+CREATE TABLE tag (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR);
+CREATE TABLE category (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR);
+CREATE TABLE author (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR);
+CREATE TABLE content (id INTEGER NOT NULL PRIMARY KEY, source_path VARCHAR(500) NOT NULL, title VARCHAR, date_created DATETIME,
+                      type VARCHAR(7) NOT NULL, author_id INTEGER REFERENCES author (id), category_id INTEGER REFERENCES category (id),
+                      status VARCHAR(50), CHECK (type IN ('page', 'article')));
+CREATE UNIQUE INDEX ix_content_source_path ON content (source_path);
+CREATE INDEX ix_content_title ON content (title);
+CREATE TABLE content_tag (content_id INTEGER REFERENCES content (id), tag_id INTEGER REFERENCES tag (id));
+INSERT INTO site (id, version) VALUES (1, '0.2.1');
+INSERT INTO author (id, name) VALUES (1, 'Daniel');
+INSERT INTO category (id, name) VALUES (1, 'Photography');
+INSERT INTO tag (id, name) VALUES (1, 'bird');
+INSERT INTO content (id, source_path, title, date_created, type, author_id, category_id, status)
+    VALUES (1, '{path}', 'Straße Foo', '2014-03-09 10:00:00.000000', 'article', 1, 1, 'published');
+INSERT INTO content_tag (content_id, tag_id) VALUES (1, 1);
+"""
+
+
+class TestMigrations(unittest.TestCase):
+    """tests that stores written by older versions are migrated in place"""
+
+    def setUp(self):
+        from pelican.settings import read_settings
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.__tmp_dir, "lapisdb")
+        pelican_config = os.path.join(os.path.dirname(__file__), "samplesite", "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": os.path.abspath(os.curdir)})
+        self.path = os.path.join(self.settings['PATH'], "posts", "2014", "03", "foo.md")
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir)
+
+    def execute(self, script):
+        connection = sqlite3.connect(self.db_path)
+        connection.executescript(script)
+        connection.commit()
+        connection.close()
+
+    def test_baseline(self):
+        from lapis.migrations import SCHEMA_VERSION
+        self.execute(BASELINE_SCHEMA.format(path=self.path))
+        store = Store(self.db_path)
+        self.assertFalse(store.created)
+        self.assertFalse(store.schema_changed)
+        self.assertEqual(SCHEMA_VERSION, store.site.schema_version)
+
+        # the rows are kept and the new columns filled without reading the files
+        content = next(store.search(title="strasse", projection=True))
+        self.assertEqual((self.path, ("bird", ), "Photography"), (content.source_path, content.tags, content.category))
+        self.assertEqual(content.date_created, content.date_modified)
+        self.assertEqual(["Straße Foo"], [content.title for content in store.search(title="ße f")])
+
+        self.assertTrue(store.sync(self.settings))
+        self.assertEqual(5, len(list(store.search())))
+        self.assertEqual(Store.__version__, store.site.version)
+
+    def test_reread_content_only(self):
+        """a migration that needs the files read again keeps the fingerprints of files pelican skipped"""
+        store = Store(self.db_path)
+        store.sync(self.settings)
+        del store
+        self.execute("INSERT INTO fingerprint (source_path, mtime, size) VALUES ('/skipped.md', 0, 0);"
+                     "DROP INDEX ix_content_date_modified;"
+                     "ALTER TABLE content DROP COLUMN date_modified;"
+                     "UPDATE site SET schema_version = 2;")
+        store = Store(self.db_path)
+        fingerprints = [row[0] for row in sqlite3.connect(self.db_path).execute("SELECT source_path FROM fingerprint")]
+        self.assertEqual(["/skipped.md"], fingerprints)
+        self.assertEqual(5, len(list(store.search(sort="modified"))))
+        self.assertTrue(store.sync(self.settings))
+        self.assertFalse(store.sync(self.settings))
+
+    def test_current(self):
+        store = Store(self.db_path)
+        store.sync(self.settings)
+        del store
+        store = Store(self.db_path)
+        self.assertFalse(store.sync(self.settings))
+
+    def test_newer(self):
+        from lapis.migrations import SCHEMA_VERSION
+        Store(self.db_path)
+        self.execute("UPDATE site SET schema_version = {};".format(SCHEMA_VERSION + 1))
+        self.assertTrue(Store(self.db_path).schema_changed)
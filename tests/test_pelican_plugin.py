@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+from lapis.store import Store
+
+
+class TestPelicanPlugin(unittest.TestCase):
+    """tests that a pelican build with the plugin leaves the store in sync"""
+
+    def setUp(self):
+        from pelican.settings import read_settings
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.site_path = os.path.join(self.__tmp_dir, "samplesite")
+        shutil.copytree(os.path.join(os.path.dirname(__file__), "samplesite"), self.site_path)
+        pelican_config = os.path.join(self.site_path, "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": self.site_path,
+                                                                "OUTPUT_PATH": os.path.join(self.__tmp_dir, "output"),
+                                                                "CACHE_PATH": os.path.join(self.__tmp_dir, "cache"),
+                                                                "PLUGINS": ["lapis.pelican_plugin"]})
+        self.db_path = os.path.join(self.settings['PATH'], ".lapisdb")
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir)
+
+    def build(self):
+        from pelican import Pelican
+        Pelican(self.settings).run()
+
+    def test_build(self):
+        self.build()
+        store = Store(self.db_path)
+        self.assertEqual(5, len(list(store.search())))
+        self.assertEqual(["Bar", "Foo", "Foo"], sorted(content.title for content in store.search(content_type="article")))
+        self.assertEqual(1, len(list(store.search(status="hidden"))))
+        # the fingerprints were recorded, so there is nothing left to read
+        self.assertFalse(store.sync(self.settings))
+
+    def test_removed(self):
+        store = Store(self.db_path)
+        store.sync(self.settings)
+        os.remove(os.path.join(self.settings['PATH'], "posts", "2014", "09", "bar.md"))
+        self.build()
+        self.assertEqual(2, len(list(store.search(content_type="article"))))
+        self.assertFalse(store.sync(self.settings))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+from lapis.store import Store
+
+
+class TestPostings(unittest.TestCase):
+    """tests filtering content through the posting lists"""
+
+    def setUp(self):
+        from pelican.settings import read_settings
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.__tmp_dir, "lapisdb")
+        self.store = Store(self.db_path)
+        pelican_config = os.path.join(os.path.dirname(__file__), "samplesite", "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": os.path.abspath(os.curdir)})
+        self.store.sync(self.settings)
+
+    def tearDown(self):
+        shutil.rmtree(self.__tmp_dir)
+
+    def titles(self, **kwargs):
+        return sorted(content.title.strip() for content in self.store.search(**kwargs))
+
+    def test_ids(self):
+        from lapis.postings import ids
+        self.assertEqual([], ids(0))
+        self.assertEqual([0, 3, 64, 1000], ids((1 << 0) | (1 << 3) | (1 << 64) | (1 << 1000)))
+
+    def test_save_and_load(self):
+        from lapis.postings import PostingIndex
+        postings = self.store.postings()
+        self.assertTrue(os.path.isfile(self.store.postings_path))
+        loaded = PostingIndex.load(self.store.postings_path)
+        self.assertEqual(postings.stamp, loaded.stamp)
+        self.assertEqual(postings.universe, loaded.universe)
+        self.assertEqual(postings.get("tag", "water"), loaded.get("tag", "water"))
+        self.assertEqual(2, bin(loaded.get("tag", "water")).count("1"))
+
+    def test_stale(self):
+        """postings built before a write to the store are not used"""
+        self.assertEqual(["Bar", "Foo"], self.titles(tags=["water"]))
+        stamp = self.store.postings().stamp
+        self.store.remove([os.path.join(self.settings['PATH'], "posts", "2014", "03", "foo.md")])
+        self.assertNotEqual(stamp, self.store.postings().stamp)
+        self.assertEqual(["Bar"], self.titles(tags=["water"]))
+
+        # another store of the same database sees the change through the saved postings
+        other = Store(self.db_path)
+        self.assertEqual(["Bar"], [content.title.strip() for content in other.search(tags=["water"])])
+
+    def test_corrupt(self):
+        with open(self.store.postings_path, "wb") as f:
+            f.write(b"garbage")
+        other = Store(self.db_path)
+        self.assertEqual(["Bar", "Foo"], [content.title.strip() for content in other.search(tags=["water"])])
+
+    def test_conjunction(self):
+        self.assertEqual(["Foo"], self.titles(tags=["water", "crane"]))
+        self.assertEqual([], self.titles(tags=["water", "missing"]))
+
+    def test_disjunction(self):
+        self.assertEqual(["Bar", "Foo"], self.titles(any_tags=["crane", "ocean"]))
+        self.assertEqual(["Foo"], self.titles(any_tags=["crane", "missing"]))
+        self.assertEqual(["Bar"], self.titles(tags=["water"], any_tags=["ocean", "missing"]))
+
+    def test_combined(self):
+        self.assertEqual(["Bar", "Foo"], self.titles(tags=["photography"], category="Photography", status="published", content_type="article"))
+        self.assertEqual(["Foo"], self.titles(tags=["photography"], title="fo", status="published"))
+        self.assertEqual([], self.titles(tags=["photography"], content_type="page"))
+        self.assertEqual(["About"], self.titles(content_type="page", status="published"))
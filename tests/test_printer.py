@@ -23,3 +23,32 @@ class TestColorFormatter(unittest.TestCase):
         formatter = ColorFormatter(True)
         expected = "some text goes here"
         self.assertNotEqual(expected, formatter.get_color_text(expected, "red"))
+
+
+class TestContentFormatter(unittest.TestCase):
+
+    def content(self, snippet=None):
+        from datetime import datetime
+        content = type("Content", (object,), {})()
+        content.type = "article"
+        content.status = "published"
+        content.title = "Heron"
+        content.date_created = datetime(2014, 9, 10)
+        content.snippet = snippet
+        return content
+
+    def test_snippet(self):
+        from lapis.printer import ContentFormatter
+        from lapis.store import SNIPPET_START, SNIPPET_END
+        content = self.content("the {}heron{} waited\nby the marsh".format(SNIPPET_START, SNIPPET_END))
+        self.assertEqual("1.) | Article | Published | 2014-09-10 | Heron", str(ContentFormatter(content, 1)))
+        self.assertEqual("1.) | Article | Published | 2014-09-10 | Heron\n     the heron waited by the marsh", str(ContentFormatter(content, 1, show_snippet=True)))
+        self.assertNotEqual("the heron waited by the marsh", ContentFormatter(content, 1, color_enabled=True).snippet)
+
+
+class TestContentAttributeFormatter(unittest.TestCase):
+
+    def test_precomputed_count(self):
+        from lapis.printer import ContentAttributeFormatter
+        from lapis.store import AttributeCount
+        self.assertEqual("[3] water", str(ContentAttributeFormatter(AttributeCount("water", 3))))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestReaders(unittest.TestCase):
+    """tests that the metadata readers produce the same metadata as pelican"""
+
+    def setUp(self):
+        from pelican.settings import read_settings
+        pelican_config = os.path.join(os.path.dirname(__file__), "samplesite", "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": os.path.abspath(os.curdir)})
+        self.tempd_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempd_path)
+
+    def write(self, name, text):
+        path = os.path.join(self.tempd_path, name)
+        with open(path, "wt", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def summarize(self, content):
+        return (content.title, content.date, content.status, content.author.name,
+                content.category.name, sorted(tag.name for tag in getattr(content, "tags", [])))
+
+    def assertSameAsPelican(self, path):
+        from pelican.readers import Readers as PelicanReaders
+        from pelican.contents import Article
+        from lapis.readers import Readers
+        readers = Readers(self.settings)
+        self.assertIsNotNone(readers.read_metadata(self.settings['PATH'], path))
+        expected = PelicanReaders(self.settings).read_file(base_path=self.settings['PATH'], path=path, content_class=Article)
+        actual = readers.read_file(base_path=self.settings['PATH'], path=path, content_class=Article)
+        self.assertEqual(self.summarize(expected), self.summarize(actual))
+
+    def test_markdown_samplesite(self):
+        posts = os.path.join(self.settings['PATH'], "posts", "2014")
+        for path in (os.path.join(posts, "03", "foo.md"), os.path.join(posts, "03", "foo_draft.md"), os.path.join(posts, "09", "bar.md")):
+            self.assertSameAsPelican(path)
+
+    def test_markdown_continuation(self):
+        path = self.write("continued.md", "---\nTitle: Continued\nDate: 2015-01-01 10:00\nTags: one,\n    two\nAuthor: Someone\n---\n\nbody\n")
+        self.assertSameAsPelican(path)
+
+    def test_rst_written_by_lapis(self):
+        for name in ("expected-article", "expected-draft-article"):
+            path = os.path.join(self.tempd_path, name + ".rst")
+            shutil.copyfile(os.path.join(os.path.dirname(__file__), "data", name + ".restructuredtext"), path)
+            self.assertSameAsPelican(path)
+
+    def test_rst_overline(self):
+        path = self.write("overline.rst", "=====\nTitle\n=====\n\n:date: 2015-01-01 10:00\n:authors: First; Second\n:category: Cat\n:tags: a, b\n\nParagraph\n\nSection\n-------\n\nText\n")
+        self.assertSameAsPelican(path)
+
+    def test_rst_fallback(self):
+        from lapis.readers import Readers
+        readers = Readers(self.settings)
+        markup = self.write("markup.rst", "A *Title*\n#########\n\n:date: 2015-01-01 10:00\n\nText\n")
+        self.assertIsNone(readers.read_metadata(self.settings['PATH'], markup))
+        sections = self.write("sections.rst", "First\n#####\n\n:date: 2015-01-01 10:00\n\nSecond\n######\n\nText\n")
+        self.assertIsNone(readers.read_metadata(self.settings['PATH'], sections))
+
+    def test_unsupported_format(self):
+        from lapis.readers import Readers
+        readers = Readers(self.settings)
+        path = self.write("page.html", "<html><head><title>Page</title></head><body></body></html>")
+        self.assertIsNone(readers.read_metadata(self.settings['PATH'], path))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import unittest
+
+
+class TestContentScanner(unittest.TestCase):
+    """tests that content is discovered and classified like the pelican generators"""
+
+    def setUp(self):
+        from pelican.settings import read_settings
+        from lapis.scanner import ContentScanner
+        pelican_config = os.path.join(os.path.dirname(__file__), "samplesite", "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": os.path.abspath(os.curdir)})
+        self.scanner = ContentScanner(self.settings)
+
+    def content_path(self, *parts):
+        return os.path.join(self.settings['PATH'], *parts)
+
+    def test_scan(self):
+        found = {source_path: content_type for source_path, content_type, stat in self.scanner.scan()}
+        self.assertEqual(5, len(found))
+        self.assertEqual("page", found[self.content_path("pages", "about.md")])
+        self.assertEqual("article", found[self.content_path("posts", "2014", "03", "foo.md")])
+
+    def test_content_type(self):
+        self.assertEqual("page", self.scanner.content_type(self.content_path("pages", "about.md")))
+        self.assertEqual("article", self.scanner.content_type(self.content_path("posts", "2014", "03", "foo.md")))
+        self.assertEqual("article", self.scanner.content_type(self.content_path("posts", "new.rst")))
+
+    def test_content_type_ignored(self):
+        self.assertIsNone(self.scanner.content_type(self.content_path("posts", "notes.txt")))
+        self.assertIsNone(self.scanner.content_type(self.content_path("posts", ".#foo.md")))
+        self.assertIsNone(self.scanner.content_type(os.path.join(os.path.dirname(self.settings['PATH']), "outside.md")))
@@ -3,6 +3,7 @@
 
 import tempfile
 import os
+import shutil
 import unittest
 from lapis.store import Store
 
@@ -27,6 +28,8 @@ class TestStore(unittest.TestCase):
 
     def tearDown(self):
         self.__sqlite_file.close()
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
 
     def test_store_delete(self):
         """tests that the session closes with no errors"""
@@ -92,6 +95,10 @@ class TestStoreFile(unittest.TestCase):
         self.__pelican_config = os.path.join(os.path.dirname(__file__), "samplesite", "pelicanconf.py")
         self.settings = read_settings(self.__pelican_config, override={"SITEURL": os.path.abspath(os.curdir)})
 
+    def tearDown(self):
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
+
     def test_article(self):
         self.assertEqual(0, len(list(self.__store.search(content_type="article"))))
         article_path = os.path.join(os.path.dirname(__file__), "samplesite", "content", "posts", "2014", "03", "foo.md")
@@ -123,7 +130,8 @@ class TestStoreFromDisk(unittest.TestCase):
         self.__store.sync(settings)
 
     def tearDown(self):
-        pass
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
 
     def test_search_status(self):
         self.assertEqual(2, len(list(self.__store.search(content_type="article", status="published"))))
@@ -147,3 +155,617 @@ class TestStoreFromDisk(unittest.TestCase):
         dates = (datetime.strptime("20140309", fmt), datetime.strptime("20141212", fmt), )
         self.assertEqual(2, len(list(self.__store.search(dates=dates, content_type="article"))))
         self.assertEqual(1, len(list(self.__store.search(dates=dates, content_type="page"))))
+
+    def test_search_date_boundaries(self):
+        from datetime import datetime
+        # the day after a content was created does not include it, whatever its time
+        self.assertEqual(0, len(list(self.__store.search(dates=(datetime(2014, 3, 10), )))))
+        self.assertEqual(1, len(list(self.__store.search(dates=(datetime(2014, 3, 9, 23, 59), )))))
+        self.assertEqual(1, len(list(self.__store.search(dates=(None, datetime(2014, 3, 9, 8)), content_type="article", status="published"))))
+
+    def test_archive(self):
+        from datetime import datetime
+        from lapis.store import ArchiveCount
+        self.assertEqual([ArchiveCount(2014, 9, 1), ArchiveCount(2014, 3, 2), ArchiveCount(2014, 1, 1), ArchiveCount(2013, 3, 1)], self.__store.archive())
+        self.assertEqual([ArchiveCount(2014, None, 4), ArchiveCount(2013, None, 1)], self.__store.archive(by="year"))
+        self.assertEqual([ArchiveCount(2014, None, 2)], self.__store.archive(by="year", content_type="article", status="published"))
+        self.assertEqual([ArchiveCount(2014, 9, 1)], self.__store.archive(tags=["water"], dates=(datetime(2014, 6, 1), None)))
+        self.assertEqual([], self.__store.archive(tags=["missing"]))
+        with self.assertRaises(ValueError):
+            self.__store.archive(by="week")
+
+    def test_filters_without_json(self):
+        """the filters give the same results when sqlite has no json1 for the posting lists"""
+        filters = [dict(tags=["water"]), dict(tags=["water", "bird"]), dict(any_tags=["bird", "ocean"]), dict(category="Photography"),
+                   dict(author="Daniel DeSousa"), dict(content_type="article", status="published"), dict(tags=["missing"])]
+        expected = [[content.source_path for content in self.__store.search(**kwargs)] for kwargs in filters]
+        self.__store._Store__json = False
+        self.assertEqual(expected, [[content.source_path for content in self.__store.search(**kwargs)] for kwargs in filters])
+
+    def test_filter_paths(self):
+        """tags use the posting lists, other filters the indexes"""
+        from unittest import mock
+
+        def uses_postings(**kwargs):
+            return "json_each" in self.__store.explain(**kwargs).sql
+
+        self.assertTrue(uses_postings(content_type="article", tags=["water"]))
+        self.assertTrue(uses_postings(content_type="article", any_tags=["bird", "ocean"]))
+        plan = self.__store.explain(content_type="article", status="published", limit=1)
+        self.assertNotIn("json_each", plan.sql)
+        self.assertEqual(["SEARCH content USING INDEX ix_content_type_status_date_created (type=? AND status=?)"],
+                         [detail for node, parent, detail in plan.plan if "content USING" in detail])
+        self.assertFalse(any("TEMP B-TREE" in detail for node, parent, detail in plan.plan))
+        self.assertFalse(uses_postings(content_type="article", category="Photography"))
+        self.assertFalse(uses_postings(author="Daniel DeSousa"))
+
+        # the posting lists are not built for filters without tags
+        with mock.patch.object(self.__store, "postings", side_effect=AssertionError("postings were built")):
+            self.assertEqual(1, len(list(self.__store.search(content_type="article", status="draft"))))
+            self.assertEqual(2, len(list(self.__store.search(category="Photography"))))
+
+    def test_explain(self):
+        from datetime import datetime
+        plan = self.__store.explain(dates=(datetime(2014, 1, 1), None), projection=True)
+        self.assertEqual(4, plan.rows)
+        self.assertTrue(plan.sql.startswith("SELECT"))
+        self.assertTrue(any("ix_content_date_created" in detail for node, parent, detail in plan.plan))
+        self.assertEqual(4, len(list(self.__store.search(dates=(datetime(2014, 1, 1), None)))))
+        plan = self.__store.explain(tags=["missing"])
+        self.assertEqual((None, 0), (plan.sql, plan.rows))
+
+    def test_limit_offset(self):
+        everything = [content.source_path for content in self.__store.search()]
+        self.assertEqual(everything[:2], [content.source_path for content in self.__store.search(limit=2)])
+        self.assertEqual(everything[2:4], [content.source_path for content in self.__store.search(limit=2, offset=2)])
+        self.assertEqual(everything[4:], [content.source_path for content in self.__store.search(offset=4)])
+
+    def test_sort(self):
+        from lapis.store import fold
+        dates = [content.date_created for content in self.__store.search(projection=True)]
+        self.assertEqual(sorted(dates, reverse=True), dates)
+        titles = [fold(content.title) for content in self.__store.search(sort="title", projection=True)]
+        self.assertEqual(sorted(titles), titles)
+        modified = [content.date_modified for content in self.__store.search(sort="modified")]
+        self.assertEqual(sorted(modified, reverse=True), modified)
+        with self.assertRaises(ValueError):
+            list(self.__store.search(sort="size"))
+
+    def test_cursor(self):
+        """paging with cursors returns every result once, in order, including results without a sort key"""
+        from lapis.models import Content
+        from lapis.store import cursor_for
+        self.__store.get_or_create(Content, source_path="/undated-1", title=None, type="page")
+        self.__store.get_or_create(Content, source_path="/undated-2", title=None, type="page")
+        for sort in ("date", "modified", "title"):
+            for projection in (True, False):
+                everything = [content.source_path for content in self.__store.search(sort=sort, projection=projection)]
+                self.assertEqual(7, len(everything))
+                paged = []
+                cursor = None
+                while True:
+                    page = list(self.__store.search(sort=sort, cursor=cursor, limit=2, projection=projection))
+                    paged.extend(content.source_path for content in page)
+                    if len(page) < 2:
+                        break
+                    cursor = cursor_for(page[-1], sort)
+                self.assertEqual(everything, paged)
+
+    def test_invalid_cursor(self):
+        from lapis.store import cursor_for
+        with self.assertRaises(ValueError):
+            list(self.__store.search(cursor="garbage"))
+        cursor = cursor_for(next(self.__store.search()), "date")
+        with self.assertRaises(ValueError):
+            list(self.__store.search(cursor=cursor, sort="title"))
+
+    def test_projection(self):
+        from lapis.store import ContentRow
+        for kwargs in ({}, {"content_type": "article", "tags": ["water"]}, {"title": "foo"}, {"status": "hidden"}):
+            contents = list(self.__store.search(**kwargs))
+            rows = list(self.__store.search(projection=True, **kwargs))
+            self.assertTrue(all(isinstance(row, ContentRow) for row in rows))
+            self.assertEqual([content.source_path for content in contents], [row.source_path for row in rows])
+            for content, row in zip(contents, rows):
+                self.assertEqual((content.id, content.title, content.type, content.status, content.date_created), (row.id, row.title, row.type, row.status, row.date_created))
+                self.assertEqual(content.author.name if content.author else None, row.author)
+                self.assertEqual(content.category.name if content.category else None, row.category)
+                self.assertEqual(tuple(sorted(tag.name for tag in content.tags)), row.tags)
+
+    def test_counts(self):
+        from lapis.models import Tag, Author, Category
+        self.assertEqual([("photography", 2), ("water", 2), ("bird", 1)], list(self.__store.counts("^(photo|water|bird)", order_by="content", cls=Tag)))
+        self.assertEqual([("water", 2), ("photography", 2)], list(self.__store.counts("^(photo|water)", cls=Tag, reverse=True)))
+        self.assertEqual(["Photography", "pages", ""], [item.name for item in self.__store.counts("", order_by="content", cls=Category)])
+        self.assertEqual(5, sum(item.count for item in self.__store.counts("", cls=Author)))
+
+    def test_counts_zero(self):
+        from lapis.models import Tag
+        self.__store.get_or_create(Tag, name="unused")
+        self.assertEqual([], list(self.__store.counts("unused", cls=Tag)))
+        self.assertEqual([("unused", 0)], list(self.__store.counts("unused", cls=Tag, show_zero=True)))
+        self.assertEqual(["unused"], [tag.name for tag in self.__store.list("unused", cls=Tag)])
+
+
+class TestStoreIncrementalSync(unittest.TestCase):
+    """tests that sync only reads the files which changed since the last sync"""
+
+    def setUp(self):
+        import shutil
+        from pelican.settings import read_settings
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.site_path = os.path.join(self.__tmp_dir, "samplesite")
+        shutil.copytree(os.path.join(os.path.dirname(__file__), "samplesite"), self.site_path)
+        self.__sqlite_file = tempfile.NamedTemporaryFile()
+        self.store = Store(self.__sqlite_file.name)
+        pelican_config = os.path.join(self.site_path, "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": self.site_path})
+        self.assertTrue(self.store.sync(self.settings))
+
+    def tearDown(self):
+        import shutil
+        self.__sqlite_file.close()
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
+        shutil.rmtree(self.__tmp_dir)
+
+    def article_path(self, *parts):
+        return os.path.join(self.settings['PATH'], "posts", *parts)
+
+    def test_noop_sync(self):
+        self.assertFalse(self.store.sync(self.settings))
+        self.assertEqual(5, len(list(self.store.search())))
+
+    def test_changed_file(self):
+        path = self.article_path("2014", "03", "foo.md")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\nmore text\n")
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text.replace("Title: Foo", "Title: Changed Foo"))
+        self.assertTrue(self.store.sync(self.settings))
+        self.assertEqual(1, len(list(self.store.search(title="changed"))))
+        self.assertEqual(5, len(list(self.store.search())))
+
+    def test_changed_tags(self):
+        from lapis.models import Tag
+        path = self.article_path("2014", "03", "foo.md")
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text.replace("Tags: photography, bird, crane, water", "Tags: photography, sky"))
+        self.assertTrue(self.store.sync(self.settings))
+        self.assertEqual(0, len(list(self.store.search(tags=["bird"]))))
+        self.assertEqual(1, len(list(self.store.search(tags=["sky", "photography"]))))
+        self.assertEqual(1, len(list(self.store.list("^photography$", cls=Tag))))
+
+    def test_added_file(self):
+        with open(self.article_path("2014", "09", "baz.md"), "w", encoding="utf-8") as f:
+            f.write("Title: Baz\nDate: 2014-09-10 10:00\nCategory: Photography\n\nBaz\n")
+        self.assertTrue(self.store.sync(self.settings))
+        self.assertEqual(4, len(list(self.store.search(content_type="article"))))
+
+    def test_removed_file(self):
+        os.remove(self.article_path("2014", "09", "bar.md"))
+        self.assertTrue(self.store.sync(self.settings))
+        self.assertEqual(2, len(list(self.store.search(content_type="article"))))
+        self.assertFalse(self.store.sync(self.settings))
+
+    def test_remove(self):
+        self.store.remove([self.article_path("2014", "09", "bar.md")])
+        self.assertEqual(2, len(list(self.store.search(content_type="article"))))
+        # the fingerprint is forgotten, so the next sync reads the file again
+        self.assertTrue(self.store.sync(self.settings))
+        self.assertEqual(3, len(list(self.store.search(content_type="article"))))
+
+    def test_purge_root(self):
+        os.remove(self.article_path("2014", "09", "bar.md"))
+        self.store.purge(root=self.settings['PATH'])
+        self.assertEqual(2, len(list(self.store.search(content_type="article"))))
+        self.store.purge(root=self.settings['PATH'])
+        self.assertEqual(4, len(list(self.store.search())))
+
+    def test_parallel_sync(self):
+        from lapis.models import Tag
+        with open(self.article_path("2014", "09", "baz.md"), "w", encoding="utf-8") as f:
+            f.write("Title: Baz\nDate: 2014-09-10 10:00\nCategory: Photography\nTags: water, sky\n\nBaz\n")
+        os.utime(self.article_path("2014", "03", "foo.md"), (0, 0))
+        self.assertTrue(self.store.sync(self.settings, jobs=2))
+        self.assertEqual(4, len(list(self.store.search(content_type="article"))))
+        self.assertEqual(3, len(list(self.store.search(tags=["water"]))))
+        self.assertEqual(1, len(list(self.store.list("^sky$", cls=Tag))))
+
+    def test_chunked_sync(self):
+        """the files are read in one pass, and written and committed a chunk at a time"""
+        from unittest import mock
+        import lapis.readers
+        for i in range(5):
+            with open(self.article_path("2014", "09", "baz{}.md".format(i)), "w", encoding="utf-8") as f:
+                f.write("Title: Baz {}\nDate: 2014-09-10 10:00\nTags: sky\n\nBaz\n".format(i))
+        session = self.store._Store__session
+        with mock.patch("lapis.store.SYNC_CHUNK_SIZE", 2), \
+                mock.patch.object(lapis.readers, "read_records", wraps=lapis.readers.read_records) as read_records, \
+                mock.patch.object(session, "commit", wraps=session.commit) as commit:
+            self.assertTrue(self.store.sync(self.settings, jobs=2))
+        self.assertEqual([5], [len(call[0][1]) for call in read_records.call_args_list])
+        # the progress when the sync starts, a checkpoint for each chunk, and the end of the sync
+        self.assertEqual(5, commit.call_count)
+        self.assertEqual(5, len(list(self.store.search(tags=["sky"]))))
+        self.assertFalse(self.store.interrupted)
+        self.assertFalse(self.store.sync(self.settings))
+
+    def test_interrupted_sync(self):
+        from unittest import mock
+        import lapis.readers
+        for i in range(5):
+            with open(self.article_path("2014", "09", "baz{}.md".format(i)), "w", encoding="utf-8") as f:
+                f.write("Title: Baz {}\nDate: 2014-09-10 10:00\nTags: sky\n\nBaz\n".format(i))
+        read_records = lapis.readers.read_records
+        read = []
+
+        def interrupted(context, files, **kwargs):
+            # stops after the first two chunks were read
+            read.extend(files)
+            for i, result in enumerate(read_records(context, files, **kwargs)):
+                if i == 4:
+                    raise KeyboardInterrupt()
+                yield result
+
+        with mock.patch("lapis.store.SYNC_CHUNK_SIZE", 2), mock.patch.object(lapis.readers, "read_records", side_effect=interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.store.sync(self.settings)
+
+        # the chunks committed before the interruption are kept
+        self.store = Store(self.__sqlite_file.name)
+        self.assertTrue(self.store.interrupted)
+        self.assertEqual((4, 1), (self.store.site.sync_done, self.store.site.sync_remaining))
+        self.assertEqual(4, len(list(self.store.search(tags=["sky"]))))
+
+        with mock.patch.object(lapis.readers, "read_records", wraps=read_records) as resumed, \
+                self.assertLogs("lapis.store", level="WARNING") as logs:
+            self.assertTrue(self.store.sync(self.settings))
+        self.assertEqual([read[4:]], [call[0][1] for call in resumed.call_args_list])
+        self.assertIn("4 files were already synced and 1 remain", logs.output[0])
+        self.assertFalse(self.store.interrupted)
+        self.assertEqual(5, len(list(self.store.search(tags=["sky"]))))
+
+    def test_changed_settings(self):
+        from unittest import mock
+        import lapis.readers
+        settings = dict(self.settings, DEFAULT_CATEGORY="elsewhere")
+        with mock.patch.object(lapis.readers, "read_records", wraps=lapis.readers.read_records) as read:
+            self.assertTrue(self.store.sync(settings))
+        self.assertEqual(5, len(read.call_args[0][1]))
+        self.assertFalse(self.store.sync(settings))
+
+        # a new version of lapis reads every file again too
+        with mock.patch("lapis.store.version", "0.0.0"), \
+                mock.patch.object(lapis.readers, "read_records", wraps=lapis.readers.read_records) as read:
+            self.store.sync(settings)
+        self.assertEqual(5, len(read.call_args[0][1]))
+
+    def test_sync_owner(self):
+        import socket
+        import subprocess
+        site = self.store.site
+        process = subprocess.Popen(["sleep", "30"])
+        try:
+            site.sync_done, site.sync_remaining = 2, 3
+            site.sync_owner = "{}:{}".format(socket.gethostname(), process.pid)
+            self.store._Store__session.commit()
+            # the process that owns the sync is running
+            self.assertTrue(self.store.syncing)
+            self.assertFalse(self.store.interrupted)
+        finally:
+            process.kill()
+            process.wait()
+        self.assertFalse(self.store.syncing)
+        self.assertTrue(self.store.interrupted)
+
+    def test_progress_changed_by_another_process(self):
+        from unittest import mock
+        import sqlite3
+        import lapis.readers
+        for i in range(5):
+            with open(self.article_path("2014", "09", "baz{}.md".format(i)), "w", encoding="utf-8") as f:
+                f.write("Title: Baz {}\nDate: 2014-09-10 10:00\nTags: sky\n\nBaz\n".format(i))
+        read_records = lapis.readers.read_records
+
+        def cleared(context, files, **kwargs):
+            # another process clears the progress after the first chunk
+            for i, result in enumerate(read_records(context, files, **kwargs)):
+                if i == 3:
+                    with sqlite3.connect(self.__sqlite_file.name) as connection:
+                        connection.execute("UPDATE site SET sync_done = NULL, sync_remaining = NULL, sync_owner = NULL")
+                yield result
+
+        with mock.patch("lapis.store.SYNC_CHUNK_SIZE", 2), mock.patch.object(lapis.readers, "read_records", side_effect=cleared):
+            self.assertTrue(self.store.sync(self.settings))
+        self.assertFalse(self.store.interrupted)
+        self.assertEqual(5, len(list(self.store.search(tags=["sky"]))))
+
+    def test_timings(self):
+        from lapis.store import TimingCollector
+        with open(self.article_path("2014", "09", "baz.md"), "w", encoding="utf-8") as f:
+            f.write("Title: Baz\nDate: 2014-09-10 10:00\nCategory: Photography\n\nBaz\n")
+        collector = TimingCollector().install()
+        try:
+            self.store.sync(self.settings)
+        finally:
+            collector.uninstall()
+        phases = {timing.phase: timing for timing in collector.phases()}
+        self.assertEqual(["context", "scan", "parse", "write", "purge"], list(phases))
+        self.assertEqual(1, phases["parse"].calls)
+        self.assertEqual([self.article_path("2014", "09", "baz.md")], [source_path for seconds, phase, source_path in collector.slowest()])
+        # nothing is collected once the collector is uninstalled
+        self.store.sync(self.settings)
+        self.assertEqual(1, collector.phases()[0].calls)
+
+    def test_sync_files(self):
+        foo = self.article_path("2014", "03", "foo.md")
+        baz = self.article_path("2014", "09", "baz.md")
+        with open(baz, "w", encoding="utf-8") as f:
+            f.write("Title: Baz\nDate: 2014-09-10 10:00\nCategory: Photography\n\nBaz\n")
+        os.remove(self.article_path("2014", "09", "bar.md"))
+        with open(foo, "r", encoding="utf-8") as f:
+            text = f.read()
+        with open(foo, "w", encoding="utf-8") as f:
+            f.write(text.replace("Title: Foo", "Title: Changed Foo"))
+
+        # only the given files are read, files outside the content are ignored
+        self.assertTrue(self.store.sync_files(self.settings, [baz, self.article_path("2014", "09", "bar.md"), os.path.join(self.site_path, "pelicanconf.py")]))
+        self.assertEqual(["Baz", "Foo", "Foo"], sorted(content.title for content in self.store.search(content_type="article")))
+        self.assertTrue(self.store.sync(self.settings, file=os.path.relpath(foo)))
+        self.assertEqual(1, len(list(self.store.search(title="changed"))))
+
+        # the fingerprints of the files are saved, a full sync has nothing left to do
+        self.assertFalse(self.store.sync(self.settings))
+
+    def test_sync_directory(self):
+        baz = self.article_path("2014", "09", "baz.md")
+        with open(baz, "w", encoding="utf-8") as f:
+            f.write("Title: Baz\nDate: 2014-09-10 10:00\nCategory: Photography\n\nBaz\n")
+        os.remove(self.article_path("2014", "09", "bar.md"))
+        with open(self.article_path("2014", "09", "notes.txt"), "w", encoding="utf-8") as f:
+            f.write("not content\n")
+        os.remove(self.article_path("2014", "03", "foo.md"))
+
+        # only the content beneath the directory is synced
+        self.assertTrue(self.store.sync_files(self.settings, [self.article_path("2014", "09")]))
+        self.assertEqual(["Baz", "Foo", "Foo"], sorted(content.title for content in self.store.search(content_type="article")))
+
+        # the content of a deleted directory is removed
+        shutil.rmtree(self.article_path("2014", "09"))
+        self.assertTrue(self.store.sync_files(self.settings, [self.article_path("2014", "09")]))
+        self.assertEqual(["Foo", "Foo"], sorted(content.title for content in self.store.search(content_type="article")))
+
+    def test_checksum_touched_file(self):
+        path = self.article_path("2014", "03", "foo.md")
+        stat = os.stat(path)
+        # the first touch has no recorded hash to compare against
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertTrue(self.store.sync(self.settings, checksum=True))
+        os.utime(path, (stat.st_atime, stat.st_mtime + 20))
+        self.assertFalse(self.store.sync(self.settings, checksum=True))
+
+
+@unittest.skipIf(shutil.which("git") is None, "git is not installed")
+class TestStoreGitSync(unittest.TestCase):
+    """tests that a sync with git only compares the files git reports as changed"""
+
+    def setUp(self):
+        from pelican.settings import read_settings
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.site_path = os.path.join(self.__tmp_dir, "samplesite")
+        shutil.copytree(os.path.join(os.path.dirname(__file__), "samplesite"), self.site_path)
+        self.git("init", "-q")
+        self.git("add", "content")
+        self.git("commit", "-q", "-m", "content")
+        self.__sqlite_file = tempfile.NamedTemporaryFile()
+        self.store = Store(self.__sqlite_file.name)
+        pelican_config = os.path.join(self.site_path, "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": self.site_path})
+        self.assertTrue(self.store.sync(self.settings, git=True))
+
+    def tearDown(self):
+        self.__sqlite_file.close()
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
+        shutil.rmtree(self.__tmp_dir)
+
+    def git(self, *args):
+        import subprocess
+        subprocess.check_call(("git", "-c", "user.name=lapis", "-c", "user.email=lapis@example.com") + args, cwd=self.site_path)
+
+    def article_path(self, *parts):
+        return os.path.join(self.settings['PATH'], "posts", *parts)
+
+    def sync(self):
+        """syncs with git, failing if the content directory is walked"""
+        from unittest import mock
+        from lapis.scanner import ContentScanner
+        with mock.patch.object(ContentScanner, "scan", side_effect=AssertionError("the content directory was walked")):
+            return self.store.sync(self.settings, git=True)
+
+    def test_recorded_state(self):
+        self.assertEqual(40, len(self.store.site.git_commit))
+        self.assertEqual("[]", self.store.site.git_dirty)
+        self.assertFalse(self.sync())
+
+    def test_dirty_files(self):
+        foo = self.article_path("2014", "03", "foo.md")
+        with open(foo, "a", encoding="utf-8") as f:
+            f.write("\nmore text\n")
+        with open(self.article_path("2014", "09", "baz.md"), "w", encoding="utf-8") as f:
+            f.write("Title: Baz\nDate: 2014-09-10 10:00\nCategory: Photography\n\nBaz\n")
+        os.remove(self.article_path("2014", "09", "bar.md"))
+        self.assertTrue(self.sync())
+        self.assertEqual(["Baz", "Foo", "Foo"], sorted(content.title for content in self.store.search(content_type="article")))
+        self.assertFalse(self.sync())
+
+        # files which were dirty during the last sync are compared again after a checkout
+        self.git("checkout", "-q", "--", ".")
+        self.assertTrue(self.sync())
+        self.assertEqual(["Bar", "Baz", "Foo", "Foo"], sorted(content.title for content in self.store.search(content_type="article")))
+
+    def test_ignored_files(self):
+        with open(os.path.join(self.site_path, ".gitignore"), "w", encoding="utf-8") as f:
+            f.write("baz.md\n")
+        baz = self.article_path("2014", "09", "baz.md")
+        with open(baz, "w", encoding="utf-8") as f:
+            f.write("Title: Baz\nDate: 2014-09-10 10:00\n\nBaz\n")
+        self.assertTrue(self.sync())
+        self.assertEqual(1, len(list(self.store.search(title="baz"))))
+        self.assertFalse(self.sync())
+
+        with open(baz, "w", encoding="utf-8") as f:
+            f.write("Title: Changed Baz\nDate: 2014-09-10 10:00\n\nBaz\n")
+        self.assertTrue(self.sync())
+        self.assertEqual(1, len(list(self.store.search(title="changed baz"))))
+        os.remove(baz)
+        self.assertTrue(self.sync())
+        self.assertEqual(0, len(list(self.store.search(title="baz"))))
+
+    def test_commits(self):
+        self.git("rm", "-q", self.article_path("2014", "09", "bar.md"))
+        self.git("commit", "-q", "-m", "remove bar")
+        self.assertTrue(self.sync())
+        self.assertEqual(2, len(list(self.store.search(content_type="article"))))
+
+    def test_unknown_commit(self):
+        self.store.site.git_commit = "0" * 40
+        os.remove(self.article_path("2014", "09", "bar.md"))
+        self.assertTrue(self.store.sync(self.settings, git=True))
+        self.assertEqual(2, len(list(self.store.search(content_type="article"))))
+
+    def test_outside_repository(self):
+        shutil.rmtree(os.path.join(self.site_path, ".git"))
+        os.remove(self.article_path("2014", "09", "bar.md"))
+        self.assertTrue(self.store.sync(self.settings, git=True))
+        self.assertEqual(2, len(list(self.store.search(content_type="article"))))
+
+
+class TestStoreFullText(unittest.TestCase):
+    """tests searching the text of the content"""
+
+    def setUp(self):
+        import shutil
+        from pelican.settings import read_settings
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.site_path = os.path.join(self.__tmp_dir, "samplesite")
+        shutil.copytree(os.path.join(os.path.dirname(__file__), "samplesite"), self.site_path)
+        self.__sqlite_file = tempfile.NamedTemporaryFile()
+        self.store = Store(self.__sqlite_file.name)
+        if not self.store.full_text:
+            self.skipTest("sqlite was built without fts5")
+        pelican_config = os.path.join(self.site_path, "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": self.site_path})
+        self.write("heron.md", "Title: Heron\nDate: 2014-09-10 10:00\nCategory: Photography\nSummary: A grey bird\n\nThe heron waited by the marsh for hours.\n")
+        self.write("marsh.md", "Title: Marsh Walks\nDate: 2014-09-11 10:00\nCategory: Photography\n\nWe walked the marsh, see [the map](http://example.com).\n")
+        self.write("marsh.html", "<html><head><title>Tides</title><meta name=\"date\" content=\"2014-09-12 10:00\" /></head><body><p>The marsh &amp; the <em>tides</em>.</p></body></html>")
+        self.store.sync(self.settings)
+
+    def tearDown(self):
+        import shutil
+        self.__sqlite_file.close()
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
+        shutil.rmtree(self.__tmp_dir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.settings['PATH'], "posts", name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_ranked(self):
+        titles = [content.title for content in self.store.search(text="marsh")]
+        self.assertEqual("Marsh Walks", titles[0])
+        self.assertEqual(["Heron", "Marsh Walks", "Tides"], sorted(titles))
+
+    def test_conjunction(self):
+        self.assertEqual(["Heron"], [content.title for content in self.store.search(text="heron marsh")])
+        self.assertEqual(["Heron"], [content.title for content in self.store.search(text="grey")])
+        self.assertEqual([], list(self.store.search(text="heron tides")))
+
+    def test_filters(self):
+        self.assertEqual(["Tides"], [content.title for content in self.store.search(text="marsh", title="tid")])
+        self.assertEqual([], list(self.store.search(text="marsh", content_type="page")))
+
+    def test_snippet(self):
+        from lapis.store import SNIPPET_START, SNIPPET_END
+        content = next(self.store.search(text="waited"))
+        self.assertIn("{}waited{}".format(SNIPPET_START, SNIPPET_END), content.snippet)
+        row = next(self.store.search(text="waited", projection=True))
+        self.assertEqual(("Heron", content.snippet), (row.title, row.snippet))
+        # html read by pelican is indexed as text
+        self.assertEqual([], list(self.store.search(text="amp")))
+        self.assertEqual([], list(self.store.search(text="em")))
+
+    def test_query_syntax(self):
+        self.assertEqual(["Heron"], [content.title for content in self.store.search(text='her* "waited')])
+        self.assertEqual([], list(self.store.search(text="marsh AND NOT(")))
+
+    def test_removed(self):
+        os.remove(os.path.join(self.settings['PATH'], "posts", "heron.md"))
+        self.store.sync(self.settings)
+        self.assertEqual([], list(self.store.search(text="heron")))
+
+
+class TestStoreTitleSearch(unittest.TestCase):
+    """tests the case-insensitive search of titles"""
+
+    def setUp(self):
+        import shutil
+        from pelican.settings import read_settings
+        self.__tmp_dir = tempfile.mkdtemp()
+        self.site_path = os.path.join(self.__tmp_dir, "samplesite")
+        shutil.copytree(os.path.join(os.path.dirname(__file__), "samplesite"), self.site_path)
+        self.sqlite_path = os.path.join(self.__tmp_dir, "lapisdb")
+        self.store = Store(self.sqlite_path)
+        pelican_config = os.path.join(self.site_path, "pelicanconf.py")
+        self.settings = read_settings(pelican_config, override={"SITEURL": self.site_path})
+        for i, title in enumerate(("Über die Straße", "ÉCOLE d'été", "100% Done_Right")):
+            with open(os.path.join(self.settings['PATH'], "posts", "title{}.md".format(i)), "w", encoding="utf-8") as f:
+                f.write("Title: {}\nDate: 2014-09-1{} 10:00\n\nText\n".format(title, i))
+        self.store.sync(self.settings)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.__tmp_dir)
+
+    def titles(self, title):
+        return [content.title for content in self.store.search(title=title)]
+
+    def test_ascii(self):
+        # the published and the draft article
+        self.assertEqual(["Foo", "Foo"], [title.strip() for title in self.titles("FOO")])
+        self.assertEqual(["Foo", "Foo"], [title.strip() for title in self.titles("oo")])
+
+    def test_non_ascii(self):
+        self.assertEqual(["Über die Straße"], self.titles("über"))
+        self.assertEqual(["Über die Straße"], self.titles("STRASSE"))
+        self.assertEqual(["ÉCOLE d'été"], self.titles("école"))
+        self.assertEqual(["ÉCOLE d'été"], self.titles("ÉT"))
+
+    def test_wildcards(self):
+        self.assertEqual(["100% Done_Right"], self.titles("0% d"))
+        self.assertEqual(["100% Done_Right"], self.titles("_r"))
+        self.assertEqual([], self.titles("1%0"))
+
+    def test_added_column(self):
+        """stores created before the folded title are migrated without reading the files"""
+        import sqlite3
+        del self.store
+        connection = sqlite3.connect(self.sqlite_path)
+        connection.execute("DROP INDEX ix_content_title_folded")
+        connection.execute("CREATE TABLE content_copy AS SELECT id, source_path, title, date_created, type, author_id, category_id, status FROM content")
+        connection.execute("DROP TABLE content")
+        connection.execute("ALTER TABLE content_copy RENAME TO content")
+        connection.execute("UPDATE site SET schema_version = NULL")
+        connection.commit()
+        connection.close()
+        self.store = Store(self.sqlite_path)
+        self.assertEqual(["Über die Straße"], self.titles("straße"))
+        # the modification dates are only known once the files are read again
+        self.assertTrue(self.store.sync(self.settings))
+        self.assertEqual(["Über die Straße"], self.titles("straße"))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import shutil
+import tempfile
+import unittest
+from lapis.store import Store
+
+
+class TestWatcher(unittest.TestCase):
+    """tests that watched changes are applied to the store"""
+
+    def setUp(self):
+        from pelican.settings import read_settings
+        from lapis.scanner import ContentScanner
+        self.__tmp_dir = tempfile.mkdtemp()
+        site_path = os.path.join(self.__tmp_dir, "samplesite")
+        shutil.copytree(os.path.join(os.path.dirname(__file__), "samplesite"), site_path)
+        self.__sqlite_file = tempfile.NamedTemporaryFile()
+        self.store = Store(self.__sqlite_file.name)
+        self.settings = read_settings(os.path.join(site_path, "pelicanconf.py"), override={"SITEURL": site_path})
+        self.store.sync(self.settings)
+        self.scanner = ContentScanner(self.settings)
+        self.new_path = os.path.join(self.settings['PATH'], "posts", "2014", "09", "baz.md")
+
+    def tearDown(self):
+        self.__sqlite_file.close()
+        if os.path.exists(self.__sqlite_file.name + ".postings"):
+            os.remove(self.__sqlite_file.name + ".postings")
+        shutil.rmtree(self.__tmp_dir)
+
+    def write_new_article(self):
+        with open(self.new_path, "w", encoding="utf-8") as f:
+            f.write("Title: Baz\nDate: 2014-09-10 10:00\nCategory: Photography\n\nBaz\n")
+
+    def test_apply(self):
+        from lapis.watcher import IndexWatcher, PollingWatcher
+        index_watcher = IndexWatcher(self.store, self.settings, watcher=PollingWatcher(self.scanner))
+        self.write_new_article()
+        index_watcher.apply({self.new_path: False, os.path.join(self.settings['PATH'], "notes.txt"): False})
+        self.assertEqual(4, len(list(self.store.search(content_type="article"))))
+
+        os.remove(self.new_path)
+        index_watcher.apply({self.new_path: False})
+        self.assertEqual(3, len(list(self.store.search(content_type="article"))))
+
+    def test_apply_directory(self):
+        from lapis.watcher import IndexWatcher, PollingWatcher
+        index_watcher = IndexWatcher(self.store, self.settings, watcher=PollingWatcher(self.scanner))
+        shutil.rmtree(os.path.join(self.settings['PATH'], "posts", "2014", "03"))
+        index_watcher.apply({os.path.join(self.settings['PATH'], "posts", "2014", "03"): True})
+        self.assertEqual(1, len(list(self.store.search(content_type="article"))))
+
+    def test_apply_directory_sync_options(self):
+        from unittest import mock
+        from lapis.watcher import IndexWatcher, PollingWatcher
+        index_watcher = IndexWatcher(self.store, self.settings, watcher=PollingWatcher(self.scanner), jobs=2, git=True)
+        with mock.patch.object(self.store, "sync") as sync:
+            index_watcher.apply({os.path.join(self.settings['PATH'], "posts"): True})
+        sync.assert_called_once_with(self.settings, jobs=2, git=True)
+
+    def test_polling_watcher(self):
+        from lapis.watcher import PollingWatcher
+        watcher = PollingWatcher(self.scanner, interval=0)
+        self.assertEqual([], watcher.read(0))
+        self.write_new_article()
+        self.assertEqual([(self.new_path, False)], watcher.read(0))
+
+    def test_inotify_watcher(self):
+        from lapis.watcher import InotifyWatcher
+        try:
+            watcher = InotifyWatcher(self.settings['PATH'])
+        except OSError:
+            self.skipTest("inotify is not available")
+        self.write_new_article()
+        changes = []
+        for i in range(10):
+            changes.extend(watcher.read(0.1))
+        watcher.close()
+        self.assertIn((self.new_path, False), changes)
+
+    def test_run_debounces(self):
+        from lapis.watcher import IndexWatcher
+
+        class ScriptedWatcher(object):
+            def __init__(self, script):
+                self.script = list(script)
+
+            def read(self, timeout):
+                return self.script.pop(0) if self.script else []
+
+            def close(self):
+                pass
+
+        self.write_new_article()
+        watcher = ScriptedWatcher([[(self.new_path, False)], [(self.new_path, False)], []])
+        index_watcher = IndexWatcher(self.store, self.settings, watcher=watcher, debounce=0.01)
+        index_watcher.run(stop=lambda: not watcher.script)
+        self.assertEqual(4, len(list(self.store.search(content_type="article"))))